@@ -1,9 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import re
 
-from app.core.dependencies import get_current_user, get_db
-from app.core.security import create_access_token, get_password_hash, verify_password
+from app.core.dependencies import get_current_user, get_db, get_read_db
+from app.core.hashing import HashingBusy, password_hasher
+from app.core.cache import invalidates
+from app.core.security import create_access_token, user_claims
+from app.db import reads
+from app.db.writes import update_returning
 from app.models.models import User
 from app.schemas.schemas import (
     PasswordRecovery,
@@ -18,8 +23,32 @@ from app.schemas.schemas import (
 router = APIRouter()
 
 
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in attempts right now, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def _hash_answer(answer: str) -> str:
+    """bcrypt-hash a secret answer on the hashing pool"""
+    try:
+        return await password_hasher.hash(answer)
+    except HashingBusy:
+        raise _hashing_busy()
+
+
+async def _verify_answer(answer: str, hashed_answer: str) -> bool:
+    """Check a secret answer against its bcrypt hash on the hashing pool"""
+    try:
+        return await password_hasher.verify(answer, hashed_answer)
+    except HashingBusy:
+        raise _hashing_busy()
+
+
 @router.post("/signup", response_model=Token, status_code=status.HTTP_201_CREATED)
-async def signup(user_data: UserSignup, db: Session = Depends(get_db)) -> dict:
+async def signup(user_data: UserSignup, db: AsyncSession = Depends(get_db)) -> dict:
     """
     Create a new user account with backend validation.
     
@@ -41,17 +70,19 @@ async def signup(user_data: UserSignup, db: Session = Depends(get_db)) -> dict:
         )
     
     # Check if username already exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
+    existing_user = await db.scalar(select(User).where(User.username == user_data.username))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
+    # Hand the writer connection back while bcrypt runs
+    await db.rollback()
     
     # Create new user with hashed secret answer
     # Secret phrase is stored as plain hint for password recovery
     # Secret answer is hashed for verification during login/recovery
-    hashed_answer = get_password_hash(user_data.secret_answer)
+    hashed_answer = await _hash_answer(user_data.secret_answer)
     new_user = User(
         username=user_data.username,
         name=user_data.name,
@@ -60,18 +91,18 @@ async def signup(user_data: UserSignup, db: Session = Depends(get_db)) -> dict:
         language="EN"  # Default language
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    # id comes back from the INSERT and the defaults are set client-side: no refresh needed
+    await db.commit()
     
     # Generate access token
-    access_token = create_access_token(subject=str(new_user.id))
+    access_token = create_access_token(subject=str(new_user.id), claims=user_claims(new_user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)) -> dict:
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_read_db)) -> dict:
     # Find user by username
-    user = db.query(User).filter(User.username == credentials.username).first()
+    user = await db.scalar(select(User).where(User.username == credentials.username))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -79,21 +110,21 @@ async def login(credentials: UserLogin, db: Session = Depends(get_db)) -> dict:
         )
     
     # Verify secret answer (not phrase!)
-    if not verify_password(credentials.secret_answer, user.secret_answer):
+    if not await _verify_answer(credentials.secret_answer, user.secret_answer):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or secret answer"
         )
     
     # Generate access token
-    access_token = create_access_token(subject=str(user.id))
+    access_token = create_access_token(subject=str(user.id), claims=user_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/recover", response_model=dict)
-async def recover_password(recovery_data: PasswordRecovery, db: Session = Depends(get_db)) -> dict:
+async def recover_password(recovery_data: PasswordRecovery, db: AsyncSession = Depends(get_read_db)) -> dict:
     # Find user by username
-    user = db.query(User).filter(User.username == recovery_data.username).first()
+    user = await db.scalar(select(User).where(User.username == recovery_data.username))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -105,9 +136,9 @@ async def recover_password(recovery_data: PasswordRecovery, db: Session = Depend
 
 
 @router.post("/recover/verify", response_model=Token)
-async def verify_recovery(verify_data: PasswordRecoveryVerify, db: Session = Depends(get_db)) -> dict:
+async def verify_recovery(verify_data: PasswordRecoveryVerify, db: AsyncSession = Depends(get_read_db)) -> dict:
     # Find user by username
-    user = db.query(User).filter(User.username == verify_data.username).first()
+    user = await db.scalar(select(User).where(User.username == verify_data.username))
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -115,14 +146,14 @@ async def verify_recovery(verify_data: PasswordRecoveryVerify, db: Session = Dep
         )
     
     # Verify secret answer
-    if not verify_password(verify_data.secret_answer, user.secret_answer):
+    if not await _verify_answer(verify_data.secret_answer, user.secret_answer):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect answer"
         )
     
     # Generate access token (successful recovery = login)
-    access_token = create_access_token(subject=str(user.id))
+    access_token = create_access_token(subject=str(user.id), claims=user_claims(user))
     return {"access_token": access_token, "token_type": "bearer"}
 
 
@@ -132,25 +163,40 @@ async def get_current_user_info(current_user: User = Depends(get_current_user))
 
 
 @router.patch("/settings", response_model=UserResponse)
+# Drops this user's cached tokens: their old language is caught by the user version check
+@invalidates("user:{current_user.id}")
 async def update_settings(
     settings_data: UserSettingsUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> User:
-    # Update language if provided
-    if settings_data.language:
-        current_user.language = settings_data.language
-    
-    # Update secret phrase and answer if both provided
-    if settings_data.secret_phrase and settings_data.secret_answer:
-        current_user.secret_phrase = settings_data.secret_phrase
-        current_user.secret_answer = get_password_hash(settings_data.secret_answer)
-    elif settings_data.secret_phrase or settings_data.secret_answer:
+    db: AsyncSession = Depends(get_db)
+) -> Row:
+    # Secret phrase and answer must be provided together
+    if bool(settings_data.secret_phrase) != bool(settings_data.secret_answer):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Both secret phrase and answer must be provided together"
         )
+    # Hash before touching the writer so bcrypt never holds the write connection
+    hashed_answer = None
+    if settings_data.secret_answer:
+        hashed_answer = await _hash_answer(settings_data.secret_answer)
+
+    values = {}
+    # Update language if provided
+    if settings_data.language:
+        values["language"] = settings_data.language
     
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    # Update secret phrase and answer if both provided
+    if hashed_answer:
+        values["secret_phrase"] = settings_data.secret_phrase
+        values["secret_answer"] = hashed_answer
+    
+    if not values:
+        user = await reads.user_by_id(db, current_user.id)
+    else:
+        # One UPDATE ... RETURNING the response's columns
+        user = await update_returning(db, User, current_user.id, values, reads.user_records.columns(User))
+        await db.commit()
+    if user is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return user
@@ -2,15 +2,36 @@ from datetime import datetime, timedelta, timezone
 from typing import List, Optional
 import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import get_current_user, get_current_user_optional, get_db
-from app.core.security import decrypt_message, encrypt_message
-from app.models.models import Link, LinkMessage, LinkStatus, MessageStatus, User
+from app.core.cache import response_cache
+from app.core.conditional import PRIVATE, PUBLIC, not_modified
+from app.core.dependencies import get_current_user, get_current_user_optional, get_db, get_read_db
+from app.core.pagination import NEXT_CURSOR_HEADER, page_limit
+from app.core.realtime import HubFull, link_channel, open_stream, push_hub
+from app.core.serialization import json_response
+from app.core.security import (
+    decrypt_batch,
+    decrypted_cache,
+    link_message_cache_key,
+    seal_message,
+)
+from app.db import reads
+from app.db.bulk import DELETE, bulk_mutate
+from app.db.changes import ChangesExpired, read_changes
+from app.db.counters import link_message_counts
+from app.db.database import AsyncReadSessionLocal
+from app.db.expiry import link_expiry
+from app.db.ingest import IngestQueueFull, message_ingestor
+from app.db.writes import delete_returning, update_returning
+from app.db.versions import link_version
+from app.models.models import ChangeOp, ChangeStream, Link, LinkMessage, LinkStatus, MessageStatus, User
 from app.schemas.schemas import (
+    BulkMessageAction,
     LinkCreate,
     LinkResponse,
     LinkPublicInfo,
@@ -33,18 +54,19 @@ EXPIRATION_MAP = {
 }
 
 
-def cleanup_expired_links(db: Session) -> None:
-    """Delete expired links and their messages"""
-    now = datetime.utcnow()
-    expired_links = db.query(Link).filter(
-        Link.expires_at.isnot(None),
-        Link.expires_at <= now,
-        Link.status != LinkStatus.deleted
-    ).all()
-    
-    for link in expired_links:
-        link.status = LinkStatus.deleted
-    db.commit()
+def _link_message_dict(message, content: str) -> dict:
+    """Response body for a link message, with its decrypted content (ORM rows keep the ciphertext)"""
+    return {
+        "id": message.id,
+        "content": content,
+        "status": message.status.value,
+        "created_at": message.created_at,
+    }
+
+
+def is_expired(link) -> bool:
+    """Whether a loaded link (ORM or read row) is past its expiry (the background sweeper retires it for good)"""
+    return link.expires_at is not None and datetime.utcnow() > link.expires_at
 
 
 @router.post("/create", response_model=LinkResponse, status_code=status.HTTP_201_CREATED)
@@ -53,7 +75,7 @@ async def create_link(
     request: Request,
     link_data: LinkCreate,
     current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Link:
     """
     Create a temporary anonymous messaging link.
@@ -80,39 +102,53 @@ async def create_link(
     )
     
     db.add(new_link)
-    db.commit()
-    db.refresh(new_link)
+    # id comes back from the INSERT and created_at is set client-side: no refresh needed
+    await db.commit()
+    link_expiry.schedule(new_link.expires_at)
     
     return new_link
 
 
+def _link_info_ttl(info: dict) -> float:
+    """Cache link info no longer than the link has left to live"""
+    ttl = response_cache.default_ttl
+    if info["expires_at"]:
+        ttl = min(ttl, (datetime.fromisoformat(info["expires_at"]) - datetime.utcnow()).total_seconds())
+    return ttl
+
+
 @router.get("/{public_id}/info", response_model=LinkPublicInfo)
 async def get_link_info(
+    request: Request,
+    response: Response,
     public_id: str,
-    db: Session = Depends(get_db)
-) -> Link:
+    db: AsyncSession = Depends(get_read_db)
+):
     """
     Get public info about a link (name, expiration).
     No authentication required.
     """
-    # Cleanup expired links
-    cleanup_expired_links(db)
-    
-    # Find link
-    link = db.query(Link).filter(Link.public_id == public_id).first()
-    if not link:
-        raise HTTPException(status_code=404, detail="Link not found")
-    
-    # Check if expired
-    if link.expires_at and datetime.utcnow() > link.expires_at:
-        link.status = LinkStatus.deleted
-        db.commit()
-        raise HTTPException(status_code=404, detail="Link expired")
-    
-    if link.status == LinkStatus.deleted:
-        raise HTTPException(status_code=404, detail="Link not found")
-    
-    return link
+    version = await link_version(db, Link.public_id, public_id)
+    if (unchanged := not_modified(request, response, version, PUBLIC, vary=())) is not None:
+        return unchanged
+
+    async def load() -> LinkPublicInfo:
+        # Find link
+        link = await reads.link_by(db, Link.public_id, public_id)
+        if not link:
+            raise HTTPException(status_code=404, detail="Link not found")
+        
+        # Check if expired
+        if is_expired(link):
+            raise HTTPException(status_code=404, detail="Link expired")
+        
+        if link.status == LinkStatus.deleted:
+            raise HTTPException(status_code=404, detail="Link not found")
+        
+        return LinkPublicInfo.model_validate(link)
+
+    key = f"link-info:{public_id}" if version is None else f"link-info:{public_id}@{version[1]}"
+    return await response_cache.get_or_set(key, load, tags=[f"link:{public_id}"], ttl=_link_info_ttl)
 
 
 @router.post("/{public_id}/send", response_model=dict, status_code=status.HTTP_201_CREATED)
@@ -121,67 +157,60 @@ async def send_message_to_link(
     request: Request,
     public_id: str,
     message_data: LinkMessageCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> dict:
     """
     Send an anonymous message to a public link.
     No authentication required.
     """
-    # Cleanup expired links
-    cleanup_expired_links(db)
-    
-    # Find link
-    link = db.query(Link).filter(Link.public_id == public_id).first()
+    # Find link (read-only: the insert itself goes through the ingestion writer)
+    link = await reads.link_by(db, Link.public_id, public_id)
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
     
     # Check if expired
-    if link.expires_at and datetime.utcnow() > link.expires_at:
-        link.status = LinkStatus.deleted
-        db.commit()
+    if is_expired(link):
         raise HTTPException(status_code=404, detail="Link expired")
     
     if link.status == LinkStatus.deleted:
         raise HTTPException(status_code=404, detail="Link not found")
     
     # Encrypt message
-    encrypted_content = encrypt_message(message_data.content)
+    sealed = seal_message(message_data.content)
     
     # Store message
     new_message = LinkMessage(
         link_id=link.id,
-        content=encrypted_content,
+        sealed=sealed,
         status=MessageStatus.inbox
     )
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
-    
+    try:
+        new_message = await message_ingestor.submit(new_message)
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many messages right now, please retry",
+            headers={"Retry-After": "1"},
+        )
+    
+    await push_hub.publish(
+        link_channel(link.id),
+        _link_message_dict(new_message, message_data.content),
+        message_data.content,
+        sealed,
+    )
     return {"message_id": new_message.id, "status": "created"}
 
 
-@router.get("/{private_id}/messages", response_model=LinkMessagesWithMeta)
-async def get_link_messages(
-    private_id: str,
-    current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
-) -> dict:
-    """
-    Get messages sent to a private link, with link metadata for UI countdown.
-    Only accessible with the private link.
-    """
-    # Cleanup expired links
-    cleanup_expired_links(db)
-    
+async def _private_link(db: AsyncSession, private_id: str, current_user: Optional[User]):
+    """The live link row behind a private_id, or the 404/403 its private pages answer with"""
     # Find link by private_id
-    link = db.query(Link).filter(Link.private_id == private_id).first()
+    link = await reads.link_by(db, Link.private_id, private_id)
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
     
     # Check if expired
-    if link.expires_at and datetime.utcnow() > link.expires_at:
-        link.status = LinkStatus.deleted
-        db.commit()
+    if is_expired(link):
         raise HTTPException(status_code=404, detail="Link expired")
     
     if link.status == LinkStatus.deleted:
@@ -191,22 +220,167 @@ async def get_link_messages(
     # If link is for guest, private_id acts as access token
     if link.user_id and current_user and link.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized")
+    return link
+
+
+@router.get("/{private_id}/messages", response_model=LinkMessagesWithMeta)
+async def get_link_messages(
+    request: Request,
+    response: Response,
+    private_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
+    """
+    Get messages sent to a private link, with link metadata for UI countdown.
+    Only accessible with the private link.
+    Newest first, one page at a time: pass the X-Next-Cursor response header back as `after`.
+    Answers If-None-Match with 304 while neither the link nor its messages changed.
+    """
+    # Access first: someone else's link answers 403 even to a client holding its current ETag
+    link = await _private_link(db, private_id, current_user)
+    version = await link_version(db, Link.private_id, private_id)
+    if (unchanged := not_modified(request, response, version, PRIVATE)) is not None:
+        return unchanged
     
-    # Fetch all messages for this link
-    messages = db.query(LinkMessage).filter(
-        LinkMessage.link_id == link.id
-    ).order_by(LinkMessage.created_at.desc()).all()
+    # Fetch one page of messages for this link
+    messages, next_cursor = await reads.link_message_page(db, link.id, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     # Decrypt messages
-    for message in messages:
-        message.content = decrypt_message(message.content)
+    contents = await decrypt_batch(
+        [message.content for message in messages],
+        [link_message_cache_key(message.id) for message in messages]
+    )
     
-    return {
-        "messages": messages,
+    return json_response({
+        "messages": reads.link_message_records.dicts(messages, content=contents),
         "display_name": link.display_name,
         "expires_at": link.expires_at,
         "status": link.status,
-    }
+    }, response)
+
+
+@router.get("/{private_id}/counts", response_model=dict)
+async def get_link_counts(
+    private_id: str,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_read_db)
+) -> dict:
+    """Badge counts for a private link: {"inbox", "public", "favorite", "total"}"""
+    link = await _private_link(db, private_id, current_user)
+    return await link_message_counts(db, link.id)
+
+
+@router.get("/{private_id}/changes", response_model=dict)
+async def get_link_changes(
+    private_id: str,
+    since: Optional[int] = Query(None, ge=0),
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    limit: int = Depends(page_limit),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Delta sync for a private link, same contract as /api/messages/changes:
+    latest state of each message added, moved or deleted after `since`;
+    without `since`, the current next_since; 410 when too far behind.
+    """
+    link = await _private_link(db, private_id, current_user)
+
+    try:
+        page = await read_changes(db, ChangeStream.link_messages, link.id, since, limit)
+    except ChangesExpired:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Too far behind, refetch all messages")
+
+    live_ids = [row_id for _, row_id, op in page.changes if op != ChangeOp.delete]
+    messages = await reads.link_messages_by_id(db, live_ids, link.id)
+    found = list(messages.values())
+    contents = dict(zip(
+        (m.id for m in found),
+        await decrypt_batch([m.content for m in found], [link_message_cache_key(m.id) for m in found])
+    ))
+
+    changes = []
+    for seq, row_id, _ in page.changes:
+        message = messages.get(row_id)
+        changes.append({
+            "seq": seq,
+            "id": row_id,
+            # A row that is gone by now was deleted later, whatever the logged op
+            "op": "upsert" if message else "delete",
+            "message": _link_message_dict(message, contents[row_id]) if message else None,
+        })
+    return {"changes": changes, "next_since": page.next_since, "has_more": page.has_more}
+
+
+@router.get("/{private_id}/stream")
+async def stream_link_messages(private_id: str):
+    """
+    Server-Sent Events for a private link: each new message as a `message`
+    event, `: ping` heartbeats, then `resync` or `reconnect` when the stream
+    ends. The private_id is the credential, as for /messages.
+    """
+    # Own short session: a Depends() session would stay open for the whole stream
+    async with AsyncReadSessionLocal() as db:
+        link = await reads.link_by(db, Link.private_id, private_id)
+    if not link or link.status == LinkStatus.deleted:
+        raise HTTPException(status_code=404, detail="Link not found")
+    if is_expired(link):
+        raise HTTPException(status_code=404, detail="Link expired")
+
+    try:
+        return open_stream(link_channel(link.id))
+    except HubFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams, fall back to polling",
+            headers={"Retry-After": "30"},
+        )
+
+
+def _writable_link_id(private_id: str, current_user: Optional[User]):
+    """
+    Scalar subquery for the id of the link behind private_id, if this caller
+    may change it. A guest link's private_id is its own credential; an owned
+    link also accepts an anonymous caller holding the private_id, but not
+    another user.
+    """
+    query = select(Link.id).where(Link.private_id == private_id)
+    if current_user is not None:
+        query = query.where(or_(Link.user_id.is_(None), Link.user_id == current_user.id))
+    return query.scalar_subquery()
+
+
+async def _link_write_error(db: AsyncSession, private_id: str, current_user: Optional[User]) -> HTTPException:
+    """Why a link message write matched nothing: no link (404), not yours (403), or no such message (404)"""
+    link = await reads.link_by(db, Link.private_id, private_id)
+    if not link:
+        return HTTPException(status_code=404, detail="Link not found")
+    if link.user_id and current_user and link.user_id != current_user.id:
+        return HTTPException(status_code=403, detail="Not authorized")
+    return HTTPException(status_code=404, detail="Message not found")
+
+
+async def _set_link_message_status(db: AsyncSession, private_id: str, message_id: int,
+                                   current_user: Optional[User], new_status: MessageStatus) -> dict:
+    """
+    Move a link message to another section: one UPDATE ... RETURNING with
+    the link's access check as a subquery. The content did not change, so
+    it is decrypted through decrypted_cache (a hit when it was just listed).
+    """
+    message = await update_returning(
+        db, LinkMessage, message_id, {"status": new_status}, reads.link_message_records.columns(LinkMessage),
+        owner=LinkMessage.link_id == _writable_link_id(private_id, current_user)
+    )
+    if message is None:
+        raise await _link_write_error(db, private_id, current_user)
+    await db.commit()
+    
+    content, = await decrypt_batch([message.content], [link_message_cache_key(message.id)])
+    return _link_message_dict(message, content)
 
 
 @router.patch("/{private_id}/messages/{message_id}/make-public", response_model=LinkMessageResponse)
@@ -214,37 +388,12 @@ async def make_link_message_public(
     private_id: str,
     message_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
-) -> LinkMessage:
+    db: AsyncSession = Depends(get_db)
+) -> dict:
     """
     Make a link message public (visible on link display).
     """
-    # Find link
-    link = db.query(Link).filter(Link.private_id == private_id).first()
-    if not link:
-        raise HTTPException(status_code=404, detail="Link not found")
-    
-    # Ownership/access check
-    if link.user_id and current_user and link.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Find message
-    message = db.query(LinkMessage).filter(
-        LinkMessage.id == message_id,
-        LinkMessage.link_id == link.id
-    ).first()
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    # Update status
-    message.status = MessageStatus.public
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    return await _set_link_message_status(db, private_id, message_id, current_user, MessageStatus.public)
 
 
 @router.patch("/{private_id}/messages/{message_id}/make-private", response_model=LinkMessageResponse)
@@ -252,37 +401,12 @@ async def make_link_message_private(
     private_id: str,
     message_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
-) -> LinkMessage:
+    db: AsyncSession = Depends(get_db)
+) -> dict:
     """
     Make a link message private (only visible via private link).
     """
-    # Find link
-    link = db.query(Link).filter(Link.private_id == private_id).first()
-    if not link:
-        raise HTTPException(status_code=404, detail="Link not found")
-    
-    # Ownership/access check
-    if link.user_id and current_user and link.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Find message
-    message = db.query(LinkMessage).filter(
-        LinkMessage.id == message_id,
-        LinkMessage.link_id == link.id
-    ).first()
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    # Update status
-    message.status = MessageStatus.inbox
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    return await _set_link_message_status(db, private_id, message_id, current_user, MessageStatus.inbox)
 
 
 @router.delete("/{private_id}/messages/{message_id}", status_code=status.HTTP_200_OK)
@@ -290,80 +414,95 @@ async def delete_link_message(
     private_id: str,
     message_id: int,
     current_user: Optional[User] = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """
     Soft delete a link message.
     """
-    # Find link
-    link = db.query(Link).filter(Link.private_id == private_id).first()
-    if not link:
-        raise HTTPException(status_code=404, detail="Link not found")
-    
-    # Ownership/access check
-    if link.user_id and current_user and link.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    
-    # Find message
-    message = db.query(LinkMessage).filter(
-        LinkMessage.id == message_id,
-        LinkMessage.link_id == link.id
-    ).first()
-    if not message:
-        raise HTTPException(status_code=404, detail="Message not found")
-    
-    # Delete message from database
-    db.delete(message)
-    db.commit()
+    # Delete message from database: one DELETE, access checked in SQL
+    if not await delete_returning(
+        db, LinkMessage, message_id, owner=LinkMessage.link_id == _writable_link_id(private_id, current_user)
+    ):
+        raise await _link_write_error(db, private_id, current_user)
+    await db.commit()
+    decrypted_cache.invalidate(link_message_cache_key(message_id))
     
     return {"message": "Message deleted"}
 
 
+@router.post("/{private_id}/messages/bulk", response_model=dict)
+async def bulk_update_link_messages(
+    private_id: str,
+    bulk: BulkMessageAction,
+    current_user: Optional[User] = Depends(get_current_user_optional),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Delete or move many of a private link's messages in one statement, same
+    body as /api/messages/bulk. Ids of other links' messages are skipped.
+    """
+    link = await _private_link(db, private_id, current_user)
+
+    affected = await bulk_mutate(
+        db, LinkMessage, LinkMessage.link_id == link.id,
+        bulk.action, to=bulk.to, ids=bulk.ids, section=bulk.section
+    )
+    await db.commit()
+    if bulk.action == DELETE:
+        decrypted_cache.invalidate(*(link_message_cache_key(message_id) for message_id in affected))
+    
+    return {"action": bulk.action, "affected": len(affected)}
+
+
 @router.get("/my-links", response_model=List[LinkResponse])
 async def get_my_links(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> List[Link]:
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
-    Get all links created by the authenticated user.
+    Get links created by the authenticated user, newest first, one page at a time.
     Only returns active and non-expired links.
+    Pass the X-Next-Cursor response header back as `after` for the next page.
     """
-    # Cleanup expired links
-    cleanup_expired_links(db)
-    
-    # Fetch user's links
-    links = db.query(Link).filter(
-        Link.user_id == current_user.id,
-        Link.status == LinkStatus.active
-    ).order_by(Link.created_at.desc()).all()
+    # Fetch one page of the user's links
+    links, next_cursor = await reads.my_links_page(db, current_user.id, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
-    return links
+    return json_response(reads.link_records.dicts(links), response)
 
 
 @router.delete("/{link_id}/delete", status_code=status.HTTP_200_OK)
 async def delete_link(
     link_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """
     Delete a link and all its associated messages.
     Only the link owner can delete.
     """
     # Find link
-    link = db.query(Link).filter(
+    link = await db.scalar(select(Link).where(
         Link.id == link_id,
         Link.user_id == current_user.id
-    ).first()
+    ))
     
     if not link:
         raise HTTPException(status_code=404, detail="Link not found or unauthorized")
     
     # Delete all messages associated with this link
-    db.query(LinkMessage).filter(LinkMessage.link_id == link.id).delete()
+    deleted_ids = (await db.scalars(
+        delete(LinkMessage).where(LinkMessage.link_id == link.id).returning(LinkMessage.id)
+    )).all()
     
     # Delete the link
-    db.delete(link)
-    db.commit()
+    await db.delete(link)
+    await db.commit()
+    await response_cache.invalidate(f"link:{link.public_id}")
+    decrypted_cache.invalidate(*(link_message_cache_key(message_id) for message_id in deleted_ids))
     
     return {"message": "Link and all messages deleted successfully"}
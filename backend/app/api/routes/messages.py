@@ -1,81 +1,199 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import get_current_user, get_current_user_optional, get_db
-from app.core.security import decrypt_message, encrypt_message
-from app.models.models import Message, MessageStatus, User
-from app.schemas.schemas import MessageCreate, MessageResponse, MessageStatusUpdate
+from app.core.cache import invalidates
+from app.core.conditional import PRIVATE, not_modified
+from app.core.dependencies import get_current_user, get_current_user_optional, get_db, get_read_db, get_stream_user
+from app.core.pagination import NEXT_CURSOR_HEADER, page_limit, section_cursors
+from app.core.realtime import HubFull, open_stream, push_hub, user_channel
+from app.core.serialization import json_response
+from app.core.security import (
+    decrypt_batch,
+    decrypted_cache,
+    message_cache_key,
+    seal_message,
+)
+from app.db.bulk import DELETE, bulk_mutate
+from app.db.changes import ChangesExpired, read_changes
+from app.db import reads
+from app.db.counters import message_counts
+from app.db.ingest import IngestQueueFull, message_ingestor
+from app.db.writes import delete_returning, owner_of, update_returning
+from app.db.versions import inbox_version
+from app.models.models import ChangeOp, ChangeStream, Message, MessageStatus, User
+from app.schemas.schemas import BulkMessageAction, MessageCreate, MessageResponse, MessageStatusUpdate
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
 
 
+def _message_dict(message, content: str) -> dict:
+    """Response body for a message, with its decrypted content (ORM rows keep the ciphertext)"""
+    return {
+        "id": message.id,
+        "receiver_id": message.receiver_id,
+        "content": content,
+        "status": message.status.value,
+        "created_at": message.created_at,
+    }
+
+
+async def _not_yours(db: AsyncSession, message_id: int) -> HTTPException:
+    """Why a write matched no message: it does not exist (404) or belongs to someone else (403)"""
+    if await owner_of(db, Message.receiver_id, message_id) is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
+    return HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
+
+async def _set_status(db: AsyncSession, message_id: int, current_user: User, new_status: MessageStatus) -> dict:
+    """
+    Move one of the current user's messages to another section: a single
+    UPDATE ... RETURNING. The content did not change, so it is decrypted
+    through decrypted_cache (a hit when the message was just listed).
+    """
+    message = await update_returning(
+        db, Message, message_id, {"status": new_status}, reads.message_records.columns(Message),
+        owner=Message.receiver_id == current_user.id
+    )
+    if message is None:
+        raise await _not_yours(db, message_id)
+    await db.commit()
+    
+    content, = await decrypt_batch([message.content], [message_cache_key(message.id)])
+    return _message_dict(message, content)
+
+
 @router.get("/", response_model=List[MessageResponse])
 async def get_messages(
+    response: Response,
     current_user: User = Depends(get_current_user),
     status_filter: Optional[str] = Query(None, alias="status"),
-    db: Session = Depends(get_db)
-) -> List[Message]:
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
-    Get messages for current user.
-    Optional status filter: inbox, public, deleted
-    By default excludes deleted messages
+    Get messages for current user, newest first, one page at a time.
+    Optional status filter: inbox, public, favorite
+    Pass the X-Next-Cursor response header back as `after` for the next page.
     """
-    query = db.query(Message).filter(Message.receiver_id == current_user.id)
-    
-    # Apply status filter
-    if status_filter:
-        if status_filter not in ['inbox', 'public', 'deleted']:
-            raise HTTPException(status_code=400, detail="Invalid status filter")
-        query = query.filter(Message.status == status_filter)
-    else:
-        # By default, exclude deleted messages
-        query = query.filter(Message.status != MessageStatus.deleted)
-    
-    messages = query.order_by(Message.created_at.desc()).all()
-    
-    # Decrypt messages before returning
-    for message in messages:
-        message.content = decrypt_message(message.content)
-    
-    return messages
+    # Validate status filter
+    if status_filter and status_filter not in [s.value for s in MessageStatus]:
+        raise HTTPException(status_code=400, detail="Invalid status filter")
+    section = MessageStatus(status_filter) if status_filter else None
+    
+    messages, next_cursor = await reads.message_page(db, current_user.id, section, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    # Decrypt messages before returning (cached, so a status change right after is a hit)
+    contents = await decrypt_batch(
+        [message.content for message in messages],
+        [message_cache_key(message.id) for message in messages]
+    )
+    return json_response(reads.message_records.dicts(messages, content=contents), response)
 
 
 @router.get("/inbox", response_model=dict)
 async def get_inbox(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    limit: int = Depends(page_limit),
+    inbox_after: Optional[str] = None,
+    public_after: Optional[str] = None,
+    favorite_after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    # Get all messages grouped by status: inbox, public, favorite
-    inbox = db.query(Message).filter(
-        Message.receiver_id == current_user.id,
-        Message.status == MessageStatus.inbox
-    ).order_by(Message.created_at.desc()).all()
-    
-    public = db.query(Message).filter(
-        Message.receiver_id == current_user.id,
-        Message.status == MessageStatus.public
-    ).order_by(Message.created_at.desc()).all()
-    
-    favorite = db.query(Message).filter(
-        Message.receiver_id == current_user.id,
-        Message.status == MessageStatus.favorite
-    ).order_by(Message.created_at.desc()).all()
+    """
+    One page of each section (inbox, public, favorite), newest first.
+    Each section pages independently: the X-Next-Cursor response header
+    lists `<section>=<cursor>` for each section with more; pass the cursor
+    back as `<section>_after` to get that section's next page, or as `after`
+    to GET /api/messages/?status=<section> to page through that section alone.
+    Answers If-None-Match with 304 when no message of the user's changed.
+    """
+    version = await inbox_version(db, current_user.id)
+    if (unchanged := not_modified(request, response, version, PRIVATE)) is not None:
+        return unchanged
+
+    cursors = {
+        MessageStatus.inbox: inbox_after,
+        MessageStatus.public: public_after,
+        MessageStatus.favorite: favorite_after,
+    }
     
-    # Decrypt all messages
-    for msg_list in [inbox, public, favorite]:
-        for msg in msg_list:
-            msg.content = decrypt_message(msg.content)
+    # One round trip for all three sections
+    pages = await reads.inbox_pages(db, current_user.id, cursors, limit)
     
-    return {
-        "inbox": [{"id": m.id, "receiver_id": m.receiver_id, "content": m.content, "status": m.status.value, "created_at": m.created_at} for m in inbox],
-        "public": [{"id": m.id, "receiver_id": m.receiver_id, "content": m.content, "status": m.status.value, "created_at": m.created_at} for m in public],
-        "favorite": [{"id": m.id, "receiver_id": m.receiver_id, "content": m.content, "status": m.status.value, "created_at": m.created_at} for m in favorite]
-    }
+    next_cursors = section_cursors({section.value: next_cursor for section, (_, next_cursor) in pages.items()})
+    if next_cursors:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursors
+
+    result = {}
+    # Decrypt all three sections in one batch
+    contents = await decrypt_batch(
+        [m.content for page, _ in pages.values() for m in page],
+        [message_cache_key(m.id) for page, _ in pages.values() for m in page]
+    )
+    start = 0
+    for section, (page, _) in pages.items():
+        result[section.value] = reads.message_records.dicts(page, content=contents[start:start + len(page)])
+        start += len(page)
+    return json_response(result, response)
+
+
+@router.get("/counts", response_model=dict)
+async def get_counts(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+) -> dict:
+    """Badge counts: {"inbox", "public", "favorite", "total"}. One row lookup, nothing decrypted."""
+    return await message_counts(db, current_user.id)
+
+
+@router.get("/changes", response_model=dict)
+async def get_changes(
+    since: Optional[int] = Query(None, ge=0),
+    current_user: User = Depends(get_current_user),
+    limit: int = Depends(page_limit),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Delta sync: the current user's messages that were added, moved or
+    deleted after `since`, latest state only. Without `since`, just the
+    current next_since: call that first, then fetch the full list, then
+    sync from it. 410 means `since` is too old; refetch and start over.
+    Keep calling with next_since while has_more is true.
+    """
+    try:
+        page = await read_changes(db, ChangeStream.messages, current_user.id, since, limit)
+    except ChangesExpired:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Too far behind, refetch all messages")
+
+    live_ids = [row_id for _, row_id, op in page.changes if op != ChangeOp.delete]
+    messages = await reads.messages_by_id(db, live_ids, current_user.id)
+    found = list(messages.values())
+    contents = dict(zip(
+        (m.id for m in found),
+        await decrypt_batch([m.content for m in found], [message_cache_key(m.id) for m in found])
+    ))
+
+    changes = []
+    for seq, row_id, _ in page.changes:
+        message = messages.get(row_id)
+        changes.append({
+            "seq": seq,
+            "id": row_id,
+            # A row that is gone by now was deleted later, whatever the logged op
+            "op": "upsert" if message else "delete",
+            "message": _message_dict(message, contents[row_id]) if message else None,
+        })
+    return {"changes": changes, "next_since": page.next_since, "has_more": page.has_more}
 
 
 @router.post("/send", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
@@ -84,194 +202,165 @@ async def send_message(
     request: Request,
     message_data: MessageCreate,
     current_user: User = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
-) -> Message:
+    db: AsyncSession = Depends(get_read_db)
+) -> dict:
     # Find receiver by username
-    receiver = db.query(User).filter(User.username == message_data.receiver_username).first()
-    if not receiver:
+    receiver_id = await reads.user_id_for(db, message_data.receiver_username)
+    if receiver_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Receiver not found"
         )
     
     # Encrypt message content before storing
-    encrypted_content = encrypt_message(message_data.content)
+    sealed = seal_message(message_data.content)
     
     # Create message (anonymous if no current_user)
     new_message = Message(
-        receiver_id=receiver.id,
-        content=encrypted_content,
+        receiver_id=receiver_id,
+        sealed=sealed,
         status=MessageStatus.inbox
     )
-    db.add(new_message)
-    db.commit()
-    db.refresh(new_message)
-    
-    # Decrypt for response
-    new_message.content = decrypt_message(new_message.content)
+    # Hand the row to the group-commit writer; returns once its batch is committed
+    try:
+        new_message = await message_ingestor.submit(new_message)
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many messages right now, please retry",
+            headers={"Retry-After": "1"},
+        )
     
-    return new_message
+    # Echo the plaintext we were sent; no need to decrypt it again
+    body = _message_dict(new_message, message_data.content)
+    await push_hub.publish(user_channel(receiver_id), body, message_data.content, sealed)
+    return body
+
+
+@router.get("/stream")
+async def stream_messages(current_user: User = Depends(get_stream_user)):
+    """
+    Server-Sent Events: each new message for the current user as a
+    `message` event (same shape as the list endpoints), `: ping` heartbeats,
+    then `resync` (the client fell behind; refetch) or `reconnect` when the
+    stream ends. EventSource clients may pass the token as ?token=.
+    """
+    try:
+        return open_stream(user_channel(current_user.id))
+    except HubFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many open streams, fall back to polling",
+            headers={"Retry-After": "30"},
+        )
 
 
 @router.patch("/{message_id}/status", response_model=MessageResponse)
+@invalidates("profile:{current_user.id}")
 async def update_message_status(
     message_id: int,
     status_update: MessageStatusUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Message:
-    # Find message
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    # Update status
-    message.status = MessageStatus(status_update.status)
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    # One UPDATE, owner checked in SQL
+    return await _set_status(db, message_id, current_user, MessageStatus(status_update.status))
 
 
 @router.patch("/{message_id}/make-public", response_model=MessageResponse)
+@invalidates("profile:{current_user.id}")
 async def make_message_public(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Message:
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    message.status = MessageStatus.public
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _set_status(db, message_id, current_user, MessageStatus.public)
 
 
 @router.patch("/{message_id}/make-private", response_model=MessageResponse)
+@invalidates("profile:{current_user.id}")
 async def make_message_private(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Message:
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    message.status = MessageStatus.inbox
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    return await _set_status(db, message_id, current_user, MessageStatus.inbox)
 
 
 @router.delete("/{message_id}", status_code=status.HTTP_200_OK)
+@invalidates("profile:{current_user.id}")
 async def delete_message(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """
     Hard delete a message. Permanently removes it from the database.
     """
-    # Find message
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    # Hard delete
-    db.delete(message)
-    db.commit()
+    # Hard delete: one DELETE, owner checked in SQL
+    if not await delete_returning(db, Message, message_id, owner=Message.receiver_id == current_user.id):
+        raise await _not_yours(db, message_id)
+    await db.commit()
+    decrypted_cache.invalidate(message_cache_key(message_id))
     
     return {"message": "Message permanently deleted"}
 
 
 @router.patch("/{message_id}/add-favorite", response_model=MessageResponse)
+@invalidates("profile:{current_user.id}")
 async def add_to_favorite(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Message:
+    db: AsyncSession = Depends(get_db)
+) -> dict:
     """
     Move message to favorite. Only works for inbox messages.
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    message.status = MessageStatus.favorite
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
-    
-    return message
+    return await _set_status(db, message_id, current_user, MessageStatus.favorite)
 
 
 @router.patch("/{message_id}/remove-favorite", response_model=MessageResponse)
+@invalidates("profile:{current_user.id}")
 async def remove_from_favorite(
     message_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Message:
+    db: AsyncSession = Depends(get_db)
+) -> dict:
     """
     Move message from favorite back to inbox.
     """
-    message = db.query(Message).filter(Message.id == message_id).first()
-    if not message:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Message not found")
-    
-    # Verify ownership
-    if message.receiver_id != current_user.id:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
-    
-    message.status = MessageStatus.inbox
-    db.commit()
-    db.refresh(message)
-    
-    # Decrypt for response
-    message.content = decrypt_message(message.content)
+    return await _set_status(db, message_id, current_user, MessageStatus.inbox)
+
+
+@router.post("/bulk", response_model=dict)
+@invalidates("profile:{current_user.id}")
+async def bulk_update_messages(
+    bulk: BulkMessageAction,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> dict:
+    """
+    Delete or move many messages in one statement: the listed `ids`, every
+    message in `section`, or the listed ids within it. Ids that are not the
+    current user's are skipped. Returns how many messages changed.
+    """
+    affected = await bulk_mutate(
+        db, Message, Message.receiver_id == current_user.id,
+        bulk.action, to=bulk.to, ids=bulk.ids, section=bulk.section
+    )
+    await db.commit()
+    if bulk.action == DELETE:
+        decrypted_cache.invalidate(*(message_cache_key(message_id) for message_id in affected))
     
-    return message
+    return {"action": bulk.action, "affected": len(affected)}
 
 
 @router.delete("/section/{section}/all", status_code=status.HTTP_200_OK)
+@invalidates("profile:{current_user.id}")
 async def delete_all_in_section(
     section: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> dict:
     """
     Hard delete all messages in a section (inbox, public, favorite).
@@ -279,19 +368,9 @@ async def delete_all_in_section(
     if section not in ['inbox', 'public', 'favorite']:
         raise HTTPException(status_code=400, detail="Invalid section")
     
-    # Convert section string to MessageStatus enum
-    status_enum = MessageStatus(section)
-    
-    # Find all messages in section for this user
-    messages = db.query(Message).filter(
-        Message.receiver_id == current_user.id,
-        Message.status == status_enum
-    ).all()
-    
-    # Delete all messages
-    for msg in messages:
-        db.delete(msg)
-    
-    db.commit()
+    # One DELETE for the whole section; nothing is loaded
+    deleted_ids = await bulk_mutate(db, Message, Message.receiver_id == current_user.id, DELETE, section=section)
+    await db.commit()
+    decrypted_cache.invalidate(*(message_cache_key(message_id) for message_id in deleted_ids))
     
-    return {"message": f"Deleted {len(messages)} messages from {section}"}
+    return {"message": f"Deleted {len(deleted_ids)} messages from {section}"}
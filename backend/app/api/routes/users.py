@@ -1,14 +1,22 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from slowapi import Limiter
 from slowapi.util import get_remote_address
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.dependencies import get_current_user, get_current_user_optional, get_db
-from app.core.security import decrypt_message
-from app.models.models import Follow, Message, MessageStatus, User
-from app.schemas.schemas import FollowResponse, UserPublicProfile, UserResponse, UserSearch
+from app.core.cache import invalidates, response_cache
+from app.core.conditional import PRIVATE, PUBLIC, not_modified
+from app.core.dependencies import get_current_user, get_current_user_optional, get_db, get_read_db
+from app.core.pagination import NEXT_CURSOR_HEADER, page_limit
+from app.core.security import decrypt_batch, message_cache_key
+from app.core.serialization import json_response
+from app.db import reads
+from app.db.search import SEARCH_LIMIT, TYPEAHEAD_LIMIT, find_users
+from app.db.versions import profile_version
+from app.models.models import Follow, User
+from app.schemas.schemas import FollowResponse, UserPublicProfile, UserResponse, UserSearch, UserSuggestion
 
 router = APIRouter()
 limiter = Limiter(key_func=get_remote_address)
@@ -19,156 +27,169 @@ limiter = Limiter(key_func=get_remote_address)
 async def search_users(
     request: Request,
     search_data: UserSearch,
-    db: Session = Depends(get_db)
-) -> List[User]:
-    # Search users by username or name (case-insensitive partial match)
-    users = db.query(User).filter(
-        (User.username.ilike(f"%{search_data.username}%")) |
-        (User.name.ilike(f"%{search_data.username}%"))
-    ).limit(20).all()
-    return users
+    db: AsyncSession = Depends(get_read_db)
+) -> List[Row]:
+    # Search users by username or name (case-insensitive, username prefixes first)
+    return await find_users(db, search_data.username, SEARCH_LIMIT)
+
+
+@router.get("/typeahead", response_model=List[UserSuggestion])
+@limiter.limit("120/minute")
+async def typeahead(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=50),
+    limit: int = Query(TYPEAHEAD_LIMIT, ge=1, le=SEARCH_LIMIT),
+    db: AsyncSession = Depends(get_read_db)
+) -> List[Row]:
+    """
+    Suggestions for the search box, one request per keystroke.
+    Same ranking as /search, but a GET with no user-specific data so
+    browsers and proxies can cache it briefly.
+    """
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return await find_users(db, q, limit)
+
+
+def _versioned(key: str, version: Optional[object]) -> str:
+    # A key that moves with the row version can never hand out a body older than its ETag
+    return key if version is None else f"{key}@{version}"
+
+
+async def _public_profile(db: AsyncSession, user_id: int, version: Optional[str] = None) -> dict:
+    """
+    The viewer-independent part of a profile: the user and their latest
+    public messages. Cached per user (and coalesced on a miss); the message
+    routes invalidate profile:{id} whenever that set can change.
+    """
+    async def load() -> dict:
+        user = await reads.user_by_id(db, user_id)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+        public_messages = await reads.public_messages(db, user_id)
+
+        contents = await decrypt_batch(
+            [msg.content for msg in public_messages],
+            [message_cache_key(msg.id) for msg in public_messages]
+        )
+        return {
+            "id": user.id,
+            "username": user.username,
+            "name": user.name,
+            "public_messages": reads.message_records.dicts(public_messages, content=contents),
+        }
+
+    return await response_cache.get_or_set(
+        _versioned(f"profile:{user_id}", version), load, tags=[f"profile:{user_id}", f"user:{user_id}"]
+    )
+
+
+async def _follow_status(db: AsyncSession, viewer: Optional[User], user_id: int,
+                         version: Optional[int] = None) -> dict:
+    """{"is_following": ...} for this viewer, cached per viewer until they follow or unfollow someone"""
+    if not viewer or user_id == viewer.id:
+        return {"is_following": False}
+
+    async def load() -> dict:
+        return {"is_following": await reads.is_following(db, viewer.id, user_id)}
+
+    return await response_cache.get_or_set(
+        _versioned(f"follow-status:{viewer.id}:{user_id}", version), load, tags=[f"follows:{viewer.id}"]
+    )
+
+
+async def _profile_response(request: Request, response: Response, db: AsyncSession,
+                            viewer: Optional[User], user_id: Optional[int] = None,
+                            username: Optional[str] = None):
+    """Profile body for /{user_id} and /username/{username}, or a 304 if the client's copy is current"""
+    version = await profile_version(db, user_id, username, viewer.id if viewer else None)
+    body_version = follows_version = None
+    if version is not None:
+        user_id, messages_version, user_version, follows_version = version
+        # The body shows the user's name as well as their public messages
+        body_version = f"{messages_version}.{user_version}"
+    elif user_id is None:
+        async def resolve() -> int:
+            found = await reads.user_id_for(db, username)
+            if found is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+            return found
+
+        # Usernames never change, so the username -> id lookup is cached too
+        user_id = await response_cache.get_or_set(f"user-id:{username}", resolve)
+
+    # Anonymous profiles are the shared URLs worth keeping in Caddy
+    if (unchanged := not_modified(request, response, version, PRIVATE if viewer else PUBLIC)) is not None:
+        return unchanged
+
+    profile = await _public_profile(db, user_id, body_version)
+    # Never cached with the profile: it depends on who is asking
+    return json_response({**profile, **await _follow_status(db, viewer, user_id, follows_version)}, response)
 
 
 @router.get("/username/{username}", response_model=dict)
 async def get_public_profile_by_username(
+    request: Request,
+    response: Response,
     username: str,
     current_user: User = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Public profile lookup by username for shareable links.
     Mirrors the /{user_id} response.
     """
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    return await _profile_response(request, response, db, current_user, username=username)
+
 
-    public_messages = db.query(Message).filter(
-        Message.receiver_id == user.id,
-        Message.status == MessageStatus.public
-    ).order_by(Message.created_at.desc()).limit(20).all()
-
-    for msg in public_messages:
-        msg.content = decrypt_message(msg.content)
-
-    is_following = False
-    if current_user:
-        follow = db.query(Follow).filter(
-            Follow.follower_id == current_user.id,
-            Follow.following_id == user.id
-        ).first()
-        is_following = bool(follow)
-
-    return {
-        "id": user.id,
-        "username": user.username,
-        "name": user.name,
-        "public_messages": [
-            {
-                "id": m.id,
-                "receiver_id": m.receiver_id,
-                "content": m.content,
-                "status": m.status.value,
-                "created_at": m.created_at
-            } for m in public_messages
-        ],
-        "is_following": is_following
-    }
-
-
-@router.get("/{user_id}", response_model=dict)
+@router.get("/{user_id:int}", response_model=dict)
 async def get_public_profile(
+    request: Request,
+    response: Response,
     user_id: int,
     current_user: User = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
-    # Get user
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    
-    # Get public messages
-    public_messages = db.query(Message).filter(
-        Message.receiver_id == user_id,
-        Message.status == MessageStatus.public
-    ).order_by(Message.created_at.desc()).limit(20).all()
-    
-    # Decrypt messages
-    for msg in public_messages:
-        msg.content = decrypt_message(msg.content)
-    
-    # Check if current user is following (if logged in)
-    is_following = False
-    if current_user:
-        follow = db.query(Follow).filter(
-            Follow.follower_id == current_user.id,
-            Follow.following_id == user_id
-        ).first()
-        is_following = bool(follow)
-    
-    return {
-        "id": user.id,
-        "username": user.username,
-        "name": user.name,
-        "public_messages": [
-            {
-                "id": m.id,
-                "receiver_id": m.receiver_id,
-                "content": m.content,
-                "status": m.status.value,
-                "created_at": m.created_at
-            } for m in public_messages
-        ],
-        "is_following": is_following
-    }
-
-
-@router.get("/{user_id}/follow-status", response_model=dict)
+    return await _profile_response(request, response, db, current_user, user_id=user_id)
+
+
+@router.get("/{user_id:int}/follow-status", response_model=dict)
 async def check_follow_status(
     user_id: int,
     current_user: User = Depends(get_current_user_optional),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Check if current user is following the given user.
     Returns {"is_following": true/false}
     """
-    if not current_user:
-        return {"is_following": False}
-    
-    if user_id == current_user.id:
-        return {"is_following": False}
-    
-    follow = db.query(Follow).filter(
-        Follow.follower_id == current_user.id,
-        Follow.following_id == user_id
-    ).first()
-    
-    return {"is_following": bool(follow)}
+    return await _follow_status(db, current_user, user_id)
 
 
 @router.post("/follow/{user_id}", status_code=status.HTTP_201_CREATED)
 @limiter.limit("20/hour")
+@invalidates("follows:{current_user.id}")
 async def follow_user(
     request: Request,
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     # Cannot follow yourself
     if user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cannot follow yourself")
     
     # Check if user exists
-    target_user = db.query(User).filter(User.id == user_id).first()
+    target_user = await db.scalar(select(User).where(User.id == user_id))
     if not target_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
     
     # Check if already following
-    existing = db.query(Follow).filter(
+    existing = await db.scalar(select(Follow).where(
         Follow.follower_id == current_user.id,
         Follow.following_id == user_id
-    ).first()
+    ))
     
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Already following")
@@ -179,76 +200,81 @@ async def follow_user(
         following_id=user_id
     )
     db.add(new_follow)
-    db.commit()
-    db.refresh(new_follow)
+    await db.commit()
     
     return {"message": "Now following", "follow_id": new_follow.id}
 
 
 @router.delete("/unfollow/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
+@invalidates("follows:{current_user.id}")
 async def unfollow_user(
     user_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    follow = db.query(Follow).filter(
+    follow = await db.scalar(select(Follow).where(
         Follow.follower_id == current_user.id,
         Follow.following_id == user_id
-    ).first()
+    ))
     
     if not follow:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not following this user")
     
-    db.delete(follow)
-    db.commit()
+    await db.delete(follow)
+    await db.commit()
+
+
+async def _follow_page(
+    db: AsyncSession,
+    match_column,
+    user_column,
+    user_id: int,
+    after: Optional[str],
+    limit: int,
+    response: Response
+) -> Response:
+    """One page of the users on the other side of `user_id`'s follows, newest follow first"""
+    rows, next_cursor = await reads.follow_page(db, match_column, user_column, user_id, after, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return json_response(reads.user_records.dicts(rows), response)
 
 
 @router.get("/me/following", response_model=List[UserResponse])
 async def get_my_following(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> List[User]:
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
     """
     Get list of users that the current user is following.
+    Pass the X-Next-Cursor response header back as `after` for the next page.
     """
-    follows = db.query(Follow).filter(Follow.follower_id == current_user.id).all()
-    following_ids = [f.following_id for f in follows]
-    
-    if not following_ids:
-        return []
-    
-    users = db.query(User).filter(User.id.in_(following_ids)).all()
-    return users
+    return await _follow_page(db, Follow.follower_id, Follow.following_id, current_user.id, after, limit, response)
 
 
 @router.get("/following", response_model=List[UserResponse])
 async def get_following(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> List[User]:
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
     # Deprecated - use /me/following instead
     # Get all users current user follows
-    follows = db.query(Follow).filter(Follow.follower_id == current_user.id).all()
-    following_ids = [f.following_id for f in follows]
-    
-    if not following_ids:
-        return []
-    
-    users = db.query(User).filter(User.id.in_(following_ids)).all()
-    return users
+    return await _follow_page(db, Follow.follower_id, Follow.following_id, current_user.id, after, limit, response)
 
 
 @router.get("/followers", response_model=List[UserResponse])
 async def get_followers(
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> List[User]:
-    # Get all users following current user
-    follows = db.query(Follow).filter(Follow.following_id == current_user.id).all()
-    follower_ids = [f.follower_id for f in follows]
-    
-    if not follower_ids:
-        return []
-    
-    users = db.query(User).filter(User.id.in_(follower_ids)).all()
-    return users
+    limit: int = Depends(page_limit),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+) -> Response:
+    # Get users following current user
+    return await _follow_page(db, Follow.following_id, Follow.follower_id, current_user.id, after, limit, response)
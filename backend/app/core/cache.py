@@ -0,0 +1,470 @@
+"""
+Tiered cache shared by every uvicorn worker on the host.
+
+- Local tier: a per-process LRU capped by bytes. Fastest, but another
+  worker's changes only reach it through the invalidation log below.
+- Shared tier: a small SQLite file next to the main database (disposable
+  data, its own write lock). A value computed by one worker is served to
+  all of them.
+- Invalidation: values carry tags. invalidate(tag) deletes the tag's shared
+  entries and appends the tag to cache_invalidations; every worker polls
+  that log every cache_sync_interval_ms and drops matching local entries.
+  Local entries can therefore outlive a change made by another worker by
+  at most one sync interval.
+- Single flight: concurrent misses on one key in a worker share a single
+  loader call, so a burst on a cold key costs one query, not one per request.
+
+Routes opt in declaratively:
+
+    @cached("link-info:{public_id}", tags=["link:{public_id}"])
+    @invalidates("follows:{current_user.id}")
+
+Key and tag templates are formatted with the route's arguments.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.engine import make_url
+
+from app.core.config import DEFAULT_SQLITE_PATH, get_settings
+
+logger = logging.getLogger(__name__)
+
+Ttl = Union[float, Callable[[Any], float], None]
+
+_MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cache_tags (
+    tag TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (tag, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_cache_tags_key ON cache_tags (key);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tag TEXT NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+
+def default_cache_path() -> str:
+    """Next to the SQLite database (e.g. saytruth-cache.db), else next to the default one"""
+    settings = get_settings()
+    if settings.cache_path:
+        return settings.cache_path
+    url = make_url(settings.database_url)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        database = Path(url.database)
+        return str(database.with_name(f"{database.stem}-cache.db"))
+    return str(DEFAULT_SQLITE_PATH.with_name("saytruth-cache.db"))
+
+
+class LocalTier:
+    """In-process LRU of decoded values, capped by their encoded size"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._keys_by_tag: Dict[str, set] = {}
+        self.bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        value, _, expires_at, _ = entry
+        if expires_at <= time.time():
+            self._remove(key)
+            return _MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, size: int, expires_at: float, tags: Sequence[str]) -> None:
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, size, expires_at, tuple(tags))
+        for tag in tags:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate_tag(self, tag: str) -> None:
+        for key in list(self._keys_by_tag.get(tag, ())):
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._keys_by_tag.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[1]
+        for tag in entry[3]:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+class SharedTier:
+    """The SQLite cache file. Not thread-safe: TieredCache calls it from one dedicated thread."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> None:
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Cache contents are disposable; durability is not worth an fsync
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"PRAGMA busy_timeout={int(get_settings().sqlite_busy_timeout_ms)}")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def last_seq(self) -> int:
+        return self._conn.execute("SELECT coalesce(max(seq), 0) FROM cache_invalidations").fetchone()[0]
+
+    def get(self, key: str, now: float) -> Tuple[Optional[bytes], float, int]:
+        """(value or None, expires_at, latest invalidation seq)"""
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None, 0.0, self.last_seq()
+        return row[0], row[1], 0
+
+    def set(self, key: str, value: bytes, expires_at: float, tags: Sequence[str], seen_seq: int) -> bool:
+        """
+        Store a value unless one of its tags was invalidated after seen_seq
+        (i.e. while it was being computed). Returns whether it was stored.
+        """
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if tags:
+                placeholders = ",".join("?" * len(tags))
+                raced = conn.execute(
+                    f"SELECT 1 FROM cache_invalidations WHERE seq > ? AND tag IN ({placeholders}) LIMIT 1",
+                    (seen_seq, *tags)
+                ).fetchone()
+                if raced:
+                    conn.execute("ROLLBACK")
+                    return False
+            conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            conn.executemany("INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate(self, tags: Sequence[str], now: float) -> None:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for tag in tags:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_tags WHERE tag = ?)", (tag,)
+                )
+                conn.execute("DELETE FROM cache_tags WHERE tag = ?", (tag,))
+                conn.execute("INSERT INTO cache_invalidations (tag, at) VALUES (?, ?)", (tag, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def changes_since(self, seq: int) -> Tuple[List[Tuple[int, str]], int]:
+        """Invalidations after seq, and the oldest seq still in the log"""
+        rows = self._conn.execute(
+            "SELECT seq, tag FROM cache_invalidations WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        oldest = self._conn.execute("SELECT coalesce(min(seq), 0) FROM cache_invalidations").fetchone()[0]
+        return rows, oldest
+
+    def purge(self, now: float, log_retention: float) -> None:
+        """Drop expired entries and invalidation records every worker has long since seen"""
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache_tags WHERE key IN (SELECT key FROM cache_entries WHERE expires_at <= ?)", (now,))
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+            conn.execute("DELETE FROM cache_invalidations WHERE at < ?", (now - log_retention,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class TieredCache:
+    """Local LRU in front of the shared SQLite tier, kept coherent through the invalidation log"""
+
+    # Run SharedTier.purge() every this many seconds
+    PURGE_INTERVAL = 60.0
+
+    def __init__(self, path: str, local_max_bytes: int, default_ttl: float,
+                 sync_interval: float, log_retention: float):
+        self.default_ttl = default_ttl
+        self.sync_interval = sync_interval
+        self.log_retention = log_retention
+        self.local = LocalTier(local_max_bytes)
+        self.shared = SharedTier(path)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seen_seq = 0
+        self._subscribers: List[Tuple[str, Callable[[str], None]]] = []
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # Metrics
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stores = 0
+        self.stores_skipped = 0
+        self.invalidations_sent = 0
+        self.invalidations_received = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    async def start(self) -> None:
+        # One thread owns the sqlite3 connection, so shared-tier calls never block the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache")
+        await self._shared(self.shared.open)
+        self._seen_seq = await self._shared(self.shared.last_seq)
+        self._task = asyncio.create_task(self._sync_loop(), name="cache-sync")
+
+    async def stop(self) -> None:
+        if self._executor is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._shared(self.shared.close)
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=False)
+        self.local.clear()
+
+    def subscribe(self, prefix: str, callback: Callable[[str], None]) -> None:
+        """Call callback(tag) whenever a tag starting with prefix is invalidated, by any worker"""
+        self._subscribers.append((prefix, callback))
+
+    async def get_or_set(self, key: str, loader: Callable[[], Awaitable[Any]],
+                         tags: Sequence[str] = (), ttl: Ttl = None) -> Any:
+        """
+        Cached value for key, else await loader(), store it JSON-encoded in
+        both tiers and return the encoded form (so hits and misses return the
+        same shape). Falls through to loader() when the cache is not running.
+        Concurrent callers that miss on the same key wait for the first one's
+        result (or exception) instead of running loader() themselves.
+        """
+        if not self.running:
+            return jsonable_encoder(await loader())
+
+        value = self.local.get(key)
+        if value is not _MISSING:
+            self.local_hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            while inflight is not None:
+                try:
+                    return await asyncio.shield(inflight)
+                except asyncio.CancelledError:
+                    if not inflight.cancelled():
+                        raise
+                # The loading request was cancelled (client went away); retry
+                inflight = self._inflight.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, loader, tags, ttl)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark it retrieved: with no waiters asyncio would log it as unhandled
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def invalidate(self, *tags: str) -> None:
+        """Drop every value carrying one of these tags, in this worker now and in the others on their next sync"""
+        for tag in tags:
+            self._invalidate_local(tag)
+        if self.running and tags:
+            await self._shared(self.shared.invalidate, list(tags), time.time())
+            self.invalidations_sent += len(tags)
+
+    def metrics(self) -> dict:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "local_entries": len(self.local),
+            "local_bytes": self.local.bytes,
+            "local_evictions": self.local.evictions,
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "stores_skipped": self.stores_skipped,
+            "invalidations_sent": self.invalidations_sent,
+            "invalidations_received": self.invalidations_received,
+        }
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], tags: Sequence[str], ttl: Ttl) -> Any:
+        """Shared tier, else loader(); the miss path of get_or_set"""
+        blob, expires_at, seen_seq = await self._shared(self.shared.get, key, time.time())
+        if blob is not None:
+            self.shared_hits += 1
+            value = json.loads(blob)
+            self.local.set(key, value, len(blob), expires_at, tags)
+            return value
+
+        self.misses += 1
+        value = jsonable_encoder(await loader())
+        seconds = ttl(value) if callable(ttl) else (self.default_ttl if ttl is None else ttl)
+        if seconds > 0:
+            blob = json.dumps(value, separators=(",", ":")).encode()
+            expires_at = time.time() + seconds
+            if await self._shared(self.shared.set, key, blob, expires_at, list(tags), seen_seq):
+                self.stores += 1
+                self.local.set(key, value, len(blob), expires_at, tags)
+            else:
+                self.stores_skipped += 1
+        return value
+
+    def _invalidate_local(self, tag: str) -> None:
+        self.local.invalidate_tag(tag)
+        for prefix, callback in self._subscribers:
+            if tag.startswith(prefix):
+                try:
+                    callback(tag)
+                except Exception:
+                    logger.exception("Cache invalidation subscriber failed for %s", tag)
+
+    async def _shared(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _sync_loop(self) -> None:
+        last_purge = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                changes, oldest = await self._shared(self.shared.changes_since, self._seen_seq)
+                if oldest > self._seen_seq + 1:
+                    # Fell behind the log's retention window: nothing local can be trusted
+                    self.local.clear()
+                for seq, tag in changes:
+                    self._invalidate_local(tag)
+                    self._seen_seq = seq
+                self.invalidations_received += len(changes)
+                if time.monotonic() - last_purge >= self.PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    await self._shared(self.shared.purge, time.time(), self.log_retention)
+            except Exception:
+                logger.exception("Cache invalidation sync failed")
+
+
+settings = get_settings()
+response_cache = TieredCache(
+    path=default_cache_path(),
+    local_max_bytes=settings.cache_local_max_bytes,
+    default_ttl=settings.cache_default_ttl_s,
+    sync_interval=settings.cache_sync_interval_ms / 1000,
+    log_retention=settings.cache_invalidation_retention_s,
+)
+
+
+def cached(key: str, tags: Sequence[str] = (), ttl: Ttl = None):
+    """
+    Route decorator: serve the route's (JSON-encoded) return value from
+    response_cache under `key`. Key and tags are str.format templates over
+    the route's arguments; ttl may be a function of the encoded value.
+    Exceptions (e.g. a 404) are never cached, and requests whose key cannot
+    be built (an attribute of a missing user) bypass the cache.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            try:
+                cache_key = key.format(**arguments)
+                cache_tags = [tag.format(**arguments) for tag in tags]
+            except (AttributeError, KeyError):
+                # e.g. "{current_user.id}" for an anonymous request: not cacheable
+                return await fn(*args, **kwargs)
+            return await response_cache.get_or_set(
+                cache_key, lambda: fn(*args, **kwargs), tags=cache_tags, ttl=ttl
+            )
+        return wrapper
+    return decorator
+
+
+def invalidates(*tags: str):
+    """Route decorator: once the route has returned successfully, invalidate these tag templates"""
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            result = await fn(*args, **kwargs)
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            await response_cache.invalidate(*(tag.format(**arguments) for tag in tags))
+            return result
+        return wrapper
+    return decorator
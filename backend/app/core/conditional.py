@@ -0,0 +1,59 @@
+"""
+Conditional GET for polled read endpoints.
+
+A route computes a cheap version for what it is about to return (see
+app.db.versions), then calls not_modified() before doing any real work:
+
+    version = await inbox_version(db, current_user.id)
+    if (cached := not_modified(request, response, version, PRIVATE)) is not None:
+        return cached
+
+The ETag covers the version and the query string, because different pages
+of the same resource have different bodies. When the client's If-None-Match
+matches, the route returns an empty 304. Otherwise it carries on and the
+ETag and Cache-Control headers go out with the full body.
+"""
+import hashlib
+from typing import Optional, Sequence
+
+from fastapi import Request, Response, status
+
+from app.core.config import get_settings
+
+# Anyone's copy is the same: Caddy and browsers may reuse it briefly, then revalidate
+PUBLIC = f"public, max-age={get_settings().http_public_max_age_s}"
+# Per-user data: the browser keeps it but must revalidate every time
+PRIVATE = "private, no-cache"
+
+
+def make_etag(request: Request, version: Sequence) -> str:
+    raw = repr((tuple(version), request.url.path, str(request.query_params))).encode()
+    return 'W/"' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
+
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 requires for If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, response: Response, version: Optional[Sequence],
+                 cache_control: str, vary: Sequence[str] = ("Authorization",)) -> Optional[Response]:
+    """
+    Put ETag, Cache-Control and Vary on `response`. Return a 304 to send
+    instead if the client already holds this version. A version of None
+    (no counters on this database) skips the ETag.
+    """
+    headers = {"Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+    if version is not None:
+        headers["ETag"] = make_etag(request, version)
+    response.headers.update(headers)
+
+    if_none_match = request.headers.get("if-none-match")
+    if version is not None and if_none_match and _matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
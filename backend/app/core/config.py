@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 from pydantic_settings import BaseSettings
 
@@ -13,11 +14,91 @@ class Settings(BaseSettings):
     access_token_expire_minutes: int = 60 * 24
     database_url: str = DEFAULT_SQLITE_URL
     algorithm: str = "HS256"
+    debug: bool = False  # DEBUG=true lets the app start with a throwaway encryption key
+
+    # Message encryption keys (see app.core.keyring)
+    encryption_key: str = ""  # a single key, id 0
+    encryption_keys: str = ""  # "id:key,id:key", active key first; takes precedence over encryption_key
+    message_compress_min_bytes: int = 256  # bodies at least this long (UTF-8) are deflated before sealing
+    message_compress_level: int = 6  # zlib level, 1 (fastest) - 9 (smallest)
+
+    # SQLite profile (ignored for other databases)
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"  # OFF, NORMAL, FULL, EXTRA
+    sqlite_mmap_size: int = 256 * 1024 * 1024  # bytes
+    sqlite_cache_size: int = -64000  # negative = KiB, positive = pages
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_foreign_keys: bool = True
+    sqlite_auto_vacuum: str = "INCREMENTAL"  # NONE, FULL, INCREMENTAL; only applies to new database files
+    sqlite_read_pool_size: int = 4  # read-only connections for GET routes
+    sqlite_write_pool_timeout: float = 30.0  # seconds to wait for the writer connection
+
+    # Group-commit ingestion of anonymous messages
+    ingest_batch_size: int = 100  # max rows per transaction
+    ingest_flush_interval_ms: int = 5  # max wait after the first queued row
+    ingest_queue_depth: int = 1000  # rows waiting before sends get a 503
+
+    # Background jobs run in one worker per database (see app.db.jobs)
+    background_jobs: bool = True  # False = this process never runs them
+
+    # Background link expiry
+    link_expiry_max_interval_s: float = 60.0  # longest sleep between sweeps
+
+    # Retention: purge retired links and compact the database file
+    retention_grace_days: float = 7.0  # keep retired links (and their messages) this long
+    retention_chunk_size: int = 500  # rows deleted per transaction
+    retention_chunk_pause_ms: int = 10  # pause between chunks so other writers get the lock
+    retention_vacuum_pages: int = 1000  # free pages released per incremental_vacuum step
+    retention_interval_s: float = 0.0  # in-app retention pass every N seconds; 0 = CLI only
+    change_log_retention_days: float = 7.0  # delta-sync clients further behind than this refetch everything
+    change_log_compact_interval_s: float = 3600.0  # in-app change log compaction every N seconds; 0 = CLI only
+
+    # Re-encryption of message bodies under the active key (app.db.reseal)
+    reseal_chunk_size: int = 500  # rows re-encrypted per transaction
+    reseal_chunk_pause_ms: int = 10  # minimum pause between chunks
+    reseal_write_share: float = 0.25  # largest share of the time the job may hold the write lock
+    reseal_workers: int = 2  # threads re-encrypting each chunk
+    reseal_on_startup: bool = False  # True = one background pass after startup, in the job runner; default: CLI only
+
+    # bcrypt worker pool
+    password_hash_workers: int = 2  # concurrent hashes/verifications
+    password_hash_queue_depth: int = 32  # jobs waiting before logins get a 503
+
+    # Batch decryption for list endpoints
+    decrypt_workers: int = 2  # threads for large batches
+    decrypt_parallel_threshold: int = 256  # smaller batches are decrypted inline; also the chunk size
+    decrypt_cache_max_bytes: int = 32 * 1024 * 1024  # decrypted content kept in memory
+    decrypt_cache_ttl_s: float = 3600.0  # 0 = entries only leave by LRU eviction
+
+    # Verified JWT cache on the authentication hot path
+    token_cache_max_entries: int = 10000
+    token_cache_ttl_s: float = 60.0
+
+    # Tiered response cache shared by all workers
+    cache_path: str = ""  # shared SQLite tier; default: <database>-cache.db next to the database
+    cache_local_max_bytes: int = 16 * 1024 * 1024  # per-process tier
+    cache_default_ttl_s: float = 60.0
+    cache_sync_interval_ms: int = 250  # how often workers pick up each other's invalidations
+    cache_invalidation_retention_s: float = 3600.0  # invalidation log kept this long
+
+    # Conditional GET (ETag / Cache-Control)
+    http_public_max_age_s: int = 5  # how long Caddy/browsers may reuse a public response before revalidating
+
+    # Realtime push (SSE)
+    push_max_connections: int = 1000  # open streams per worker
+    push_max_connections_per_channel: int = 8  # e.g. tabs per user
+    push_queue_depth: int = 64  # events a slow client may fall behind before it is told to resync
+    push_heartbeat_s: float = 15.0  # keeps proxies from closing idle streams
+    push_max_stream_s: float = 600.0  # streams end (and clients reconnect) after this long
+    push_poll_interval_ms: int = 200  # how often workers pick up each other's events
+    push_event_retention_s: float = 60.0
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
 
 
+@lru_cache
 def get_settings() -> Settings:
+    # Built once per process: reading .env and the environment on every call is not free
     return Settings()
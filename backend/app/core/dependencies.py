@@ -1,52 +1,123 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator
+from datetime import datetime
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.security import decode_access_token
-from app.db.database import SessionLocal
+from app.core.security import USER_CLAIMS, decode_access_token_claims, token_cache, user_claims
+from app.db import reads
+from app.db.database import AsyncReadSessionLocal, AsyncSessionLocal
+from app.db.versions import user_version
 from app.models.models import User
 
 security = HTTPBearer()
 
 
-def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    """Session on the writer connection, for routes that modify data"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """Session on the read-only pool, for routes that only read"""
+    async with AsyncReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_current_user(
+class UnknownUser(Exception):
+    """The token is valid but its user no longer exists"""
+
+
+async def _verified_claims(token: str, db: AsyncSession) -> Optional[dict]:
+    """
+    Verified claims for a bearer token, including the user fields; None if
+    the token is invalid. Served from token_cache when possible. Otherwise
+    the token's user version is compared with users.profile_version (one
+    primary-key lookup), and the user fields are re-read only when the
+    user changed after the token was issued, or the token predates them.
+    """
+    claims = token_cache.get(token)
+    if claims is not None:
+        return claims
+    claims = decode_access_token_claims(token)
+    if claims is None or claims.get("sub") is None:
+        return None
+    version = await user_version(db, int(claims["sub"]))
+    if version is None or version != claims.get("ver") or not all(field in claims for field in USER_CLAIMS):
+        user = await reads.user_claims_by_id(db, int(claims["sub"]))
+        if user is None:
+            raise UnknownUser(claims["sub"])
+        claims = {**claims, **user_claims(user)}
+    token_cache.put(token, claims)
+    return claims
+
+
+def _principal(claims: dict) -> User:
+    """Detached User carrying the claim fields; never added to a session"""
+    created_at = claims.get("created_at")
+    return User(
+        id=int(claims["sub"]),
+        username=claims["username"],
+        name=claims["name"],
+        language=claims["language"],
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+    )
+
+
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> User:
-    token = credentials.credentials
-    user_id = decode_access_token(token)
-    if user_id is None:
+    try:
+        claims = await _verified_claims(credentials.credentials, db)
+    except UnknownUser:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if claims is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    if user is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-    return user
+    return _principal(claims)
 
 
-def get_current_user_optional(
+async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> Optional[User]:
     if credentials is None:
         return None
-    token = credentials.credentials
-    user_id = decode_access_token(token)
-    if user_id is None:
+    try:
+        claims = await _verified_claims(credentials.credentials, db)
+    except UnknownUser:
         return None
-    user = db.query(User).filter(User.id == int(user_id)).first()
-    return user
+    return _principal(claims) if claims is not None else None
+
+
+async def get_stream_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False)),
+    token: Optional[str] = Query(None, description="Bearer token, for EventSource clients that cannot set headers"),
+) -> User:
+    """
+    get_current_user for long-lived streams. The token may also come as
+    ?token=. No session is held for the life of the stream: one is opened
+    only when the token is not already in token_cache.
+    """
+    token = credentials.credentials if credentials is not None else token
+    claims = None
+    if token:
+        async with AsyncReadSessionLocal() as db:
+            try:
+                claims = await _verified_claims(token, db)
+            except UnknownUser:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if claims is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return _principal(claims)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from app.core.config import get_settings
+from app.core.security import get_password_hash, verify_password
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool cannot take another job"""
+
+
+class PasswordHasher:
+    """
+    Bounded worker pool for bcrypt.
+
+    bcrypt costs a few hundred milliseconds of CPU per call. Running it in
+    an async handler stalls every other request on the worker, so hashes and
+    verifications run on a small thread pool instead (bcrypt releases the
+    GIL while it works). At most `workers` jobs run at once and at most
+    `queue_depth` more wait; anything beyond that is rejected straight away
+    with HashingBusy so a login burst turns into quick 503s rather than
+    requests piling up.
+    """
+
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        # Metrics
+        self.completed = 0
+        self.rejected = 0
+        self.total_queue_ms = 0.0
+        self.total_hash_ms = 0.0
+        self.max_queue_ms = 0.0
+
+    async def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+
+    async def stop(self) -> None:
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        # Let running and queued jobs finish without blocking the event loop
+        await asyncio.to_thread(executor.shutdown, wait=True)
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(verify_password, plain_password, hashed_password)
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_queue_ms": round(self.total_queue_ms / self.completed, 3) if self.completed else 0.0,
+            "max_queue_ms": round(self.max_queue_ms, 3),
+            "avg_hash_ms": round(self.total_hash_ms / self.completed, 3) if self.completed else 0.0,
+        }
+
+    async def _submit(self, fn: Callable, *args):
+        if self._executor is None:
+            raise HashingBusy("Password hashing is not running")
+        if self._in_flight >= self.workers + self.queue_depth:
+            self.rejected += 1
+            raise HashingBusy("Password hashing queue is full")
+
+        submitted = time.perf_counter()
+        timings = {}
+
+        def run():
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                timings["queue"] = started - submitted
+                timings["hash"] = time.perf_counter() - started
+
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+        finally:
+            self._in_flight -= 1
+            if timings:
+                queue_ms = timings["queue"] * 1000
+                self.completed += 1
+                self.total_queue_ms += queue_ms
+                self.total_hash_ms += timings["hash"] * 1000
+                self.max_queue_ms = max(self.max_queue_ms, queue_ms)
+
+
+settings = get_settings()
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    queue_depth=settings.password_hash_queue_depth,
+)
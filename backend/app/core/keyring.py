@@ -0,0 +1,113 @@
+"""
+Message encryption keys.
+
+Keys come from ENCRYPTION_KEYS, a comma-separated list of id:key pairs,
+the active key first and retired ones after it:
+
+    ENCRYPTION_KEYS=2:<new key>,1:<old key>
+
+Keys are Fernet keys (Fernet.generate_key()); ids are 0-255. Every sealed
+body carries the id of the key it was sealed with (see app.core.security).
+New messages always use the active key. Retired keys only decrypt, until
+app.db.reseal has re-encrypted every row under the active key and they can
+be removed. A lone ENCRYPTION_KEY is the same as ENCRYPTION_KEYS=0:<key>,
+so to rotate away from it, list it as 0:<key> after the new key.
+
+Without any key the app refuses to start, because a generated key makes
+every stored message unreadable. DEBUG=true allows a throwaway key for
+local development.
+"""
+import base64
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+from app.core.config import Settings, get_settings
+
+MAX_KEY_ID = 255
+
+
+class MissingEncryptionKey(RuntimeError):
+    """Raised at startup when no encryption key is configured outside DEBUG"""
+
+
+@dataclass(frozen=True)
+class MessageKey:
+    key_id: int
+    # Legacy Fernet tokens
+    fernet: Fernet
+    # Separate 256-bit key for sealed bodies, derived from the same secret
+    aead: ChaCha20Poly1305
+
+    @classmethod
+    def from_fernet_key(cls, key_id: int, fernet_key: str) -> "MessageKey":
+        if not 0 <= key_id <= MAX_KEY_ID:
+            raise ValueError(f"Encryption key id {key_id} is outside 0-{MAX_KEY_ID}")
+        # Fernet() rejects a malformed key
+        fernet = Fernet(fernet_key.encode())
+        raw = base64.urlsafe_b64decode(fernet_key.encode())
+        sealing_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"saytruth sealed messages v1",
+        ).derive(raw)
+        return cls(key_id, fernet, ChaCha20Poly1305(sealing_key))
+
+
+class Keyring:
+    """The active key (first) and the retired keys that can still decrypt"""
+
+    def __init__(self, keys: Sequence[MessageKey]):
+        if not keys:
+            raise ValueError("A keyring needs at least one key")
+        self.keys = tuple(keys)
+        self.active = self.keys[0]
+        self._by_id: Dict[int, MessageKey] = {}
+        for key in self.keys:
+            if key.key_id in self._by_id:
+                raise ValueError(f"Encryption key id {key.key_id} is listed twice")
+            self._by_id[key.key_id] = key
+        # Tries the keys in order, active first
+        self.fernet = MultiFernet([key.fernet for key in self.keys])
+
+    def get(self, key_id: int) -> Optional[MessageKey]:
+        return self._by_id.get(key_id)
+
+    def ids(self) -> List[int]:
+        return [key.key_id for key in self.keys]
+
+
+def parse_keys(spec: str) -> List[MessageKey]:
+    """ENCRYPTION_KEYS ("id:key,id:key", active first) to keys"""
+    keys = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key_id, separator, fernet_key = entry.partition(":")
+        if not separator or not key_id.strip().isdigit():
+            raise ValueError("ENCRYPTION_KEYS entries must look like <id>:<key>")
+        keys.append(MessageKey.from_fernet_key(int(key_id), fernet_key.strip()))
+    return keys
+
+
+def load_keyring(settings: Settings) -> Keyring:
+    if settings.encryption_keys.strip():
+        return Keyring(parse_keys(settings.encryption_keys))
+    if settings.encryption_key:
+        return Keyring([MessageKey.from_fernet_key(0, settings.encryption_key)])
+    if not settings.debug:
+        raise MissingEncryptionKey(
+            "ENCRYPTION_KEY is not set. Refusing to start: a generated key would make every "
+            "stored message unreadable. Set DEBUG=true to use a throwaway key in development."
+        )
+    print("⚠️  WARNING: Using auto-generated encryption key. Set ENCRYPTION_KEY in production!")
+    return Keyring([MessageKey.from_fernet_key(0, Fernet.generate_key().decode())])
+
+
+keyring = load_keyring(get_settings())
@@ -0,0 +1,59 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Every paged endpoint returns its next cursor in this header, absent on the last page. Routes
+# that page several lists at once send one "name=cursor" pair per list with more, comma-separated
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def page_limit(limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)) -> int:
+    return limit
+
+
+def section_cursors(cursors: Dict[str, Optional[str]]) -> Optional[str]:
+    """NEXT_CURSOR_HEADER value for several lists paged at once, e.g. "inbox=...,favorite=..." """
+    return ",".join(f"{name}={cursor}" for name, cursor in cursors.items() if cursor) or None
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor for the (created_at, id) position of the last row on a page"""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def keyset_page(query, created_col, id_col, after: Optional[str], limit: int):
+    """
+    Restrict a select to one page, newest first, strictly after `after`.
+    Fetches limit + 1 rows so split_page() can tell whether another page exists.
+    """
+    if after:
+        created_at, row_id = decode_cursor(after)
+        # Row-value comparison, so SQLite can seek the (..., created_at, id) index
+        query = query.where(tuple_(created_col, id_col) < tuple_(created_at, row_id))
+    return query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int, created_attr: str = "created_at", id_attr: str = "id"):
+    """Trim the look-ahead row and return (rows, next_cursor)"""
+    if len(rows) <= limit:
+        return list(rows), None
+    rows = list(rows[:limit])
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, created_attr), getattr(last, id_attr))
@@ -0,0 +1,343 @@
+"""
+Realtime push of new messages over Server-Sent Events.
+
+Clients open one stream per channel, "user:{id}" for a user's messages or
+"link:{id}" for a private link, and get each new message as it is
+ingested instead of polling the list endpoints.
+
+- Local delivery: publish() puts the event straight onto the queue of every
+  subscriber in this worker.
+- Cross-worker fan-out: publish() also appends the event to push_events in
+  the shared cache file (see app.core.cache). Every worker polls that table
+  every push_poll_interval_ms and delivers rows published by the others.
+  The log holds the sealed ciphertext, never the plaintext; the receiving
+  worker decrypts it.
+- Backpressure: each connection has a bounded queue. A client that falls
+  push_queue_depth events behind gets a "resync" event and is closed.
+  It should reconnect and refetch, which costs a 304 when nothing else
+  changed.
+- Limits: at most push_max_connections streams per worker and
+  push_max_connections_per_channel per channel. Streams end after
+  push_max_stream_s so long-lived connections rebalance across workers and
+  never hold up a shutdown for long; EventSource reconnects on its own.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from app.core.cache import default_cache_path
+from app.core.config import get_settings
+from app.core.security import decrypt_batch
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS push_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    origin TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    event TEXT NOT NULL,
+    ciphertext BLOB NOT NULL,
+    at REAL NOT NULL
+);
+"""
+
+# Queue sentinels
+_RESYNC = object()
+_CLOSE = object()
+
+
+class HubFull(Exception):
+    """Raised when a worker or channel has no room for another stream"""
+
+
+def user_channel(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def link_channel(link_id: int) -> str:
+    return f"link:{link_id}"
+
+
+class Subscription:
+    """One open stream: a bounded queue of events for a single channel"""
+
+    def __init__(self, channel: str, depth: int):
+        self.channel = channel
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        self.overflowed = False
+
+    def deliver(self, event) -> bool:
+        """Queue an event; on overflow drop the backlog for a single resync. False once overflowed."""
+        if self.overflowed:
+            return False
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self._finish(_RESYNC)
+            return False
+
+    def close(self) -> None:
+        """End the stream with a reconnect hint (the hub is shutting down)"""
+        self._finish(_CLOSE)
+
+    def _finish(self, sentinel) -> None:
+        self.overflowed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(sentinel)
+
+
+class PushHub:
+    """In-process pub/sub for SSE streams, fanned out to other workers through the shared cache file"""
+
+    # Run the push_events purge every this many seconds
+    PURGE_INTERVAL = 30.0
+
+    def __init__(self, path: str, max_connections: int, max_per_channel: int, queue_depth: int,
+                 heartbeat: float, max_stream: float, poll_interval: float, retention: float):
+        self.path = path
+        self.max_connections = max_connections
+        self.max_per_channel = max_per_channel
+        self.queue_depth = queue_depth
+        self.heartbeat = heartbeat
+        self.max_stream = max_stream
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._channels: Dict[str, Set[Subscription]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._seen_seq = 0
+        # Metrics
+        self.connections = 0
+        self.peak_connections = 0
+        self.rejected = 0
+        self.published = 0
+        self.delivered = 0
+        self.delivered_remote = 0
+        self.resyncs = 0
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    async def start(self) -> None:
+        # One thread owns the sqlite3 connection, as in TieredCache
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="push")
+        await self._log(self._open)
+        self._seen_seq = await self._log(self._last_seq)
+        self._task = asyncio.create_task(self._poll_loop(), name="push-poll")
+
+    async def stop(self) -> None:
+        if self._executor is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for subscriptions in self._channels.values():
+            for subscription in subscriptions:
+                subscription.close()
+        await self._log(self._close)
+        executor, self._executor = self._executor, None
+        executor.shutdown(wait=False)
+
+    def subscribe(self, channel: str) -> Subscription:
+        if not self.running:
+            raise HubFull("Realtime push is not running")
+        if self.connections >= self.max_connections or len(self._channels.get(channel, ())) >= self.max_per_channel:
+            self.rejected += 1
+            raise HubFull(f"No room for another stream on {channel}")
+        subscription = Subscription(channel, self.queue_depth)
+        self._channels.setdefault(channel, set()).add(subscription)
+        self.connections += 1
+        self.peak_connections = max(self.peak_connections, self.connections)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscriptions = self._channels.get(subscription.channel)
+        if subscriptions is None or subscription not in subscriptions:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del self._channels[subscription.channel]
+        self.connections -= 1
+
+    async def publish(self, channel: str, event: dict, content: str, ciphertext: bytes) -> None:
+        """
+        Push `event` with its decrypted `content` to the channel's streams in
+        every worker. Other workers receive `ciphertext` and decrypt it
+        themselves.
+        """
+        if not self.running:
+            return
+        self.published += 1
+        self._deliver(channel, {**jsonable_encoder(event), "content": content})
+        try:
+            await self._log(self._append, channel, json.dumps(jsonable_encoder(event)), ciphertext)
+        except Exception:
+            # Local subscribers already have it; remote ones will resync on their next fetch
+            logger.exception("Failed to fan out push event for %s", channel)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        """SSE body for a subscription: events, heartbeats, and a final resync/reconnect hint"""
+        deadline = time.monotonic() + self.max_stream
+        try:
+            # EventSource reconnect delay
+            yield "retry: 3000\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    yield "event: reconnect\ndata: {}\n\n"
+                    return
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), min(self.heartbeat, remaining))
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is _CLOSE:
+                    yield "event: reconnect\ndata: {}\n\n"
+                    return
+                if event is _RESYNC:
+                    self.resyncs += 1
+                    yield "event: resync\ndata: {}\n\n"
+                    return
+                yield f"event: message\nid: {event['id']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+        finally:
+            self.unsubscribe(subscription)
+
+    def metrics(self) -> dict:
+        return {
+            "connections": self.connections,
+            "peak_connections": self.peak_connections,
+            "channels": len(self._channels),
+            "rejected": self.rejected,
+            "published": self.published,
+            "delivered": self.delivered,
+            "delivered_remote": self.delivered_remote,
+            "resyncs": self.resyncs,
+        }
+
+    def _deliver(self, channel: str, event: dict) -> int:
+        delivered = 0
+        for subscription in list(self._channels.get(channel, ())):
+            delivered += subscription.deliver(event)
+        self.delivered += delivered
+        return delivered
+
+    # --- push_events log (runs on the hub's thread) ---
+
+    def _open(self) -> None:
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Events are only useful for a few seconds; durability is not worth an fsync
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"PRAGMA busy_timeout={int(get_settings().sqlite_busy_timeout_ms)}")
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _last_seq(self) -> int:
+        return self._conn.execute("SELECT coalesce(max(seq), 0) FROM push_events").fetchone()[0]
+
+    def _append(self, channel: str, event: str, ciphertext: bytes) -> None:
+        self._conn.execute(
+            "INSERT INTO push_events (origin, channel, event, ciphertext, at) VALUES (?, ?, ?, ?, ?)",
+            (self.origin, channel, event, ciphertext, time.time())
+        )
+
+    def _since(self, seq: int) -> List[tuple]:
+        return self._conn.execute(
+            "SELECT seq, origin, channel, event, ciphertext FROM push_events WHERE seq > ? ORDER BY seq",
+            (seq,)
+        ).fetchall()
+
+    def _purge(self, before: float) -> None:
+        self._conn.execute("DELETE FROM push_events WHERE at < ?", (before,))
+
+    async def _log(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _poll_loop(self) -> None:
+        last_purge = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await self._log(self._since, self._seen_seq)
+                if rows:
+                    self._seen_seq = rows[-1][0]
+                # Only other workers' events for channels with a stream here
+                wanted = [row for row in rows if row[1] != self.origin and row[2] in self._channels]
+                if wanted:
+                    contents = await decrypt_batch([row[4] for row in wanted])
+                    for (_, _, channel, event, _), content in zip(wanted, contents):
+                        self.delivered_remote += self._deliver(channel, {**json.loads(event), "content": content})
+                if time.monotonic() - last_purge >= self.PURGE_INTERVAL:
+                    last_purge = time.monotonic()
+                    await self._log(self._purge, time.time() - self.retention)
+            except Exception:
+                logger.exception("Push fan-out poll failed")
+
+
+settings = get_settings()
+push_hub = PushHub(
+    path=default_cache_path(),
+    max_connections=settings.push_max_connections,
+    max_per_channel=settings.push_max_connections_per_channel,
+    queue_depth=settings.push_queue_depth,
+    heartbeat=settings.push_heartbeat_s,
+    max_stream=settings.push_max_stream_s,
+    poll_interval=settings.push_poll_interval_ms / 1000,
+    retention=settings.push_event_retention_s,
+)
+
+
+class _EventStreamResponse(StreamingResponse):
+    """
+    The SSE response for one subscription. The subscription is released
+    however the response ends: stream()'s own cleanup only runs once its
+    body has started, which it never does if sending the headers fails or
+    the request is cancelled first.
+    """
+
+    def __init__(self, hub: PushHub, subscription: Subscription):
+        super().__init__(
+            hub.stream(subscription),
+            media_type="text/event-stream",
+            # Proxies must pass events through as they come, not buffer them
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        self.hub = hub
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.hub.unsubscribe(self.subscription)
+
+
+def open_stream(channel: str) -> StreamingResponse:
+    """text/event-stream response for a new subscription to channel; raises HubFull"""
+    return _EventStreamResponse(push_hub, push_hub.subscribe(channel))
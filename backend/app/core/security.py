@@ -1,38 +1,294 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional
+from typing import Any, Hashable, List, Optional, Sequence, Tuple, Union
+import asyncio
 import os
 import hashlib
+import sys
+import time
+import zlib
 
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from app.core.cache import response_cache
 from app.core.config import get_settings
+from app.core.keyring import MessageKey, keyring
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-# Message encryption setup
-ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
-if not ENCRYPTION_KEY:
-    # Generate a key for development (should be set in production)
-    ENCRYPTION_KEY = Fernet.generate_key().decode()
-    print(f"⚠️  WARNING: Using auto-generated encryption key. Set ENCRYPTION_KEY in production!")
+UNAVAILABLE_CONTENT = "[Message content unavailable]"
 
-cipher = Fernet(ENCRYPTION_KEY.encode())
+# Stored message bodies come in four formats, told apart by the first byte:
+# - sealed v3 (current): 0x03 | key id (1) | codec (1) | nonce (12) | ChaCha20-Poly1305 ciphertext | tag (16),
+#   raw bytes. The three header bytes are authenticated as associated data. The codec says how the
+#   plaintext was encoded before encryption: UTF-8, or UTF-8 then raw deflate for longer bodies.
+# - sealed v2: 0x02 | key id | nonce | ciphertext | tag, always UTF-8.
+# - sealed v1: 0x01 | nonce | ciphertext | tag, from before keys had ids; every key is tried.
+# - Fernet token (legacy): base64 text, always starting with "g" (version 0x80). Decrypted with MultiFernet.
+Ciphertext = Union[bytes, str]
 
+_SEALED_V1 = b"\x01"
+_SEALED_V2 = b"\x02"
+_SEALED_V3 = b"\x03"
+_NONCE_SIZE = 12
 
-def encrypt_message(content: str) -> str:
-    """Encrypt message content for storage"""
-    return cipher.encrypt(content.encode()).decode()
+# Plaintext codecs (sealed v3)
+_CODEC_UTF8 = 0
+_CODEC_DEFLATE = 1
+# Largest plaintext a body may inflate to: MessageCreate/LinkMessageCreate allow 5000 characters,
+# at most 4 bytes each in UTF-8. Anything that would inflate further is treated as corrupt.
+_MAX_PLAINTEXT_BYTES = 5000 * 4
 
+_settings = get_settings()
+_decrypt_pool = ThreadPoolExecutor(max_workers=_settings.decrypt_workers, thread_name_prefix="decrypt")
 
-def decrypt_message(encrypted_content: str) -> str:
-    """Decrypt message content for reading"""
+
+def sealed_header(key: MessageKey) -> bytes:
+    """The first bytes of every body sealed with `key` (the codec byte follows)"""
+    return _SEALED_V3 + bytes([key.key_id])
+
+
+def _encode(content: str) -> Tuple[int, bytes]:
+    """(codec, payload) for a plaintext: deflated when that is worth it, otherwise UTF-8"""
+    payload = content.encode()
+    # Each body is compressed on its own and comes from a single sender, so the
+    # compressed length reveals nothing about anyone else's text
+    if _settings.message_compress_min_bytes <= len(payload) <= _MAX_PLAINTEXT_BYTES:
+        deflater = zlib.compressobj(_settings.message_compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        compressed = deflater.compress(payload) + deflater.flush()
+        if len(compressed) < len(payload):
+            return _CODEC_DEFLATE, compressed
+    return _CODEC_UTF8, payload
+
+
+def _decode(codec: int, payload: bytes) -> str:
+    """Plaintext from an opened payload; UNAVAILABLE_CONTENT for an unknown codec or a body that inflates too far"""
+    if codec == _CODEC_DEFLATE:
+        inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        try:
+            payload = inflater.decompress(payload, _MAX_PLAINTEXT_BYTES)
+        except zlib.error:
+            return UNAVAILABLE_CONTENT
+        # Output stops at _MAX_PLAINTEXT_BYTES: input left over means the body is larger than allowed,
+        # and a body we sealed ends exactly where its deflate stream does
+        if inflater.unconsumed_tail or not inflater.eof or inflater.unused_data:
+            return UNAVAILABLE_CONTENT
+    elif codec != _CODEC_UTF8:
+        return UNAVAILABLE_CONTENT
+    try:
+        return payload.decode()
+    except UnicodeDecodeError:
+        return UNAVAILABLE_CONTENT
+
+
+def seal_message(content: str) -> bytes:
+    """Encrypt message content for storage, with the active key"""
+    key = keyring.active
+    codec, payload = _encode(content)
+    header = sealed_header(key) + bytes([codec])
+    # Random 96-bit nonces stay within the usual 2**32 messages-per-key bound
+    nonce = os.urandom(_NONCE_SIZE)
+    return header + nonce + key.aead.encrypt(nonce, payload, header)
+
+
+def is_sealed(ciphertext: Ciphertext) -> bool:
+    return isinstance(ciphertext, bytes) and ciphertext[:1] in (_SEALED_V3, _SEALED_V2, _SEALED_V1)
+
+
+def storage_format(ciphertext: Ciphertext) -> str:
+    """A stored body's format for reports: fernet, v1, v2, v3 or v3+deflate"""
+    if not is_sealed(ciphertext):
+        return "fernet"
+    if ciphertext[:1] == _SEALED_V3:
+        return "v3+deflate" if ciphertext[2:3] == bytes([_CODEC_DEFLATE]) else "v3"
+    return "v2" if ciphertext[:1] == _SEALED_V2 else "v1"
+
+
+def _open(key: MessageKey, header: bytes, body: bytes) -> Optional[bytes]:
+    try:
+        return key.aead.decrypt(body[:_NONCE_SIZE], body[_NONCE_SIZE:], header)
+    except (InvalidTag, ValueError):
+        return None
+
+
+def _open_sealed(sealed: bytes) -> str:
+    if sealed[:1] == _SEALED_V1:
+        for key in keyring.keys:
+            payload = _open(key, _SEALED_V1, sealed[1:])
+            if payload is not None:
+                return _decode(_CODEC_UTF8, payload)
+        return UNAVAILABLE_CONTENT
+    header_size = 3 if sealed[:1] == _SEALED_V3 else 2
+    key = keyring.get(sealed[1]) if len(sealed) >= header_size else None
+    payload = _open(key, sealed[:header_size], sealed[header_size:]) if key is not None else None
+    if payload is None:
+        return UNAVAILABLE_CONTENT
+    return _decode(sealed[2] if header_size == 3 else _CODEC_UTF8, payload)
+
+
+def decrypt_messages(ciphertexts: Sequence[Ciphertext]) -> List[str]:
+    """
+    Decrypt stored message bodies in any format, under any key in the
+    keyring; anything that fails to authenticate or decode becomes
+    UNAVAILABLE_CONTENT.
+    """
+    return [_open_sealed(c) if is_sealed(c) else _decrypt_token(c) for c in ciphertexts]
+
+
+def _decrypt_token(encrypted_content: Ciphertext) -> str:
+    """A legacy Fernet token, with MultiFernet over the keyring"""
     try:
-        return cipher.decrypt(encrypted_content.encode()).decode()
-    except Exception:
-        # If decryption fails, return placeholder (corrupted data)
-        return "[Message content unavailable]"
+        return keyring.fernet.decrypt(encrypted_content).decode()
+    except (InvalidToken, UnicodeDecodeError):
+        return UNAVAILABLE_CONTENT
+
+
+class DecryptedContentCache:
+    """
+    In-memory LRU of decrypted message content, capped by total bytes.
+
+    Keys are caller-chosen (e.g. ("message", id)); each entry also stores a
+    digest of the ciphertext it was decrypted from, so a re-encrypted or
+    reused row id is a miss rather than stale plaintext. Entries optionally
+    expire after ttl seconds. Only touched from the event loop, so no lock.
+    """
+
+    # Rough per-entry cost of the key, tuple and OrderedDict node
+    ENTRY_OVERHEAD = 200
+
+    def __init__(self, max_bytes: int, ttl: float = 0.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.bytes = 0
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def digest(encrypted_content: Ciphertext) -> bytes:
+        if isinstance(encrypted_content, str):
+            encrypted_content = encrypted_content.encode()
+        return hashlib.blake2b(encrypted_content, digest_size=16).digest()
+
+    def get(self, key: Hashable, encrypted_content: Ciphertext) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        digest, plaintext, size, expires_at = entry
+        if expires_at and expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        if digest != self.digest(encrypted_content):
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return plaintext
+
+    def put(self, key: Hashable, encrypted_content: Ciphertext, plaintext: str) -> None:
+        size = sys.getsizeof(plaintext) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        self._remove(key)
+        expires_at = time.monotonic() + self.ttl if self.ttl else 0.0
+        self._entries[key] = (self.digest(encrypted_content), plaintext, size, expires_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            if self._remove(key):
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, key: Hashable) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.bytes -= entry[2]
+        return True
+
+
+decrypted_cache = DecryptedContentCache(
+    max_bytes=_settings.decrypt_cache_max_bytes,
+    ttl=_settings.decrypt_cache_ttl_s,
+)
+
+
+def message_cache_key(message_id: int) -> tuple:
+    return ("message", message_id)
+
+
+def link_message_cache_key(message_id: int) -> tuple:
+    return ("link_message", message_id)
+
+
+async def decrypt_batch(
+    encrypted_contents: Sequence[Ciphertext],
+    cache_keys: Optional[Sequence[Hashable]] = None,
+) -> List[str]:
+    """
+    decrypt_messages() for request handlers. Small batches run inline; large
+    ones are split into chunks on the decrypt thread pool so a big page does
+    not hold the event loop for its whole duration.
+
+    With cache_keys (one per ciphertext), plaintexts come from
+    decrypted_cache where possible and only the misses are decrypted.
+    """
+    if cache_keys is None:
+        return await _decrypt_uncached(encrypted_contents)
+
+    plaintexts = [decrypted_cache.get(key, content) for key, content in zip(cache_keys, encrypted_contents)]
+    missing = [i for i, plaintext in enumerate(plaintexts) if plaintext is None]
+    if missing:
+        decrypted = await _decrypt_uncached([encrypted_contents[i] for i in missing])
+        for i, plaintext in zip(missing, decrypted):
+            plaintexts[i] = plaintext
+            if plaintext is not UNAVAILABLE_CONTENT:
+                decrypted_cache.put(cache_keys[i], encrypted_contents[i], plaintext)
+    return plaintexts
+
+
+async def _decrypt_uncached(encrypted_contents: Sequence[Ciphertext]) -> List[str]:
+    threshold = _settings.decrypt_parallel_threshold
+    if len(encrypted_contents) < threshold:
+        return decrypt_messages(encrypted_contents)
+    loop = asyncio.get_running_loop()
+    chunks = [encrypted_contents[i:i + threshold] for i in range(0, len(encrypted_contents), threshold)]
+    results = await asyncio.gather(*(loop.run_in_executor(_decrypt_pool, decrypt_messages, chunk) for chunk in chunks))
+    return [plaintext for chunk in results for plaintext in chunk]
 
 
 def _preprocess_for_bcrypt(password: str) -> str:
@@ -55,19 +311,118 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(preprocessed)
 
 
-def create_access_token(subject: str, expires_delta: timedelta | None = None) -> str:
+def create_access_token(subject: str, expires_delta: timedelta | None = None, claims: Optional[dict] = None) -> str:
     settings = get_settings()
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
-    to_encode: dict[str, Any] = {"sub": subject, "exp": expire}
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=settings.access_token_expire_minutes))
+    to_encode: dict[str, Any] = {**(claims or {}), "sub": subject, "iat": now.timestamp(), "exp": expire}
     return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
+USER_CLAIMS = ("username", "name", "language", "created_at")
 
-def decode_access_token(token: str) -> Optional[str]:
+
+def user_claims(user) -> dict:
+    """User fields carried in the access token, so authenticated requests need no user lookup"""
+    return {
+        "username": user.username,
+        "name": user.name,
+        "language": user.language,
+        "created_at": user.created_at.isoformat() if user.created_at else None,
+        # users.profile_version: a token whose fields are out of date is caught on its next verification
+        "ver": user.profile_version,
+    }
+
+
+def decode_access_token_claims(token: str) -> Optional[dict]:
     settings = get_settings()
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        user_id: str = payload.get("sub")
-        return user_id
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
     except JWTError:
         return None
+
+
+def decode_access_token(token: str) -> Optional[str]:
+    claims = decode_access_token_claims(token)
+    if claims is None:
+        return None
+    user_id: str = claims.get("sub")
+    return user_id
+
+
+class VerifiedTokenCache:
+    """
+    Short-TTL cache of bearer token -> verified claims.
+
+    Saves the JWT signature check on repeat requests with the same token.
+    Entries never outlive the token's own exp. invalidate_user() drops a
+    user's cached tokens, so their next request checks the token's user
+    version against the database again (see get_current_user).
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tokens_by_user: dict = {}
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, claims: dict) -> None:
+        expires_at = min(time.time() + self.ttl, float(claims.get("exp", 0)))
+        self._remove(token)
+        self._entries[token] = (claims, expires_at)
+        self._tokens_by_user.setdefault(claims.get("sub"), set()).add(token)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id) -> None:
+        for token in list(self._tokens_by_user.get(str(user_id), ())):
+            self._remove(token)
+        self.invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[0].get("sub")
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+
+token_cache = VerifiedTokenCache(
+    max_entries=_settings.token_cache_max_entries,
+    ttl=_settings.token_cache_ttl_s,
+)
+
+
+# A change to a user handled by any worker invalidates its tokens' cached claims here too
+response_cache.subscribe("user:", lambda tag: token_cache.invalidate_user(tag.split(":", 1)[1]))
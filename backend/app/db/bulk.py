@@ -0,0 +1,49 @@
+"""
+Set-based bulk mutations of messages and link messages.
+
+Each call is one UPDATE or DELETE, however many rows it touches. Ownership
+is part of the WHERE clause, so ids that belong to someone else are simply
+not matched, and no row is loaded into the session. The triggers keep the
+counters, change log and versions in step, row by row, within the same
+statement.
+"""
+from typing import List, Optional, Sequence
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.models import MessageStatus
+
+DELETE = "delete"
+MOVE = "move"
+
+
+async def bulk_mutate(
+    db: AsyncSession,
+    model,
+    owner_clause,
+    action: str,
+    to: Optional[str] = None,
+    ids: Optional[Sequence[int]] = None,
+    section: Optional[str] = None,
+) -> List[int]:
+    """
+    Delete `model` rows matching owner_clause, or move them to section `to`:
+    the listed ids, or every row in `section`. Returns the ids affected
+    (RETURNING, not a load). Rows already in `to` are left alone. The
+    caller commits.
+    """
+    where = [owner_clause]
+    if ids is not None:
+        where.append(model.id.in_(ids))
+    if section is not None:
+        where.append(model.status == MessageStatus(section))
+
+    if action == DELETE:
+        statement = delete(model)
+    else:
+        target = MessageStatus(to)
+        where.append(model.status != target)
+        statement = update(model).values(status=target)
+    statement = statement.where(*where).returning(model.id).execution_options(synchronize_session=False)
+    return list((await db.scalars(statement)).all())
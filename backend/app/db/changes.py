@@ -0,0 +1,89 @@
+"""
+Delta sync over the change log.
+
+Triggers (migration 5) append a row to `changes` for every insert, status
+change and delete of a message or link message. The row goes in with the
+change itself, so the log can never disagree with the data. seq is an
+AUTOINCREMENT key, so it is gap-free and never reused.
+
+A client keeps the next_since of its last sync and asks only for what came
+after it. Several changes to one row collapse into the latest, so a sync
+costs the rows that changed, not the whole list. Compaction (see
+app.db.retention) drops the oldest entries. A client whose `since` falls
+before the oldest kept entry gets ChangesExpired and must refetch the full
+list, then carry on from the head seq.
+"""
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import is_sqlite
+from app.models.models import Change, ChangeOp, ChangeStream
+
+
+class ChangesExpired(Exception):
+    """`since` is older than the change log (compacted, or no log on this database)"""
+
+
+@dataclass
+class ChangePage:
+    # (seq, row id, op) of the latest change to each row, oldest first
+    changes: List[Tuple[int, int, ChangeOp]] = field(default_factory=list)
+    next_since: int = 0
+    has_more: bool = False
+
+
+async def head_seq(db: AsyncSession) -> int:
+    """seq of the newest change ever logged (0 for none)"""
+    seq = await db.scalar(text("SELECT seq FROM sqlite_sequence WHERE name = 'changes'"))
+    return seq or 0
+
+
+async def compacted_through(db: AsyncSession) -> int:
+    """Every seq up to this one has been compacted away"""
+    oldest = await db.scalar(select(func.min(Change.seq)))
+    return oldest - 1 if oldest is not None else await head_seq(db)
+
+
+async def read_changes(db: AsyncSession, stream: ChangeStream, owner_id: int,
+                       since: Optional[int], limit: int) -> ChangePage:
+    """
+    Up to `limit` log entries for one owner after `since`, collapsed to the
+    latest per row. With since=None, only the current head: a client asks
+    for it before fetching the full list, then syncs from it.
+    """
+    if not is_sqlite:
+        # No triggers, no log: every sync becomes a full refetch
+        raise ChangesExpired("The change log is not available on this database")
+    # Each statement may see a newer snapshot than the last, so bound the
+    # read by a head taken first (nothing at or below it can appear later)
+    # and check compaction after reading (entries that were read are complete)
+    head = await head_seq(db)
+    if since is None:
+        return ChangePage(next_since=head)
+
+    rows = (await db.execute(
+        select(Change.seq, Change.row_id, Change.op)
+        .where(Change.stream == stream, Change.owner_id == owner_id, Change.seq > since, Change.seq <= head)
+        .order_by(Change.seq)
+        .limit(limit + 1)
+    )).all()
+    if since < await compacted_through(db):
+        raise ChangesExpired(f"Changes after {since} have been compacted")
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        # Nothing new for this owner; skip past everyone else's changes too
+        return ChangePage(next_since=max(since, head))
+
+    latest = {}
+    for seq, row_id, op in rows:
+        latest.pop(row_id, None)
+        latest[row_id] = (seq, row_id, op)
+    return ChangePage(
+        changes=list(latest.values()),
+        next_since=rows[-1].seq if has_more else head,
+        has_more=has_more,
+    )
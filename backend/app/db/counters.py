@@ -0,0 +1,142 @@
+"""
+Per-section message counts for badges.
+
+message_counts (per receiver) and link_message_counts (per link) are kept
+current by triggers (migration 6). Every insert, status move and delete
+adjusts them in the same transaction. That includes the ingestor,
+delete_all_in_section, delete_link and retention. Reading a badge is then
+one primary-key lookup. If the counts ever drift (a bulk edit made with
+the triggers dropped, a restored backup), recompute them from the
+messages:
+
+Usage:
+    python -m app.db.counters            # report owners whose counts are wrong
+    python -m app.db.counters --repair   # recompute them
+"""
+import argparse
+import sys
+from typing import Dict, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import engine, is_sqlite
+from app.models.models import LinkMessage, LinkMessageCounts, Message, MessageCounts, MessageStatus
+
+SECTIONS = tuple(status.value for status in MessageStatus)
+
+# counts table -> (its owner key, the message table's owner column, the message table's status column)
+_COUNTED = {
+    MessageCounts: (MessageCounts.user_id, Message.receiver_id, Message.status),
+    LinkMessageCounts: (LinkMessageCounts.link_id, LinkMessage.link_id, LinkMessage.status),
+}
+
+
+async def _stored_counts(db: AsyncSession, table, owner_id: int) -> Dict[str, int]:
+    key = _COUNTED[table][0]
+    row = (await db.execute(
+        select(*(table.__table__.c[section] for section in SECTIONS)).where(key == owner_id)
+    )).first()
+    return _as_dict(row)
+
+
+def _as_dict(row) -> Dict[str, int]:
+    counts = {section: (getattr(row, section) if row is not None else 0) for section in SECTIONS}
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+async def _live_counts(db: AsyncSession, owner_column, status_column, owner_id: int) -> Dict[str, int]:
+    """Without the triggers (not SQLite), count on the (owner, status, ...) index instead"""
+    rows = (await db.execute(
+        select(status_column, func.count()).where(owner_column == owner_id).group_by(status_column)
+    )).all()
+    counts = {section: 0 for section in SECTIONS}
+    counts.update({status.value: count for status, count in rows})
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+async def message_counts(db: AsyncSession, user_id: int) -> Dict[str, int]:
+    """{"inbox", "public", "favorite", "total"} for a receiver"""
+    if not is_sqlite:
+        return await _live_counts(db, Message.receiver_id, Message.status, user_id)
+    return await _stored_counts(db, MessageCounts, user_id)
+
+
+async def link_message_counts(db: AsyncSession, link_id: int) -> Dict[str, int]:
+    """{"inbox", "public", "favorite", "total"} for a link"""
+    if not is_sqlite:
+        return await _live_counts(db, LinkMessage.link_id, LinkMessage.status, link_id)
+    return await _stored_counts(db, LinkMessageCounts, link_id)
+
+
+def _drift(conn: Connection, table) -> Dict[int, Tuple[int, ...]]:
+    """Owners whose stored counts differ from the messages, with the correct counts"""
+    key, owner_column, status_column = _COUNTED[table]
+    expected: Dict[int, list] = {}
+    for owner_id, status, count in conn.execute(
+        select(owner_column, status_column, func.count()).group_by(owner_column, status_column)
+    ):
+        expected.setdefault(owner_id, [0] * len(SECTIONS))[SECTIONS.index(status.value)] = count
+
+    stored = {
+        row[0]: tuple(row[1:])
+        for row in conn.execute(select(key, *(table.__table__.c[section] for section in SECTIONS)))
+    }
+    zeros = (0,) * len(SECTIONS)
+    drift = {}
+    for owner_id in expected.keys() | stored.keys():
+        correct = tuple(expected.get(owner_id, zeros))
+        if stored.get(owner_id, zeros) != correct:
+            drift[owner_id] = correct
+    return drift
+
+
+def sync_counts(conn: Connection) -> Dict[str, int]:
+    """Rewrite every wrong count inside the caller's transaction; returns owners fixed per table"""
+    fixed = {}
+    for table in _COUNTED:
+        key = _COUNTED[table][0]
+        drift = _drift(conn, table)
+        if drift:
+            conn.execute(delete(table).where(key.in_(list(drift))))
+            conn.execute(insert(table), [
+                {key.key: owner_id, **dict(zip(SECTIONS, counts))} for owner_id, counts in drift.items()
+            ])
+        fixed[table.__tablename__] = len(drift)
+    return fixed
+
+
+def check_counters(bind: Engine = engine) -> Dict[str, int]:
+    """Owners with wrong counts per table, without changing anything"""
+    with bind.connect() as conn:
+        return {table.__tablename__: len(_drift(conn, table)) for table in _COUNTED}
+
+
+def repair_counters(bind: Engine = engine) -> Dict[str, int]:
+    """Recompute counts from the messages in one transaction (writers wait for it)"""
+    with bind.begin() as conn:
+        return sync_counts(conn)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check or rebuild SayTruth message counters")
+    parser.add_argument("--repair", action="store_true", help="recompute wrong counts from the messages")
+    args = parser.parse_args(argv)
+
+    if args.repair:
+        fixed = repair_counters(engine)
+        for table, owners in fixed.items():
+            print(f"🔧 {table}: fixed {owners} owners")
+        return 0
+
+    drift = check_counters(engine)
+    for table, owners in drift.items():
+        print(f"{'❌' if owners else '✅'} {table}: {owners} owners with wrong counts")
+    return 1 if any(drift.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
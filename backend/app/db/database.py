@@ -1,5 +1,8 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import get_settings
 
@@ -7,6 +10,98 @@ settings = get_settings()
 is_sqlite = settings.database_url.startswith("sqlite")
 connect_args = {"check_same_thread": False} if is_sqlite else {}
 
+
+def to_async_url(database_url: str) -> str:
+    """Map a sync database URL onto its asyncio driver (sqlite -> aiosqlite)"""
+    if database_url.startswith("sqlite:"):
+        return database_url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    return database_url
+
+
+def apply_sqlite_pragmas(dbapi_connection, read_only: bool = False) -> None:
+    """Apply the configured SQLite profile to a freshly opened connection"""
+    cursor = dbapi_connection.cursor()
+    try:
+        if not read_only:
+            # auto_vacuum only takes effect before the first table is created
+            # (existing files need a one-off VACUUM, see app.db.retention)
+            cursor.execute(f"PRAGMA auto_vacuum={settings.sqlite_auto_vacuum}")
+            # journal_mode is persistent per database file, so only the writer sets it
+            cursor.execute(f"PRAGMA journal_mode={settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size={int(settings.sqlite_cache_size)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA foreign_keys={'ON' if settings.sqlite_foreign_keys else 'OFF'}")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+    finally:
+        cursor.close()
+
+
+def _install_sqlite_profile(target_engine, read_only: bool = False) -> None:
+    @event.listens_for(target_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, read_only=read_only)
+
+
+# Sync engine: used by CLI tooling such as init_db
 engine = create_engine(settings.database_url, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engines: used by the request handlers so queries never block the event loop.
+# On SQLite all writes go through a single pooled writer connection (so concurrent
+# writers queue in the pool instead of failing with "database is locked"), while
+# GET routes use a separate pool of read-only connections that WAL lets run
+# alongside the writer.
+if is_sqlite:
+    _install_sqlite_profile(engine)
+    async_engine = create_async_engine(
+        to_async_url(settings.database_url),
+        connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=settings.sqlite_write_pool_timeout,
+    )
+    _install_sqlite_profile(async_engine.sync_engine)
+    async_read_engine = create_async_engine(
+        to_async_url(settings.database_url),
+        connect_args=connect_args,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=0,
+    )
+    _install_sqlite_profile(async_read_engine.sync_engine, read_only=True)
+else:
+    async_engine = create_async_engine(to_async_url(settings.database_url), connect_args=connect_args)
+    async_read_engine = async_engine
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+class ReadOnlySession(Session):
+    """
+    Session for the read pool. GET routes read Core rows (see app.db.reads),
+    but an ORM object loaded here and then changed, e.g. by decrypting onto
+    it, must never be written back: flushing it raises instead.
+    """
+
+    def flush(self, objects=None) -> None:
+        if self.new or self.dirty or self.deleted:
+            raise InvalidRequestError("Read-only session: changes must go through get_db()")
+        super().flush(objects)
+
+
+AsyncReadSessionLocal = async_sessionmaker(
+    bind=async_read_engine,
+    sync_session_class=ReadOnlySession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
@@ -0,0 +1,142 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import select, update
+
+from app.core.config import get_settings
+from app.db.database import AsyncSessionLocal
+from app.models.models import Link, LinkStatus
+
+logger = logging.getLogger(__name__)
+
+# How many upcoming expiry times to keep in memory at once
+HEAP_RELOAD_SIZE = 1000
+
+
+class LinkExpiryScheduler:
+    """
+    Background sweeper that retires expired links.
+
+    Keeps a min-heap of upcoming expires_at values and sleeps until the
+    earliest one (or at most max_interval, which also catches links created
+    by other workers). Only the worker holding the job lock runs it (see
+    app.db.jobs); in the others schedule() is a no-op. Each sweep is a single bulk
+    UPDATE links SET status='deleted' WHERE expires_at <= now, so request
+    handlers never have to write to expire links themselves.
+    """
+
+    def __init__(self, session_factory, max_interval: float):
+        self.session_factory = session_factory
+        self.max_interval = max_interval
+        self._heap: List[datetime] = []
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # Metrics
+        self.sweeps = 0
+        self.rows_expired = 0
+        self.last_sweep_rows = 0
+        self.last_sweep_ms = 0.0
+        self.total_sweep_ms = 0.0
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="link-expiry")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def schedule(self, expires_at: Optional[datetime]) -> None:
+        """Register a new link's expiry; wakes the sweeper if it is the earliest"""
+        if expires_at is None or self._task is None:
+            return
+        earliest = not self._heap or expires_at < self._heap[0]
+        heapq.heappush(self._heap, expires_at)
+        if earliest:
+            self._wakeup.set()
+
+    async def sweep(self) -> int:
+        """Retire every link whose expiry has passed; returns the number of rows changed"""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(Link)
+                .where(
+                    Link.expires_at.isnot(None),
+                    Link.expires_at <= now,
+                    Link.status != LinkStatus.deleted
+                )
+                .values(status=LinkStatus.deleted)
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+            while self._heap and self._heap[0] <= now:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                upcoming = await db.scalars(
+                    select(Link.expires_at)
+                    .where(Link.expires_at > now, Link.status == LinkStatus.active)
+                    .order_by(Link.expires_at)
+                    .limit(HEAP_RELOAD_SIZE)
+                )
+                self._heap = list(upcoming)
+                heapq.heapify(self._heap)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.sweeps += 1
+        self.rows_expired += result.rowcount
+        self.last_sweep_rows = result.rowcount
+        self.last_sweep_ms = elapsed_ms
+        self.total_sweep_ms += elapsed_ms
+        if result.rowcount:
+            logger.info("Expired %d links in %.1f ms", result.rowcount, elapsed_ms)
+        return result.rowcount
+
+    def metrics(self) -> dict:
+        return {
+            "sweeps": self.sweeps,
+            "rows_expired": self.rows_expired,
+            "last_sweep_rows": self.last_sweep_rows,
+            "last_sweep_ms": round(self.last_sweep_ms, 3),
+            "avg_sweep_ms": round(self.total_sweep_ms / self.sweeps, 3) if self.sweeps else 0.0,
+            "scheduled": len(self._heap),
+        }
+
+    def _seconds_until_next(self) -> float:
+        if not self._heap:
+            return self.max_interval
+        delay = (self._heap[0] - datetime.utcnow()).total_seconds()
+        return min(max(delay, 0.0), self.max_interval)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception:
+                logger.exception("Link expiry sweep failed")
+            # Sleep until the earliest expiry is due; schedule() wakes us to re-plan
+            while True:
+                delay = self._seconds_until_next()
+                if delay <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    break
+                self._wakeup.clear()
+
+
+settings = get_settings()
+link_expiry = LinkExpiryScheduler(AsyncSessionLocal, max_interval=settings.link_expiry_max_interval_s)
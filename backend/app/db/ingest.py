@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.core.config import get_settings
+from app.db.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept another row"""
+
+
+class MessageIngestor:
+    """
+    Group-commit writer for anonymous message ingestion.
+
+    Endpoints hand over already-encrypted ORM rows with submit(). A single
+    background task collects them into batches (up to batch_size rows or
+    flush_interval seconds after the first row, whichever comes first) and
+    inserts each batch in one transaction, so a burst of N messages costs one
+    commit instead of N. submit() only returns once the row's batch has
+    committed, with id and created_at populated.
+    """
+
+    def __init__(self, session_factory, batch_size: int, flush_interval: float, queue_depth: int):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_depth = queue_depth
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_depth)
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name="message-ingestor")
+
+    async def stop(self) -> None:
+        """Stop accepting rows, flush what is queued, then stop the writer"""
+        if self._task is None:
+            return
+        self._closing = True
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def submit(self, row):
+        """Queue a row for insertion and wait until its batch has committed"""
+        if self._task is None or self._closing:
+            raise IngestQueueFull("Message ingestion is not running")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((row, future))
+        except asyncio.QueueFull:
+            raise IngestQueueFull("Message ingestion queue is full") from None
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _commit(self, batch: list) -> None:
+        try:
+            async with self.session_factory() as db:
+                db.add_all([row for row, _ in batch])
+                await db.commit()
+        except Exception as exc:
+            if len(batch) == 1:
+                row, future = batch[0]
+                logger.exception("Failed to insert %s", type(row).__name__)
+                if not future.done():
+                    future.set_exception(exc)
+                return
+            # One bad row (e.g. its link was deleted meanwhile) must not sink the
+            # whole batch: retry the rows one transaction each. Rows the failed flush
+            # already inserted keep the ids it assigned; the rollback freed those ids
+            # for other writers, so each retry must get a fresh one.
+            for row, _ in batch:
+                row.id = None
+            for item in batch:
+                await self._commit([item])
+            return
+
+        for row, future in batch:
+            if not future.done():
+                future.set_result(row)
+
+
+settings = get_settings()
+message_ingestor = MessageIngestor(
+    AsyncSessionLocal,
+    batch_size=settings.ingest_batch_size,
+    flush_interval=settings.ingest_flush_interval_ms / 1000,
+    queue_depth=settings.ingest_queue_depth,
+)
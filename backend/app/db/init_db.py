@@ -1,10 +1,12 @@
 from app.db.database import Base, engine
+from app.db.migrate import run_migrations
 # Import models so metadata is registered before creating tables
 import app.models.models  # noqa: F401
 
 
 def init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
 
 
 if __name__ == "__main__":
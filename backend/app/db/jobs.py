@@ -0,0 +1,84 @@
+"""
+One runner for the background jobs.
+
+Every uvicorn worker runs the app's lifespan, so without coordination each
+worker would start its own link expiry sweeper, retention pass and reseal
+pass against the same database. These jobs only need one copy. At startup
+each worker tries to take an exclusive lock on a file next to the SQLite
+database (saytruth-jobs.lock). The worker that gets it runs the jobs and
+the others skip them. The OS drops the lock when that process exits, so
+the worker uvicorn starts in its place takes over.
+
+A SQLite file can only be shared by processes on one host, so a file lock
+reaches every process that uses the database. For other databases, or
+where fcntl is unavailable, every process runs the jobs. BACKGROUND_JOBS=false
+turns them off in a process entirely, e.g. for extra API-only containers.
+"""
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from sqlalchemy.engine import make_url
+
+from app.core.config import get_settings
+
+try:
+    import fcntl
+except ImportError:  # not POSIX
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def default_lock_path() -> Optional[str]:
+    """Next to the SQLite database (e.g. saytruth-jobs.lock); None when there is no database file"""
+    url = make_url(get_settings().database_url)
+    if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+        database = Path(url.database)
+        return str(database.with_name(f"{database.stem}-jobs.lock"))
+    return None
+
+
+class JobRunnerLock:
+    """Decides, once per process, whether this process runs the background jobs"""
+
+    def __init__(self, path: Optional[str], enabled: bool):
+        self.path = path
+        self.enabled = enabled
+        self.held = False
+        self._fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        """True if this process should run the background jobs"""
+        if not self.enabled:
+            return False
+        if self.path is None or fcntl is None:
+            self.held = True
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # Another worker runs them
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        self.held = True
+        logger.info("Running background jobs in this worker (pid %d)", os.getpid())
+        return True
+
+    def release(self) -> None:
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self.held = False
+
+    def metrics(self) -> dict:
+        return {"enabled": self.enabled, "runs_jobs": self.held, "pid": os.getpid()}
+
+
+job_runner = JobRunnerLock(default_lock_path(), enabled=get_settings().background_jobs)
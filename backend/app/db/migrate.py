@@ -0,0 +1,527 @@
+"""
+Versioned schema migrations.
+
+create_all() only creates missing tables, so anything that changes an
+existing table (indexes, constraints, columns, triggers) is shipped as a
+numbered migration here. Applied versions are recorded in the
+schema_migrations table and each migration runs in its own transaction.
+
+Migrations also run right after create_all() on a brand-new database, so
+every migration must be safe to apply to a schema that already matches the
+current models (use IF NOT EXISTS / IF EXISTS, check before altering).
+
+Usage:
+    python -m app.db.migrate                 # create tables, apply pending migrations
+    python -m app.db.migrate --check-plans   # also fail if a hot query scans a table
+
+CI runs the query plan check on a freshly migrated database
+(tests/test_query_plans.py), so a migration or model change that drops an
+index a hot query relies on fails the build.
+"""
+import argparse
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    func,
+    insert,
+    inspect,
+    literal_column,
+    select,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.pagination import encode_cursor, keyset_page
+from app.db.counters import sync_counts
+from app.db.database import Base, engine
+from app.db.search import users_fts
+from app.models.models import (
+    Change,
+    ChangeStream,
+    Follow,
+    Link,
+    LinkMessage,
+    LinkMessageCounts,
+    LinkStatus,
+    Message,
+    MessageCounts,
+    MessageStatus,
+    ResealCheckpoint,
+    User,
+)
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register an upgrade function as schema version `version`"""
+    def decorator(fn: Callable[[Connection], None]) -> Callable[[Connection], None]:
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return decorator
+
+
+# ============ Migrations ============
+
+@migration(1, "Composite indexes for hot queries and unique follow pairs")
+def _composite_indexes(conn: Connection) -> None:
+    # Drop duplicate follow rows (keep the oldest) before enforcing uniqueness
+    conn.exec_driver_sql(
+        "DELETE FROM follows WHERE id NOT IN "
+        "(SELECT MIN(id) FROM follows GROUP BY follower_id, following_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_follows_follower_following "
+        "ON follows (follower_id, following_id)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_receiver_status_created "
+        "ON messages (receiver_id, status, created_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_link_messages_link_created "
+        "ON link_messages (link_id, created_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_links_user_status_created "
+        "ON links (user_id, status, created_at)"
+    )
+    # Single-column indexes that are now a prefix of a composite one
+    for index_name in (
+        "ix_messages_receiver_id",
+        "ix_link_messages_link_id",
+        "ix_links_user_id",
+        "ix_follows_follower_id",
+    ):
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index_name}")
+
+
+@migration(2, "Keyset pagination: uniform timestamps and (owner, created_at) indexes")
+def _keyset_pagination(conn: Connection) -> None:
+    if conn.dialect.name == "sqlite":
+        # SQLite stores DateTime as text. server_default rows look like
+        # '2026-01-01 10:00:00' while rows written by SQLAlchemy carry
+        # microseconds, and the two forms do not compare correctly as strings.
+        # Rewrite the short form so (created_at, id) cursors compare exactly.
+        for table in ("users", "messages", "links", "link_messages", "follows"):
+            conn.exec_driver_sql(
+                f"UPDATE {table} SET created_at = strftime('%Y-%m-%d %H:%M:%f', created_at) || '000' "
+                "WHERE length(created_at) = 19"
+            )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_messages_receiver_created "
+        "ON messages (receiver_id, created_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_follows_follower_created "
+        "ON follows (follower_id, created_at)"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_follows_following_created "
+        "ON follows (following_id, created_at)"
+    )
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_follows_following_id")
+
+
+@migration(3, "FTS5 trigram index for user search")
+def _users_fts(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_users_username_lower ON users (lower(username))"
+    )
+    if conn.dialect.name != "sqlite":
+        return
+    # External-content table: the index stores trigrams only, rows stay in users
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+        "username, name, content='users', content_rowid='id', tokenize='trigram')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_fts(rowid, username, name) VALUES (new.id, new.username, new.name); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, username, name) "
+        "VALUES ('delete', old.id, old.username, old.name); "
+        "END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, name ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, username, name) "
+        "VALUES ('delete', old.id, old.username, old.name); "
+        "INSERT INTO users_fts(rowid, username, name) VALUES (new.id, new.username, new.name); "
+        "END"
+    )
+    conn.exec_driver_sql("INSERT INTO users_fts(users_fts) VALUES ('rebuild')")
+
+
+# (trigger name, table, event, owner table, owner column, owner id expression)
+_VERSION_TRIGGERS = [
+    ("messages_version_insert", "messages", "INSERT", "users", "messages_version", "new.receiver_id"),
+    ("messages_version_update", "messages", "UPDATE OF status, content", "users", "messages_version", "new.receiver_id"),
+    ("messages_version_delete", "messages", "DELETE", "users", "messages_version", "old.receiver_id"),
+    ("follows_version_insert", "follows", "INSERT", "users", "follows_version", "new.follower_id"),
+    ("follows_version_delete", "follows", "DELETE", "users", "follows_version", "old.follower_id"),
+    ("link_version_message_insert", "link_messages", "INSERT", "links", "version", "new.link_id"),
+    ("link_version_message_update", "link_messages", "UPDATE OF status, content", "links", "version", "new.link_id"),
+    ("link_version_message_delete", "link_messages", "DELETE", "links", "version", "old.link_id"),
+    ("link_version_update", "links", "UPDATE OF display_name, expires_at, status", "links", "version", "new.id"),
+]
+
+
+@migration(4, "Version counters for conditional GET")
+def _version_counters(conn: Connection) -> None:
+    for table, column in (("users", "messages_version"), ("users", "follows_version"), ("links", "version")):
+        if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+    if conn.dialect.name != "sqlite":
+        # Without the triggers the counters never move; app.db.versions disables ETags there
+        return
+    # Triggers rather than application code, so every writer (routes, the
+    # ingestor, expiry, retention, ad-hoc scripts) bumps the counters in the
+    # same transaction as the change itself
+    for trigger in _VERSION_TRIGGERS:
+        conn.exec_driver_sql(_version_trigger_sql(*trigger))
+
+
+def _version_trigger_sql(name: str, table: str, event: str, owner: str, column: str, owner_id: str,
+                        condition: str = "") -> str:
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} {condition} BEGIN "
+        f"UPDATE {owner} SET {column} = {column} + 1 WHERE id = {owner_id}; "
+        "END"
+    )
+
+
+# Same text format SQLAlchemy writes, so created_at compares correctly (see migration 2)
+_SQLITE_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+# (trigger name, table, event, stream, owner id, row id, op, condition)
+_CHANGE_TRIGGERS = [
+    ("messages_change_insert", "messages", "INSERT", "messages", "new.receiver_id", "new.id", "insert", ""),
+    ("messages_change_update", "messages", "UPDATE OF status, content", "messages", "new.receiver_id", "new.id",
+     "update", ""),
+    ("messages_change_delete", "messages", "DELETE", "messages", "old.receiver_id", "old.id", "delete", ""),
+    ("link_messages_change_insert", "link_messages", "INSERT", "link_messages", "new.link_id", "new.id",
+     "insert", ""),
+    ("link_messages_change_update", "link_messages", "UPDATE OF status, content", "link_messages", "new.link_id",
+     "new.id", "update", ""),
+    # Nobody can sync a retired link, so retention purges are not logged
+    ("link_messages_change_delete", "link_messages", "DELETE", "link_messages", "old.link_id", "old.id", "delete",
+     "WHEN (SELECT status FROM links WHERE id = old.link_id) IS NOT 'deleted'"),
+]
+
+
+@migration(5, "Change log for delta sync")
+def _change_log(conn: Connection) -> None:
+    Change.__table__.create(conn, checkfirst=True)
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_changes_stream_owner_seq ON changes (stream, owner_id, seq)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_changes_created_at ON changes (created_at)")
+    if conn.dialect.name != "sqlite":
+        # No triggers, no log: app.db.changes reports the feed as unavailable
+        return
+    for trigger in _CHANGE_TRIGGERS:
+        conn.exec_driver_sql(_change_trigger_sql(*trigger))
+
+
+def _change_trigger_sql(name: str, table: str, event: str, stream: str, owner_id: str, row_id: str, op: str,
+                        condition: str) -> str:
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} {condition} BEGIN "
+        "INSERT INTO changes (stream, owner_id, row_id, op, created_at) "
+        f"VALUES ('{stream}', {owner_id}, {row_id}, '{op}', {_SQLITE_NOW}); "
+        "END"
+    )
+
+
+def _counter_delta(new: str, old: str, section: str) -> str:
+    """SQL for how a row event changes one section's count (new/old are 'new', 'old' or None)"""
+    added = f"({new}.status = '{section}')" if new else "0"
+    return f"{added} - ({old}.status = '{section}')" if old else added
+
+
+# (counts table, owner key, message table, owner column)
+_COUNTERS = [
+    ("message_counts", "user_id", "messages", "receiver_id"),
+    ("link_message_counts", "link_id", "link_messages", "link_id"),
+]
+
+
+@migration(6, "Per-section message counters")
+def _message_counters(conn: Connection) -> None:
+    MessageCounts.__table__.create(conn, checkfirst=True)
+    LinkMessageCounts.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name != "sqlite":
+        # app.db.counters counts on the index instead
+        return
+    sections = [status.value for status in MessageStatus]
+    for counts, key, table, owner in _COUNTERS:
+        # (event, condition, row carrying the owner, new row, old row)
+        for event, condition, row, new, old in (
+            ("INSERT", "", "new", "new", None),
+            ("UPDATE OF status", "WHEN old.status IS NOT new.status", "new", "new", "old"),
+            ("DELETE", "", "old", None, "old"),
+        ):
+            deltas = [_counter_delta(new, old, section) for section in sections]
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS {table}_counts_{event.split()[0].lower()} "
+                f"AFTER {event} ON {table} {condition} BEGIN "
+                f"INSERT INTO {counts} ({key}, {', '.join(sections)}) "
+                f"VALUES ({row}.{owner}, {', '.join(deltas)}) "
+                f"ON CONFLICT ({key}) DO UPDATE SET "
+                + ", ".join(f"{section} = {section} + excluded.{section}" for section in sections)
+                + "; END"
+            )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS link_message_counts_link_delete AFTER DELETE ON links BEGIN "
+        "DELETE FROM link_message_counts WHERE link_id = old.id; "
+        "END"
+    )
+    # Backfill from the messages already stored
+    sync_counts(conn)
+
+
+@migration(7, "Binary AEAD message bodies")
+def _sealed_content(conn: Connection) -> None:
+    blob = LargeBinary().compile(dialect=conn.dialect)
+    for table in ("messages", "link_messages"):
+        if "sealed" not in {c["name"] for c in inspect(conn).get_columns(table)}:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN sealed {blob}")
+        # Stays tiny: only rows app.db.reseal has not re-encoded yet
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_unsealed ON {table} (id) WHERE sealed IS NULL"
+        )
+    if conn.dialect.name != "sqlite":
+        return
+    # Bodies are never edited: the only later writes to content/sealed
+    # re-encode the same message (app.db.reseal), which clients must not see
+    # as a change. Version and change-log triggers now fire on status only.
+    for trigger in _VERSION_TRIGGERS:
+        if trigger[2] == "UPDATE OF status, content":
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger[0]}")
+            conn.exec_driver_sql(_version_trigger_sql(trigger[0], trigger[1], "UPDATE OF status", *trigger[3:]))
+    for trigger in _CHANGE_TRIGGERS:
+        if trigger[2] == "UPDATE OF status, content":
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger[0]}")
+            conn.exec_driver_sql(_change_trigger_sql(trigger[0], trigger[1], "UPDATE OF status", *trigger[3:]))
+
+
+@migration(8, "Re-encryption checkpoints")
+def _reseal_checkpoints(conn: Connection) -> None:
+    ResealCheckpoint.__table__.create(conn, checkfirst=True)
+
+
+@migration(9, "Compressed message bodies: checkpoints per sealed format")
+def _checkpoint_sealed_version(conn: Connection) -> None:
+    # Checkpoints written so far were for sealed v2; a v3 pass starts each table over
+    if "sealed_version" not in {c["name"] for c in inspect(conn).get_columns("reseal_checkpoints")}:
+        conn.exec_driver_sql("ALTER TABLE reseal_checkpoints ADD COLUMN sealed_version INTEGER NOT NULL DEFAULT 2")
+
+
+# The user fields access tokens carry (app.core.security.USER_CLAIMS)
+_CLAIM_COLUMNS = ("username", "name", "language")
+
+
+@migration(10, "User version for token claims")
+def _profile_version(conn: Connection) -> None:
+    if "profile_version" not in {c["name"] for c in inspect(conn).get_columns("users")}:
+        conn.exec_driver_sql("ALTER TABLE users ADD COLUMN profile_version INTEGER NOT NULL DEFAULT 0")
+    if conn.dialect.name != "sqlite":
+        # app.db.versions reports no version; tokens are checked against the row instead
+        return
+    conn.exec_driver_sql(_version_trigger_sql(
+        "users_profile_version_update", "users", f"UPDATE OF {', '.join(_CLAIM_COLUMNS)}", "users",
+        "profile_version", "new.id",
+        "WHEN " + " OR ".join(f"old.{column} IS NOT new.{column}" for column in _CLAIM_COLUMNS)
+    ))
+
+
+@migration(11, "Version and change-log triggers skip unchanged statuses")
+def _status_change_only(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    # Setting a message's status to the one it has (e.g. make-public on a
+    # public message) changes nothing a client can see: no new ETag, no
+    # change-log entry. Same condition as the counters' triggers (migration 6).
+    changed = "WHEN old.status IS NOT new.status"
+    for trigger in _VERSION_TRIGGERS:
+        if trigger[2] == "UPDATE OF status, content":
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger[0]}")
+            conn.exec_driver_sql(
+                _version_trigger_sql(trigger[0], trigger[1], "UPDATE OF status", *trigger[3:], changed)
+            )
+    for trigger in _CHANGE_TRIGGERS:
+        if trigger[2] == "UPDATE OF status, content":
+            conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger[0]}")
+            conn.exec_driver_sql(
+                _change_trigger_sql(trigger[0], trigger[1], "UPDATE OF status", *trigger[3:7], changed)
+            )
+
+
+# ============ Runner ============
+
+def applied_versions(conn: Connection) -> set:
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def run_migrations(bind: Engine = engine) -> List[int]:
+    """Apply every pending migration in version order; returns the versions applied"""
+    migration_metadata.create_all(bind=bind)
+    with bind.connect() as conn:
+        done = applied_versions(conn)
+
+    applied = []
+    for m in sorted(MIGRATIONS, key=lambda m: m.version):
+        if m.version in done:
+            continue
+        with bind.begin() as conn:
+            m.upgrade(conn)
+            conn.execute(insert(schema_migrations).values(
+                version=m.version,
+                description=m.description,
+                applied_at=datetime.utcnow(),
+            ))
+        applied.append(m.version)
+    return applied
+
+
+# ============ Query plan check ============
+
+def hot_queries() -> Dict[str, object]:
+    """Queries on the request hot path that must be served by an index"""
+    return {
+        "inbox section": select(Message).where(
+            Message.receiver_id == 1,
+            Message.status == MessageStatus.inbox
+        ).order_by(Message.created_at.desc()),
+        "public profile messages": select(Message).where(
+            Message.receiver_id == 1,
+            Message.status == MessageStatus.public
+        ).order_by(Message.created_at.desc()).limit(20),
+        "link messages": select(LinkMessage).where(
+            LinkMessage.link_id == 1
+        ).order_by(LinkMessage.created_at.desc()),
+        "my links": select(Link).where(
+            Link.user_id == 1,
+            Link.status == LinkStatus.active
+        ).order_by(Link.created_at.desc()),
+        "link by public id": select(Link).where(Link.public_id == "x"),
+        "link by private id": select(Link).where(Link.private_id == "x"),
+        "inbox version": select(User.messages_version).where(User.id == 1),
+        "changes since": select(Change).where(
+            Change.stream == ChangeStream.messages,
+            Change.owner_id == 1,
+            Change.seq > 10
+        ).order_by(Change.seq).limit(51),
+        "profile version by username": select(User.id, User.messages_version, User.profile_version).where(
+            User.username == "x"
+        ),
+        "link version by public id": select(Link.id, Link.version, Link.expires_at).where(Link.public_id == "x"),
+        "username prefix search": select(User).where(
+            func.lower(User.username) >= "ab",
+            func.lower(User.username) < "ac"
+        ).order_by(func.lower(User.username)).limit(20),
+        "username substring search": select(users_fts.c.rowid).where(
+            literal_column("users_fts").op("MATCH")('"abc"')
+        ).limit(200),
+        "follow check": select(Follow).where(
+            Follow.follower_id == 1,
+            Follow.following_id == 2
+        ),
+        "followers": select(Follow).where(Follow.following_id == 1).order_by(
+            Follow.created_at.desc(), Follow.id.desc()
+        ),
+        "following": select(Follow).where(Follow.follower_id == 1).order_by(
+            Follow.created_at.desc(), Follow.id.desc()
+        ),
+        "all messages page": keyset_page(
+            select(Message).where(Message.receiver_id == 1),
+            Message.created_at, Message.id, encode_cursor(datetime(2026, 1, 1), 10), 50
+        ),
+        "inbox section page": keyset_page(
+            select(Message).where(
+                Message.receiver_id == 1,
+                Message.status == MessageStatus.inbox
+            ),
+            Message.created_at, Message.id, encode_cursor(datetime(2026, 1, 1), 10), 50
+        ),
+    }
+
+
+def _is_virtual_lookup(detail: str) -> bool:
+    """FTS5 reports a MATCH as 'SCAN t VIRTUAL TABLE INDEX 0:M...'; no constraint after ':' is a real scan"""
+    marker = "VIRTUAL TABLE INDEX "
+    return marker in detail and bool(detail.split(marker, 1)[1].partition(":")[2])
+
+
+def check_query_plans(bind: Engine = engine) -> List[str]:
+    """
+    Run EXPLAIN QUERY PLAN over hot_queries() and return a description of
+    every step that scans a table/index or sorts in a temp b-tree.
+    Only meaningful on SQLite; returns [] elsewhere.
+    """
+    if bind.dialect.name != "sqlite":
+        return []
+    problems = []
+    with bind.connect() as conn:
+        for name, stmt in hot_queries().items():
+            sql = str(stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+            for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"):
+                detail = row[-1]
+                if (detail.startswith("SCAN ") and not _is_virtual_lookup(detail)) or "TEMP B-TREE" in detail:
+                    problems.append(f"{name}: {detail}")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Apply SayTruth schema migrations")
+    parser.add_argument("--check-plans", action="store_true", help="fail if a hot query falls back to a scan")
+    args = parser.parse_args(argv)
+
+    # Import models so metadata is registered before creating tables
+    import app.models.models  # noqa: F401
+    Base.metadata.create_all(bind=engine)
+    applied = run_migrations(engine)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date")
+
+    if args.check_plans:
+        problems = check_query_plans(engine)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if problems:
+            return 1
+        print("✅ All hot queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
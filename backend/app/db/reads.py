@@ -0,0 +1,171 @@
+"""
+Read queries behind the GET routes.
+
+Each function is a Core select() of only the columns its route returns. The
+results are Row named tuples, not ORM instances, so nothing enters a
+session's identity map and nothing can be flushed back. Message content
+stays ciphertext on the row. Routes decrypt it into the response dicts and
+never onto the row itself.
+
+Record shapes follow the response schemas (see RowSerializer), so a page
+of rows goes straight to json_response(). A message's `content` is selected
+as its stored ciphertext in whichever format the row is in (see
+ciphertext()), ready for decrypt_batch():
+
+    rows, next_cursor = await reads.message_page(db, user_id, None, after, limit)
+    body = reads.message_records.dicts(rows, content=await decrypt_batch([r.content for r in rows]))
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import LargeBinary, Row, cast, func, or_, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.pagination import keyset_page, split_page
+from app.core.serialization import RowSerializer
+from app.models.models import Follow, Link, LinkMessage, LinkStatus, Message, MessageStatus, User
+from app.schemas.schemas import LinkMessageResponse, LinkResponse, MessageResponse, UserResponse
+
+# Latest public messages shown on a profile
+PROFILE_MESSAGES = 20
+
+
+def ciphertext(model):
+    """A Message/LinkMessage body as stored: the sealed bytes, or the legacy Fernet token's bytes"""
+    return func.coalesce(model.sealed, cast(model.content, LargeBinary))
+
+
+message_records = RowSerializer(MessageResponse, content=ciphertext)
+link_message_records = RowSerializer(LinkMessageResponse, content=ciphertext)
+link_records = RowSerializer(LinkResponse)
+user_records = RowSerializer(UserResponse)
+
+# What the link routes check access and expiry with, plus their metadata
+_LINK_COLUMNS = (
+    Link.id, Link.public_id, Link.private_id, Link.user_id,
+    Link.display_name, Link.expires_at, Link.status,
+)
+
+Page = Tuple[List[Row], Optional[str]]
+
+
+async def message_page(db: AsyncSession, receiver_id: int, section: Optional[MessageStatus],
+                       after: Optional[str], limit: int) -> Page:
+    """One page of a receiver's messages, newest first, optionally one section"""
+    query = select(*message_records.columns(Message)).where(Message.receiver_id == receiver_id)
+    if section is not None:
+        query = query.where(Message.status == section)
+    query = keyset_page(query, Message.created_at, Message.id, after, limit)
+    return split_page((await db.execute(query)).all(), limit)
+
+
+async def inbox_pages(db: AsyncSession, receiver_id: int, cursors: Dict[MessageStatus, Optional[str]],
+                      limit: int) -> Dict[MessageStatus, Page]:
+    """One page per section, in one round trip: a UNION ALL of index-backed, LIMITed section queries"""
+    section_pages = []
+    for section, after in cursors.items():
+        section_query = select(*message_records.columns(Message)).where(
+            Message.receiver_id == receiver_id,
+            Message.status == section
+        )
+        section_query = keyset_page(section_query, Message.created_at, Message.id, after, limit)
+        section_pages.append(select(section_query.subquery()))
+    rows = (await db.execute(union_all(*section_pages))).all()
+    # A compound select has no defined row order: restore each page's newest-first order before
+    # split_page() takes its last row as the cursor
+    return {
+        section: split_page(
+            sorted((r for r in rows if r.status == section), key=lambda r: (r.created_at, r.id), reverse=True),
+            limit
+        )
+        for section in cursors
+    }
+
+
+async def messages_by_id(db: AsyncSession, ids: Sequence[int], receiver_id: int) -> Dict[int, Row]:
+    """The receiver's messages among `ids`, by id (others' and deleted ones are absent)"""
+    if not ids:
+        return {}
+    rows = await db.execute(select(*message_records.columns(Message)).where(
+        Message.id.in_(ids),
+        Message.receiver_id == receiver_id
+    ))
+    return {row.id: row for row in rows}
+
+
+async def public_messages(db: AsyncSession, user_id: int, limit: int = PROFILE_MESSAGES) -> List[Row]:
+    return list((await db.execute(select(*message_records.columns(Message)).where(
+        Message.receiver_id == user_id,
+        Message.status == MessageStatus.public
+    ).order_by(Message.created_at.desc()).limit(limit))).all())
+
+
+async def user_by_id(db: AsyncSession, user_id: int) -> Optional[Row]:
+    return (await db.execute(select(*user_records.columns(User)).where(User.id == user_id))).first()
+
+
+async def user_claims_by_id(db: AsyncSession, user_id: int) -> Optional[Row]:
+    """A user's response fields plus the version access tokens record them at"""
+    return (await db.execute(
+        select(*user_records.columns(User), User.profile_version).where(User.id == user_id)
+    )).first()
+
+
+async def user_id_for(db: AsyncSession, username: str) -> Optional[int]:
+    return await db.scalar(select(User.id).where(User.username == username))
+
+
+async def is_following(db: AsyncSession, follower_id: int, following_id: int) -> bool:
+    return await db.scalar(select(Follow.id).where(
+        Follow.follower_id == follower_id,
+        Follow.following_id == following_id
+    )) is not None
+
+
+async def follow_page(db: AsyncSession, match_column, user_column, user_id: int,
+                      after: Optional[str], limit: int) -> Page:
+    """One page of the users on the other side of `user_id`'s follows, newest follow first"""
+    # The cursor columns trail the user's: RowSerializer.dicts() leaves them out
+    query = select(
+        *user_records.columns(User), Follow.created_at.label("followed_at"), Follow.id.label("follow_id")
+    ).join(Follow, user_column == User.id).where(match_column == user_id)
+    query = keyset_page(query, Follow.created_at, Follow.id, after, limit)
+    return split_page((await db.execute(query)).all(), limit, "followed_at", "follow_id")
+
+
+async def link_by(db: AsyncSession, column, value: str) -> Optional[Row]:
+    """A link by Link.public_id or Link.private_id, whatever its state, or None"""
+    return (await db.execute(select(*_LINK_COLUMNS).where(column == value))).first()
+
+
+async def link_message_page(db: AsyncSession, link_id: int, after: Optional[str], limit: int) -> Page:
+    query = keyset_page(
+        select(*link_message_records.columns(LinkMessage)).where(LinkMessage.link_id == link_id),
+        LinkMessage.created_at, LinkMessage.id, after, limit
+    )
+    return split_page((await db.execute(query)).all(), limit)
+
+
+async def link_messages_by_id(db: AsyncSession, ids: Sequence[int], link_id: int) -> Dict[int, Row]:
+    """The link's messages among `ids`, by id"""
+    if not ids:
+        return {}
+    rows = await db.execute(select(*link_message_records.columns(LinkMessage)).where(
+        LinkMessage.id.in_(ids),
+        LinkMessage.link_id == link_id
+    ))
+    return {row.id: row for row in rows}
+
+
+async def my_links_page(db: AsyncSession, user_id: int, after: Optional[str], limit: int) -> Page:
+    """One page of a user's live links, newest first (hiding any the sweeper has not retired yet)"""
+    # Link.id trails the schema's fields: the cursor needs it, the body does not
+    query = keyset_page(
+        select(*link_records.columns(Link), Link.id).where(
+            Link.user_id == user_id,
+            Link.status == LinkStatus.active,
+            or_(Link.expires_at.is_(None), Link.expires_at > datetime.utcnow())
+        ),
+        Link.created_at, Link.id, after, limit
+    )
+    return split_page((await db.execute(query)).all(), limit)
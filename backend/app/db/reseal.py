@@ -0,0 +1,264 @@
+"""
+Re-encrypt message bodies under the active key.
+
+Rows that need it are legacy Fernet tokens (written before migration 7),
+sealed v1 and v2 bodies (no key id, no codec byte: long v2 bodies get
+compressed on the way), and bodies sealed under a retired key after a
+rotation (see app.core.keyring). The job walks each message table in id
+order and re-encrypts those rows. For each batch of reseal_chunk_size rows:
+
+- Rows still on the active key are skipped by the query itself.
+- The batch is re-encrypted on a small thread pool (reseal_workers) while
+  the next batch is read.
+- The new bodies are written back in one short transaction. Each UPDATE
+  only applies if the row still holds the ciphertext that was read, so
+  concurrent deletes and a second copy of the job are harmless.
+- The same transaction records the last id in reseal_checkpoints, so a
+  stopped job resumes where it left off. Once a table is done, its
+  checkpoint moves to the newest row: later rows were sealed under the
+  active key already, and the next run has nothing to scan.
+- The job throttles itself: it sleeps long enough that it holds the write
+  lock at most reseal_write_share of the time, so foreground writes keep
+  flowing.
+
+Reads handle every format under every key in the keyring, so nothing
+waits for the job. A retired key can be removed from ENCRYPTION_KEYS once
+--status reports no rows left. Bodies that cannot be decrypted are left
+as they are and reported. The pages freed inside the file go back to the
+filesystem with the retention job's incremental vacuum. To see what a run
+would save first, use app.db.storage.
+
+Usage:
+    python -m app.db.reseal            # re-encrypt every row not under the active key
+    python -m app.db.reseal --status   # count rows not under the active key
+
+RESEAL_ON_STARTUP=true also runs one pass in the background after the app
+starts, in the worker that runs the background jobs (app.db.jobs).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import bindparam, func, insert, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import get_settings
+from app.core.keyring import keyring
+from app.core.security import UNAVAILABLE_CONTENT, decrypt_messages, seal_message, sealed_header
+from app.db.database import engine
+from app.db.reads import ciphertext
+from app.models.models import LinkMessage, Message, ResealCheckpoint
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_TABLES = (Message, LinkMessage)
+
+
+@dataclass
+class ResealReport:
+    key_id: int = 0
+    messages_resealed: int = 0
+    link_messages_resealed: int = 0
+    unreadable: int = 0
+    duration_ms: float = 0.0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def _not_current(model):
+    """Rows not sealed under the active key in the current format"""
+    return or_(model.sealed.is_(None), func.substr(model.sealed, 1, 2) != sealed_header(keyring.active))
+
+
+def _target() -> dict:
+    """What the checkpoints are for: the active key and the sealed format version"""
+    return {"key_id": keyring.active.key_id, "sealed_version": sealed_header(keyring.active)[0]}
+
+
+def pending_rows(bind: Engine = engine) -> Dict[str, int]:
+    """Rows per table not sealed under the active key"""
+    with bind.connect() as conn:
+        return {
+            model.__tablename__: conn.execute(
+                select(func.count()).select_from(model).where(_not_current(model))
+            ).scalar()
+            for model in _TABLES
+        }
+
+
+def _reencrypt(ciphertexts: Sequence[bytes]) -> List[Optional[bytes]]:
+    """Bodies sealed under the active key; None where the old one cannot be decrypted"""
+    return [
+        None if plaintext is UNAVAILABLE_CONTENT else seal_message(plaintext)
+        for plaintext in decrypt_messages(ciphertexts)
+    ]
+
+
+def _checkpoint(bind: Engine, model) -> int:
+    """Last id done for this table under the active key and format (0: start over)"""
+    target = _target()
+    with bind.connect() as conn:
+        last_id = conn.execute(select(ResealCheckpoint.last_id).where(
+            ResealCheckpoint.table_name == model.__tablename__,
+            ResealCheckpoint.key_id == target["key_id"],
+            ResealCheckpoint.sealed_version == target["sealed_version"]
+        )).scalar()
+    return last_id or 0
+
+
+def _save_checkpoint(conn: Connection, model, last_id: int) -> None:
+    values = {**_target(), "last_id": last_id, "updated_at": datetime.utcnow()}
+    saved = conn.execute(
+        update(ResealCheckpoint).where(ResealCheckpoint.table_name == model.__tablename__).values(**values)
+    ).rowcount
+    if not saved:
+        conn.execute(insert(ResealCheckpoint).values(table_name=model.__tablename__, **values))
+
+
+def reseal_table(
+    model,
+    bind: Engine = engine,
+    chunk_size: int = settings.reseal_chunk_size,
+    pause: float = settings.reseal_chunk_pause_ms / 1000,
+    write_share: float = settings.reseal_write_share,
+    workers: int = settings.reseal_workers,
+    stop: Optional[threading.Event] = None,
+) -> tuple:
+    """
+    Re-encrypt `model`'s rows under the active key, from its checkpoint
+    until none are left or `stop` is set. Returns (resealed, unreadable).
+    """
+    reseal = (
+        update(model)
+        .where(model.id == bindparam("row_id"), ciphertext(model) == bindparam("old"))
+        .values(sealed=bindparam("new_sealed"), content="")
+    )
+    batch_query = select(model.id, ciphertext(model).label("ciphertext")).where(_not_current(model))
+
+    def read_batch(after: int) -> list:
+        with bind.connect() as conn:
+            return conn.execute(batch_query.where(model.id > after).order_by(model.id).limit(chunk_size)).all()
+
+    def stopping() -> bool:
+        return stop is not None and stop.is_set()
+
+    resealed = unreadable = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reseal") as pool:
+        batch = [] if stopping() else read_batch(_checkpoint(bind, model))
+        while batch:
+            step = -(-len(batch) // workers)
+            work = [
+                pool.submit(_reencrypt, [row.ciphertext for row in batch[i:i + step]])
+                for i in range(0, len(batch), step)
+            ]
+            # Read ahead while the pool works
+            next_batch = [] if stopping() else read_batch(batch[-1].id)
+            sealed = [body for part in work for body in part.result()]
+
+            params = [
+                {"row_id": row.id, "old": row.ciphertext, "new_sealed": body}
+                for row, body in zip(batch, sealed)
+                if body is not None
+            ]
+            unreadable += len(batch) - len(params)
+            started = time.monotonic()
+            with bind.begin() as conn:
+                if params:
+                    resealed += conn.execute(reseal, params).rowcount
+                _save_checkpoint(conn, model, batch[-1].id)
+            held = time.monotonic() - started
+            time.sleep(max(pause, held * (1 - write_share) / write_share))
+            batch = next_batch
+
+    if not stopping():
+        with bind.begin() as conn:
+            newest = conn.execute(select(func.max(model.id))).scalar()
+            if newest is not None:
+                _save_checkpoint(conn, model, newest)
+    return resealed, unreadable
+
+
+def run_reseal(bind: Engine = engine, stop: Optional[threading.Event] = None) -> ResealReport:
+    """Re-encrypt both message tables; returns what was done"""
+    started = time.perf_counter()
+    report = ResealReport(key_id=keyring.active.key_id)
+    report.messages_resealed, unreadable = reseal_table(Message, bind, stop=stop)
+    report.unreadable += unreadable
+    report.link_messages_resealed, unreadable = reseal_table(LinkMessage, bind, stop=stop)
+    report.unreadable += unreadable
+    report.duration_ms = (time.perf_counter() - started) * 1000
+    if report.messages_resealed or report.link_messages_resealed or report.unreadable:
+        logger.info("Reseal pass: %s", report.as_dict())
+    return report
+
+
+class ResealTask:
+    """One background reseal pass after startup (reseal_on_startup), in a worker thread of the job runner"""
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self.last_report: Optional[ResealReport] = None
+
+    async def start(self) -> None:
+        if self.enabled:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run(), name="reseal")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        # The thread cannot be cancelled: let it finish its chunk, the next start resumes
+        self._stop.set()
+        await self._task
+        self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "active_key_id": keyring.active.key_id,
+            "last_run": self.last_report.as_dict() if self.last_report else None,
+        }
+
+    async def _run(self) -> None:
+        try:
+            self.last_report = await asyncio.to_thread(run_reseal, engine, self._stop)
+        except Exception:
+            logger.exception("Reseal pass failed")
+
+
+reseal_task = ResealTask(enabled=settings.reseal_on_startup)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Re-encrypt SayTruth message bodies under the active key")
+    parser.add_argument("--status", action="store_true", help="only count rows not under the active key")
+    args = parser.parse_args(argv)
+
+    if not args.status:
+        report = run_reseal(engine)
+        resealed = report.messages_resealed + report.link_messages_resealed
+        print(f"🔐 Re-encrypted {resealed} message bodies under key {report.key_id} in {report.duration_ms:.0f} ms")
+        if report.unreadable:
+            print(f"⚠️  {report.unreadable} bodies could not be decrypted and were left as they are")
+
+    pending = pending_rows(engine)
+    for table, rows in pending.items():
+        print(f"{'✅' if not rows else '⏳'} {table}: {rows} rows not under key {keyring.active.key_id}")
+    return 1 if any(pending.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+"""
+Retention engine: purge retired links and compact the database file.
+
+Links retired by the expiry sweeper stay in the database as
+LinkStatus.deleted together with their messages. Once a link has been
+retired for longer than the grace period, this job hard-deletes its
+messages and then the link itself, in bounded chunks with a commit after
+each one so the SQLite write lock is only ever held briefly. It also
+compacts the delta-sync change log (app.db.changes) down to its retention
+window, then returns free pages to the filesystem with incremental VACUUM.
+
+The change log grows with every message written, so it is also compacted
+on its own schedule (change_log_compact_interval_s, hourly by default) by
+the worker that runs the background jobs, whether or not the full pass is
+scheduled.
+
+Usage:
+    python -m app.db.retention                          # one purge + vacuum pass
+    python -m app.db.retention --grace-days 30
+    python -m app.db.retention --enable-incremental-vacuum   # one-off full VACUUM
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.engine import Engine
+
+from app.core.config import get_settings
+from app.db.database import engine
+from app.models.models import Change, Link, LinkMessage, LinkStatus
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+# PRAGMA auto_vacuum value for INCREMENTAL
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+@dataclass
+class RetentionReport:
+    links_deleted: int = 0
+    messages_deleted: int = 0
+    changes_compacted: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+    free_pages_left: int = 0
+    duration_ms: float = 0.0
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return max(self.bytes_before - self.bytes_after, 0)
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "bytes_reclaimed": self.bytes_reclaimed}
+
+
+def _database_bytes(conn) -> int:
+    page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    return page_count * page_size
+
+
+def purge_deleted_links(
+    bind: Engine = engine,
+    grace: timedelta = timedelta(days=settings.retention_grace_days),
+    chunk_size: int = settings.retention_chunk_size,
+    pause: float = settings.retention_chunk_pause_ms / 1000,
+) -> tuple:
+    """
+    Hard-delete links retired before now - grace, and their messages.
+    Every chunk is its own short transaction. Returns (links_deleted, messages_deleted).
+    """
+    # Links only become deleted by expiring, so expires_at is when they were retired
+    cutoff = datetime.utcnow() - grace
+    purgeable = select(Link.id).where(
+        Link.status == LinkStatus.deleted,
+        Link.expires_at.isnot(None),
+        Link.expires_at <= cutoff
+    )
+
+    messages_deleted = 0
+    while True:
+        with bind.begin() as conn:
+            chunk = select(LinkMessage.id).where(LinkMessage.link_id.in_(purgeable)).limit(chunk_size)
+            deleted = conn.execute(delete(LinkMessage).where(LinkMessage.id.in_(chunk))).rowcount
+        messages_deleted += deleted
+        if deleted < chunk_size:
+            break
+        time.sleep(pause)
+
+    links_deleted = 0
+    while True:
+        with bind.begin() as conn:
+            chunk = purgeable.limit(chunk_size)
+            deleted = conn.execute(delete(Link).where(Link.id.in_(chunk))).rowcount
+        links_deleted += deleted
+        if deleted < chunk_size:
+            break
+        time.sleep(pause)
+
+    return links_deleted, messages_deleted
+
+
+def compact_change_log(
+    bind: Engine = engine,
+    keep: timedelta = timedelta(days=settings.change_log_retention_days),
+    chunk_size: int = settings.retention_chunk_size,
+    pause: float = settings.retention_chunk_pause_ms / 1000,
+) -> int:
+    """
+    Drop change log entries older than now - keep, oldest first, in chunks.
+    Always a prefix of the log by seq: app.db.changes relies on that to
+    tell which `since` values are still answerable. Returns entries dropped.
+    """
+    with bind.connect() as conn:
+        through = conn.execute(
+            select(func.max(Change.seq)).where(Change.created_at < datetime.utcnow() - keep)
+        ).scalar()
+    if through is None:
+        return 0
+
+    compacted = 0
+    while True:
+        with bind.begin() as conn:
+            chunk = select(Change.seq).where(Change.seq <= through).order_by(Change.seq).limit(chunk_size)
+            deleted = conn.execute(delete(Change).where(Change.seq.in_(chunk))).rowcount
+        compacted += deleted
+        if deleted < chunk_size:
+            return compacted
+        time.sleep(pause)
+
+
+def incremental_vacuum(
+    bind: Engine = engine,
+    pages_per_step: int = settings.retention_vacuum_pages,
+    pause: float = settings.retention_chunk_pause_ms / 1000,
+) -> int:
+    """
+    Release free pages back to the filesystem a few at a time.
+    Returns the free pages left (non-zero if auto_vacuum is not INCREMENTAL).
+    """
+    with bind.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != AUTO_VACUUM_INCREMENTAL:
+            logger.warning(
+                "auto_vacuum is not INCREMENTAL; run with --enable-incremental-vacuum once to reclaim space"
+            )
+            return conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        while True:
+            free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            if free_pages == 0:
+                return 0
+            # pysqlite's execute() only steps this pragma once (one page);
+            # executescript() runs it to completion
+            conn.connection.driver_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(pages_per_step)})"
+            )
+            time.sleep(pause)
+
+
+def enable_incremental_vacuum(bind: Engine = engine) -> None:
+    """One-off switch of an existing database to auto_vacuum=INCREMENTAL (runs a full VACUUM)"""
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.commit()
+        conn.execution_options(isolation_level="AUTOCOMMIT").exec_driver_sql("VACUUM")
+
+
+def run_retention(bind: Engine = engine, grace: Optional[timedelta] = None) -> RetentionReport:
+    """Purge retired links, then compact; returns what was reclaimed"""
+    started = time.perf_counter()
+    report = RetentionReport()
+    if grace is None:
+        grace = timedelta(days=settings.retention_grace_days)
+    is_sqlite = bind.dialect.name == "sqlite"
+
+    if is_sqlite:
+        with bind.connect() as conn:
+            report.bytes_before = _database_bytes(conn)
+
+    report.links_deleted, report.messages_deleted = purge_deleted_links(bind, grace=grace)
+    report.changes_compacted = compact_change_log(bind)
+
+    if is_sqlite:
+        report.free_pages_left = incremental_vacuum(bind)
+        with bind.connect() as conn:
+            report.bytes_after = _database_bytes(conn)
+
+    report.duration_ms = (time.perf_counter() - started) * 1000
+    logger.info("Retention pass: %s", report.as_dict())
+    return report
+
+
+def run_change_log_compaction(bind: Engine = engine) -> RetentionReport:
+    """Only the change log part of run_retention()"""
+    started = time.perf_counter()
+    report = RetentionReport(changes_compacted=compact_change_log(bind))
+    report.duration_ms = (time.perf_counter() - started) * 1000
+    if report.changes_compacted:
+        logger.info("Change log compaction: %s", report.as_dict())
+    return report
+
+
+class RetentionTask:
+    """
+    Optional in-app periodic retention pass (retention_interval_s > 0), or
+    another job on its own interval. Started only in the worker that runs
+    the background jobs (app.db.jobs), so there is one pass per database
+    rather than one per worker.
+    """
+
+    def __init__(self, interval: float, job: Callable[[], RetentionReport] = run_retention,
+                 name: str = "retention"):
+        self.interval = interval
+        self.job = job
+        self.name = name
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.last_report: Optional[RetentionReport] = None
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "enabled": self.interval > 0,
+            "runs": self.runs,
+            "last_run": self.last_report.as_dict() if self.last_report else None,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Uses the sync engine in a worker thread; chunks keep each write short
+                self.last_report = await asyncio.to_thread(self.job)
+                self.runs += 1
+            except Exception:
+                logger.exception("%s pass failed", self.name)
+
+
+retention_task = RetentionTask(interval=settings.retention_interval_s)
+change_log_task = RetentionTask(
+    interval=settings.change_log_compact_interval_s, job=run_change_log_compaction, name="change-log"
+)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Purge retired links and compact the SayTruth database")
+    parser.add_argument("--grace-days", type=float, default=settings.retention_grace_days,
+                        help="keep retired links this many days before purging them")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="switch the database to auto_vacuum=INCREMENTAL (full VACUUM, run once offline)")
+    args = parser.parse_args(argv)
+
+    bytes_before = None
+    if args.enable_incremental_vacuum:
+        print("🔧 Running full VACUUM to enable incremental vacuum...")
+        with engine.connect() as conn:
+            bytes_before = _database_bytes(conn)
+        enable_incremental_vacuum(engine)
+
+    report = run_retention(engine, grace=timedelta(days=args.grace_days))
+    if bytes_before is not None:
+        report.bytes_before = bytes_before
+    print(f"🧹 Purged {report.links_deleted} links and {report.messages_deleted} messages")
+    print(f"🗜️  Compacted {report.changes_compacted} change log entries")
+    print(f"💾 Reclaimed {report.bytes_reclaimed} bytes ({report.bytes_before} -> {report.bytes_after})")
+    if report.free_pages_left:
+        print(f"⚠️  {report.free_pages_left} free pages left; run with --enable-incremental-vacuum once")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
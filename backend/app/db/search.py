@@ -0,0 +1,93 @@
+"""
+User search.
+
+Username prefixes are matched with a range seek on ix_users_username_lower
+and always rank first. The remaining slots are filled with substring
+matches on username or name from the users_fts FTS5 trigram index (kept in
+sync by triggers, see migration 3), so neither step scans the users table.
+Trigrams need at least three characters; shorter terms match prefixes only.
+"""
+from typing import List
+
+from sqlalchemy import Column, Integer, MetaData, Row, String, Table, func, literal_column, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import is_sqlite
+from app.db.reads import user_records
+from app.models.models import User
+
+SEARCH_LIMIT = 20
+TYPEAHEAD_LIMIT = 8
+
+# Shortest term the trigram index can answer
+MIN_SUBSTRING_TERM = 3
+
+# Substring matches considered per query. A common trigram can match a large
+# share of users; capping the candidates keeps each search bounded.
+FTS_CANDIDATES = 200
+
+# Not part of Base.metadata: the virtual table is created by migration 3
+users_fts = Table(
+    "users_fts",
+    MetaData(),
+    Column("rowid", Integer),
+    Column("username", String),
+    Column("name", String),
+)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every string starting with `prefix`"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _fts_phrase(term: str) -> str:
+    """Quote a user-supplied term as a single FTS5 phrase"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+async def find_users(db: AsyncSession, term: str, limit: int = SEARCH_LIMIT) -> List[Row]:
+    """
+    Users whose username starts with `term`, then those containing it in
+    username or name. Rows shaped like UserResponse (see app.db.reads).
+    """
+    term = term.strip().lstrip("@")
+    if not term:
+        return []
+    lowered = term.lower()
+
+    username_lower = func.lower(User.username)
+    user_columns = user_records.columns(User)
+    users = list((await db.execute(
+        select(*user_columns)
+        .where(username_lower >= lowered, username_lower < _prefix_upper_bound(lowered))
+        .order_by(username_lower)
+        .limit(limit)
+    )).all())
+    if len(users) >= limit or len(term) < MIN_SUBSTRING_TERM:
+        return users
+
+    seen = [user.id for user in users]
+    if is_sqlite:
+        candidates = (
+            select(users_fts.c.rowid)
+            .where(literal_column("users_fts").op("MATCH")(_fts_phrase(term)))
+            .limit(FTS_CANDIDATES)
+            .subquery()
+        )
+        query = select(*user_columns).join(candidates, candidates.c.rowid == User.id)
+    else:
+        query = select(*user_columns).where(User.username.ilike(f"%{term}%") | User.name.ilike(f"%{term}%"))
+
+    users += (await db.execute(
+        query
+        .where(User.id.notin_(seen))
+        # Display-name prefix matches next, then shorter (closer) usernames
+        .order_by(
+            func.lower(func.coalesce(User.name, "")).startswith(lowered, autoescape=True).desc(),
+            func.length(User.username),
+            User.id
+        )
+        .limit(limit - len(users))
+    )).all()
+    return users
@@ -0,0 +1,113 @@
+"""
+Space taken by message bodies, as stored and after app.db.reseal.
+
+Reads every body of each message table in id order, in reseal_chunk_size
+batches on short read transactions, and reports per table:
+
+- rows per stored format (fernet, v1, v2, v3, v3+deflate)
+- plaintext bytes (UTF-8)
+- stored bytes: the bodies as they are now
+- resealed bytes: the same bodies sealed under the active key with the
+  current message_compress_* settings, i.e. after a reseal run
+
+Bodies that cannot be decrypted count the same on both sides. Only the
+bodies are measured, not the rest of the row, indexes or free pages.
+Nothing is written, so it is safe to run against the live database.
+
+Usage:
+    python -m app.db.storage          # report both message tables
+    python -m app.db.storage --json   # the same as JSON
+"""
+import argparse
+import json
+import sys
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from app.core.config import get_settings
+from app.core.security import UNAVAILABLE_CONTENT, decrypt_messages, seal_message, storage_format
+from app.db.database import engine
+from app.db.reads import ciphertext
+from app.models.models import LinkMessage, Message
+
+settings = get_settings()
+
+
+@dataclass
+class TableStorage:
+    table: str
+    rows: int = 0
+    formats: Dict[str, int] = field(default_factory=dict)
+    unreadable: int = 0
+    plaintext_bytes: int = 0
+    stored_bytes: int = 0
+    resealed_bytes: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def measure_table(model, bind: Engine = engine, chunk_size: int = settings.reseal_chunk_size) -> TableStorage:
+    report = TableStorage(model.__tablename__)
+    query = select(model.id, ciphertext(model).label("ciphertext")).order_by(model.id).limit(chunk_size)
+    after = 0
+    while True:
+        with bind.connect() as conn:
+            rows = conn.execute(query.where(model.id > after)).all()
+        if not rows:
+            return report
+        after = rows[-1].id
+        bodies = [row.ciphertext for row in rows]
+        for body, plaintext in zip(bodies, decrypt_messages(bodies)):
+            report.rows += 1
+            kind = storage_format(body)
+            report.formats[kind] = report.formats.get(kind, 0) + 1
+            report.stored_bytes += len(body)
+            if plaintext is UNAVAILABLE_CONTENT:
+                report.unreadable += 1
+                report.resealed_bytes += len(body)
+                continue
+            report.plaintext_bytes += len(plaintext.encode())
+            report.resealed_bytes += len(seal_message(plaintext))
+
+
+def measure_storage(bind: Engine = engine) -> List[TableStorage]:
+    return [measure_table(model, bind) for model in (Message, LinkMessage)]
+
+
+def _size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Report the space SayTruth message bodies take, now and after reseal")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    reports = measure_storage(engine)
+    if args.json:
+        print(json.dumps([report.as_dict() for report in reports], indent=2))
+        return 0
+
+    for report in reports:
+        change = (report.resealed_bytes - report.stored_bytes) / report.stored_bytes * 100 if report.stored_bytes else 0.0
+        print(
+            f"📦 {report.table}: {report.rows} rows, {_size(report.stored_bytes)} stored -> "
+            f"{_size(report.resealed_bytes)} after reseal ({change:+.1f}%), {_size(report.plaintext_bytes)} plaintext"
+        )
+        if report.formats:
+            print("   " + ", ".join(f"{kind} {rows}" for kind, rows in sorted(report.formats.items())))
+        if report.unreadable:
+            print(f"⚠️  {report.unreadable} bodies could not be decrypted")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""
+Resource versions for conditional GET.
+
+users.messages_version, users.follows_version and links.version are bumped
+by triggers (migration 4), users.profile_version by one (migration 10), in the same transaction as any change to the rows
+they summarise. A version is therefore one primary-key or unique-index
+lookup, with nothing loaded or decrypted. Each function returns None when
+the resource does not exist, or when the database has no version triggers
+(not SQLite); callers then serve the request normally without an ETag.
+"""
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.database import is_sqlite
+from app.models.models import Link, User
+
+
+async def inbox_version(db: AsyncSession, user_id: int) -> Optional[Tuple]:
+    """Changes whenever any of the user's messages is added, moved or deleted"""
+    if not is_sqlite:
+        return None
+    version = await db.scalar(select(User.messages_version).where(User.id == user_id))
+    return None if version is None else (user_id, version)
+
+
+async def user_version(db: AsyncSession, user_id: int) -> Optional[int]:
+    """Changes whenever a field access tokens carry (username, name, language) does"""
+    if not is_sqlite:
+        return None
+    return await db.scalar(select(User.profile_version).where(User.id == user_id))
+
+
+async def profile_version(db: AsyncSession, user_id: Optional[int] = None,
+                          username: Optional[str] = None, viewer_id: Optional[int] = None) -> Optional[Tuple]:
+    """
+    (user id, messages version, user version, viewer's follows version) for
+    a public profile looked up by id or username. The user version covers
+    the name shown on it, the viewer part covers is_following.
+    """
+    if not is_sqlite:
+        return None
+    viewer_follows = (
+        select(User.follows_version).where(User.id == viewer_id).scalar_subquery()
+        if viewer_id is not None else literal(None)
+    )
+    query = select(User.id, User.messages_version, User.profile_version, viewer_follows)
+    query = query.where(User.id == user_id) if username is None else query.where(User.username == username)
+    row = (await db.execute(query)).first()
+    return None if row is None else tuple(row)
+
+
+async def link_version(db: AsyncSession, column, value: str) -> Optional[Tuple]:
+    """
+    Version of a link found by Link.public_id or Link.private_id. Includes
+    whether it has passed expires_at, which happens without any write.
+    """
+    if not is_sqlite:
+        return None
+    row = (await db.execute(select(Link.id, Link.version, Link.expires_at).where(column == value))).first()
+    if row is None:
+        return None
+    link_id, version, expires_at = row
+    return link_id, version, expires_at is not None and datetime.utcnow() > expires_at
@@ -0,0 +1,55 @@
+"""
+Single-statement writes for the mutation routes.
+
+A status change or a delete of one row is a single UPDATE or DELETE ...
+RETURNING, with the owner check (if any) in the WHERE clause. The row comes
+back with the statement itself. There is no SELECT before it and no
+refresh() after the commit.
+
+Inserts need no helper. The INSERT returns the new id (RETURNING on
+SQLite >= 3.35, otherwise lastrowid), and created_at and the other
+defaults are set client-side. With expire_on_commit=False a committed row
+is therefore complete and never needs a refresh().
+
+When nothing matched, owner_of() tells a missing row (404) from someone
+else's (403). It only runs on that error path.
+"""
+from typing import Optional, Sequence
+
+from sqlalchemy import Row, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _one_row(model, row_id: int, owner) -> list:
+    return [model.id == row_id] if owner is None else [model.id == row_id, owner]
+
+
+async def update_returning(db: AsyncSession, model, row_id: int, values: dict, columns: Sequence,
+                           owner=None) -> Optional[Row]:
+    """
+    Apply `values` to one row (only if `owner` also holds) and return its
+    `columns` after the update, or None. The caller commits.
+    """
+    return (await db.execute(
+        update(model)
+        .where(*_one_row(model, row_id, owner))
+        .values(**values)
+        .returning(*columns)
+        .execution_options(synchronize_session=False)
+    )).first()
+
+
+async def delete_returning(db: AsyncSession, model, row_id: int, owner=None) -> bool:
+    """Delete one row (only if `owner` also holds); False if nothing matched. The caller commits."""
+    return (await db.execute(
+        delete(model)
+        .where(*_one_row(model, row_id, owner))
+        .returning(model.id)
+        .execution_options(synchronize_session=False)
+    )).first() is not None
+
+
+async def owner_of(db: AsyncSession, owner_column, row_id: int) -> Optional[int]:
+    """Owner of a row by id (None if it does not exist), to explain why a write matched nothing"""
+    model = owner_column.class_
+    return await db.scalar(select(owner_column).where(model.id == row_id))
@@ -1,3 +1,5 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -5,10 +7,51 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from app.api.routes import auth, links, messages, users
+from app.core.cache import response_cache
 from app.core.config import get_settings
+from app.core.hashing import password_hasher
+from app.core.pagination import NEXT_CURSOR_HEADER
+from app.core.realtime import push_hub
+from app.core.security import decrypted_cache, token_cache
+from app.db.database import async_engine, async_read_engine
+from app.db.expiry import link_expiry
+from app.db.ingest import message_ingestor
+from app.db.jobs import job_runner
+from app.db.reseal import reseal_task
+from app.db.retention import change_log_task, retention_task
 
 settings = get_settings()
-app = FastAPI(title="SayTruth API", version="0.1.0")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await response_cache.start()
+    await password_hasher.start()
+    await push_hub.start()
+    await message_ingestor.start()
+    # One worker runs the background jobs for everyone (app.db.jobs)
+    if job_runner.acquire():
+        await link_expiry.start()
+        await retention_task.start()
+        await change_log_task.start()
+        await reseal_task.start()
+    yield
+    await reseal_task.stop()
+    await change_log_task.stop()
+    await retention_task.stop()
+    await link_expiry.stop()
+    job_runner.release()
+    # Flush queued messages before the writer goes away
+    await message_ingestor.stop()
+    await push_hub.stop()
+    await password_hasher.stop()
+    await response_cache.stop()
+    # Close pooled database connections on shutdown
+    await async_engine.dispose()
+    await async_read_engine.dispose()
+
+
+app = FastAPI(title="SayTruth API", version="0.1.0", lifespan=lifespan)
 
 # Rate limiter setup
 limiter = Limiter(key_func=get_remote_address)
@@ -22,6 +65,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],  # pagination cursor for list endpoints
 )
 
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
@@ -33,3 +77,19 @@ app.include_router(users.router, prefix="/api/users", tags=["users"])
 @app.get("/health", tags=["health"], summary="Health Check Endpoint")
 async def health() -> dict:
     return {"status": "ok"}
+
+
+@app.get("/metrics", tags=["health"], summary="Background Job Metrics")
+async def metrics() -> dict:
+    return {
+        "job_runner": job_runner.metrics(),
+        "link_expiry": link_expiry.metrics(),
+        "retention": retention_task.metrics(),
+        "change_log": change_log_task.metrics(),
+        "reseal": reseal_task.metrics(),
+        "password_hashing": password_hasher.metrics(),
+        "decrypt_cache": decrypted_cache.metrics(),
+        "token_cache": token_cache.metrics(),
+        "response_cache": response_cache.metrics(),
+        "push": push_hub.metrics(),
+    }
@@ -2,7 +2,7 @@ from datetime import datetime
 import enum
 import uuid
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, LargeBinary, String, text
 from sqlalchemy.sql import func
 
 from app.db.database import Base
@@ -20,6 +20,17 @@ class LinkStatus(str, enum.Enum):
     deleted = "deleted"
 
 
+class ChangeStream(str, enum.Enum):
+    messages = "messages"  # owner is the receiving user
+    link_messages = "link_messages"  # owner is the link
+
+
+class ChangeOp(str, enum.Enum):
+    insert = "insert"
+    update = "update"
+    delete = "delete"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -29,17 +40,40 @@ class User(Base):
     secret_phrase = Column(String(255), nullable=False)  # Stored as hint/question
     secret_answer = Column(String(255), nullable=False)  # Hashed answer for auth
     language = Column(String(2), nullable=False, default="EN")  # EN, AR, ES
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    # Bumped by triggers (migration 4) whenever the user's messages / follows change; ETag source
+    messages_version = Column(Integer, nullable=False, default=0, server_default="0")
+    follows_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Bumped by a trigger (migration 10) whenever a field access tokens carry changes
+    profile_version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # Case-insensitive username prefix search (substring search uses users_fts)
+        Index("ix_users_username_lower", func.lower(username)),
+    )
 
 
 class Message(Base):
     __tablename__ = "messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    receiver_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    content = Column(String, nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # Legacy Fernet token; "" once the body is stored in `sealed`
+    content = Column(String, nullable=False, default="")
+    # Binary AEAD ciphertext (app.core.security.seal_message); NULL until app.db.reseal re-encodes the row
+    sealed = Column(LargeBinary, nullable=True)
     status = Column(Enum(MessageStatus), nullable=False, default=MessageStatus.inbox)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+
+    __table_args__ = (
+        # Inbox sections and public profiles: receiver + status, newest first
+        Index("ix_messages_receiver_status_created", "receiver_id", "status", "created_at"),
+        # All of a receiver's messages, newest first
+        Index("ix_messages_receiver_created", "receiver_id", "created_at"),
+        # Rows still in the legacy format; empty once app.db.reseal has run
+        Index("ix_messages_unsealed", "id", sqlite_where=text("sealed IS NULL"),
+              postgresql_where=text("sealed IS NULL")),
+    )
 
 
 class Link(Base):
@@ -48,27 +82,114 @@ class Link(Base):
     id = Column(Integer, primary_key=True, index=True)
     public_id = Column(String(36), unique=True, nullable=False, index=True)  # UUID
     private_id = Column(String(36), unique=True, nullable=False, index=True)  # UUID
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True)
     display_name = Column(String(255), nullable=True)
     expires_at = Column(DateTime(timezone=True), nullable=True, index=True)  # NULL = permanent
     status = Column(Enum(LinkStatus), nullable=False, default=LinkStatus.active)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+    # Bumped by triggers (migration 4) whenever the link or its messages change; ETag source
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # My links: owner + status, newest first
+        Index("ix_links_user_status_created", "user_id", "status", "created_at"),
+    )
 
 
 class LinkMessage(Base):
     __tablename__ = "link_messages"
 
     id = Column(Integer, primary_key=True, index=True)
-    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), nullable=False, index=True)
-    content = Column(String, nullable=False)  # Encrypted
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), nullable=False)
+    # Encrypted, as on Message
+    content = Column(String, nullable=False, default="")
+    sealed = Column(LargeBinary, nullable=True)
     status = Column(Enum(MessageStatus), nullable=False, default=MessageStatus.inbox)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+
+    __table_args__ = (
+        # Private link page: link, newest first
+        Index("ix_link_messages_link_created", "link_id", "created_at"),
+        Index("ix_link_messages_unsealed", "id", sqlite_where=text("sealed IS NULL"),
+              postgresql_where=text("sealed IS NULL")),
+    )
 
 
 class Follow(Base):
     __tablename__ = "follows"
 
     id = Column(Integer, primary_key=True, index=True)
-    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    following_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    following_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now())
+
+    __table_args__ = (
+        # Follow checks, and at most one follow per pair
+        Index("uq_follows_follower_following", "follower_id", "following_id", unique=True),
+        # Following / followers lists, newest first
+        Index("ix_follows_follower_created", "follower_id", "created_at"),
+        Index("ix_follows_following_created", "following_id", "created_at"),
+    )
+
+
+class MessageCounts(Base):
+    """
+    Messages per section for one receiver, kept current by triggers
+    (migration 6) in the same transaction as every insert, move and delete.
+    Repair with `python -m app.db.counters --repair`.
+    """
+    __tablename__ = "message_counts"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    inbox = Column(Integer, nullable=False, default=0, server_default="0")
+    public = Column(Integer, nullable=False, default=0, server_default="0")
+    favorite = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class LinkMessageCounts(Base):
+    """Link messages per section for one link; see MessageCounts"""
+    __tablename__ = "link_message_counts"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True)
+    inbox = Column(Integer, nullable=False, default=0, server_default="0")
+    public = Column(Integer, nullable=False, default=0, server_default="0")
+    favorite = Column(Integer, nullable=False, default=0, server_default="0")
+
+
+class Change(Base):
+    """
+    Append-only log of message inserts, status changes and deletes, written
+    by triggers (migration 5) in the same transaction as the change. Serves
+    the /changes delta-sync endpoints; compacted by app.db.retention.
+    """
+    __tablename__ = "changes"
+
+    seq = Column(Integer, primary_key=True)
+    stream = Column(Enum(ChangeStream), nullable=False)
+    owner_id = Column(Integer, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(Enum(ChangeOp), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now(), index=True)
+
+    __table_args__ = (
+        # One owner's changes after a given seq
+        Index("ix_changes_stream_owner_seq", "stream", "owner_id", "seq"),
+        # seq values are never reused, even after compaction empties the table
+        {"sqlite_autoincrement": True},
+    )
+
+
+class ResealCheckpoint(Base):
+    """
+    How far app.db.reseal has got through a message table for one target
+    key and format: every row up to last_id is sealed under key_id in
+    sealed format sealed_version. Progress for any other key id or format
+    is stale and the job starts that table over.
+    """
+    __tablename__ = "reseal_checkpoints"
+
+    table_name = Column(String(64), primary_key=True)
+    key_id = Column(Integer, nullable=False)
+    sealed_version = Column(Integer, nullable=False)
+    last_id = Column(Integer, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False, default=datetime.utcnow)
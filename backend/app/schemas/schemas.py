@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional, List
 import re
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
 # ============ Auth Schemas ============
@@ -84,6 +84,22 @@ class MessageStatusUpdate(BaseModel):
     status: str = Field(..., pattern="^(inbox|public|deleted)$")
 
 
+class BulkMessageAction(BaseModel):
+    """Delete or move many messages at once: the listed ids, or a whole section"""
+    action: str = Field(..., pattern="^(delete|move)$")
+    to: Optional[str] = Field(None, pattern="^(inbox|public|favorite)$")  # target section for "move"
+    ids: Optional[List[int]] = Field(None, min_length=1, max_length=1000)
+    section: Optional[str] = Field(None, pattern="^(inbox|public|favorite)$")
+
+    @model_validator(mode="after")
+    def validate_target(self):
+        if self.action == "move" and self.to is None:
+            raise ValueError('"move" needs a target section in `to`')
+        if self.ids is None and self.section is None:
+            raise ValueError("Pass ids, section, or both")
+        return self
+
+
 # ============ Link Schemas ============
 
 class LinkCreate(BaseModel):
@@ -140,6 +156,15 @@ class UserSearch(BaseModel):
     username: str = Field(..., min_length=1)
 
 
+class UserSuggestion(BaseModel):
+    id: int
+    username: str
+    name: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+
 class UserPublicProfile(BaseModel):
     id: int
     username: str
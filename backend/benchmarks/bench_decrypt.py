@@ -0,0 +1,73 @@
+"""
+Decryption benchmark for list endpoints: 100, 1k and 10k message bodies.
+
+For each size it times:
+- serial: one decrypt_messages() call per body, which is what the list
+  routes did before batching (one Fernet.decrypt() per row)
+- batch: one decrypt_batch() call, as the routes make it now. Batches of
+  decrypt_parallel_threshold or more are split across the decrypt thread
+  pool, so the speedup grows with the cores available.
+
+Bodies are legacy Fernet tokens (rows written before migration 7) and,
+where the tree has seal_message(), sealed bodies as written today.
+decrypted_cache is not involved: decrypt_batch() is called without keys.
+
+Usage (from backend/):
+    python benchmarks/bench_decrypt.py
+    python benchmarks/bench_decrypt.py --sizes 100 1000 10000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet  # noqa: E402
+
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.core import security  # noqa: E402
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time serial vs batched message decryption")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--length", type=int, default=300, help="characters per message")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    args = parser.parse_args(argv)
+
+    fernet = Fernet(os.environ["ENCRYPTION_KEY"].encode())
+    formats = {"fernet": lambda text: fernet.encrypt(text.encode())}
+    if hasattr(security, "seal_message"):
+        formats["sealed"] = security.seal_message
+
+    loop = asyncio.new_event_loop()
+    print(f"{'format':8} {'messages':>8} {'serial ms':>10} {'batch ms':>10} {'speedup':>8}")
+    for name, encrypt in formats.items():
+        for size in args.sizes:
+            bodies = [encrypt(f"message {i} " + "x" * args.length) for i in range(size)]
+            expected = [security.decrypt_messages([body])[0] for body in bodies]
+            assert loop.run_until_complete(security.decrypt_batch(bodies)) == expected
+
+            serial = _best_ms(lambda: [security.decrypt_messages([body]) for body in bodies], args.repeat)
+            batch = _best_ms(lambda: loop.run_until_complete(security.decrypt_batch(bodies)), args.repeat)
+            print(f"{name:8} {size:>8} {serial:>10.1f} {batch:>10.1f} {serial / batch:>7.1f}x")
+    loop.close()
+    print(f"cpus={os.cpu_count()} decrypt_workers={security._settings.decrypt_workers} "
+          f"threshold={security._settings.decrypt_parallel_threshold}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Serialization benchmark for list endpoints: one 10k-message response.
+
+Times fetching and serializing the same rows two ways:
+- orm: select(Message) into ORM objects, then what FastAPI does with a
+  response_model=List[MessageResponse] route: validate every object,
+  jsonable_encoder() the result, json.dumps() it
+- rows: select() of the schema's columns (RowSerializer), dicts() and
+  ORJSONResponse.render(), as the list routes do now
+
+Both read the same plaintext bodies, so decryption is left out, and both
+produce the same JSON (checked before timing). It also reports each path's
+peak Python memory (tracemalloc, measured in a separate run).
+
+Usage (from backend/):
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --messages 10000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _setup(directory: str) -> None:
+    """Point the app at a fresh database before anything imports its settings"""
+    from cryptography.fernet import Fernet
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+    os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    os.environ.setdefault("RESEAL_ON_STARTUP", "false")
+
+
+def _seed(size: int, length: int) -> int:
+    """A user with `size` plaintext messages; returns the user's id"""
+    from app.db.database import SessionLocal
+    from app.db.init_db import init_db
+    from app.models.models import Message, MessageStatus, User
+
+    init_db()
+    started = datetime.utcnow() - timedelta(days=1)
+    with SessionLocal() as db:
+        user = User(username="reader", secret_phrase="phrase", secret_answer="x", language="EN")
+        db.add(user)
+        db.flush()
+        sections = list(MessageStatus)
+        db.add_all(
+            Message(receiver_id=user.id, status=sections[i % len(sections)],
+                    created_at=started + timedelta(seconds=i), content=f"message {i} " + "x" * length)
+            for i in range(size)
+        )
+        db.commit()
+        return user.id
+
+
+def _orm(user_id: int) -> bytes:
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+
+    from app.db.database import SessionLocal
+    from app.models.models import Message
+    from app.schemas.schemas import MessageResponse
+
+    with SessionLocal() as db:
+        messages = db.scalars(select(Message).where(Message.receiver_id == user_id)
+                              .order_by(Message.created_at.desc(), Message.id.desc())).all()
+        validated = TypeAdapter(List[MessageResponse]).validate_python(messages, from_attributes=True)
+        # FastAPI's JSONResponse.render()
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode()
+
+
+def _rows(user_id: int) -> bytes:
+    from sqlalchemy import select
+
+    from app.core.serialization import ORJSONResponse, RowSerializer
+    from app.db.database import SessionLocal
+    from app.models.models import Message
+    from app.schemas.schemas import MessageResponse
+
+    records = RowSerializer(MessageResponse)
+    with SessionLocal() as db:
+        rows = db.execute(select(*records.columns(Message)).where(Message.receiver_id == user_id)
+                          .order_by(Message.created_at.desc(), Message.id.desc())).all()
+        return ORJSONResponse(records.dicts(rows)).body
+
+
+def _best_ms(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def _peak_mib(fn) -> float:
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time ORM/response_model vs row/orjson list serialization")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--length", type=int, default=300, help="characters per message")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is kept)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        _setup(directory)
+        user_id = _seed(args.messages, args.length)
+        assert json.loads(_orm(user_id)) == json.loads(_rows(user_id))
+
+        import orjson
+
+        print(f"messages={args.messages} length={args.length} orjson={orjson.__version__}")
+        print(f"{'path':6} {'ms':>8} {'peak MiB':>9} {'bytes':>10}")
+        for name, path in (("orm", _orm), ("rows", _rows)):
+            body = path(user_id)
+            print(f"{name:6} {_best_ms(lambda: path(user_id), args.repeat):>8.1f} "
+                  f"{_peak_mib(lambda: path(user_id)):>9.1f} {len(body):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Mixed-load latency benchmark: do heavy inbox polls stall cheap requests?
+
+Runs the app in-process on one event loop, like a single uvicorn worker,
+against a throwaway SQLite database:
+
+- alice has --inbox messages; --pollers clients poll /api/messages/inbox
+  back to back
+- --visitors clients meanwhile fetch the public profiles of five small
+  users (20 public messages each), --requests times each
+
+It prints p50/p99/max of the profile requests (the cheap ones) and how many
+inbox polls completed. Message bodies are stored the way the tree being
+measured writes them, so the same script gives before/after numbers on
+older checkouts too.
+
+Usage (from backend/):
+    python benchmarks/load_mixed.py
+    python benchmarks/load_mixed.py --inbox 10000 --visitors 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VISITED_USERS = 5
+PUBLIC_MESSAGES = 20
+
+
+def _setup(directory: str) -> None:
+    """Point the app at a fresh database before anything imports its settings"""
+    from cryptography.fernet import Fernet
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{directory}/bench.db"
+    os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+    os.environ.setdefault("RESEAL_ON_STARTUP", "false")
+
+
+def _seed(inbox_size: int) -> dict:
+    """alice with `inbox_size` messages and five small public profiles; returns alice's auth header"""
+    from app.core import security
+    from app.db.database import SessionLocal
+    from app.db.init_db import init_db
+    from app.models.models import Message, MessageStatus, User
+
+    init_db()
+    seal = getattr(security, "seal_message", None)
+
+    def body(text: str) -> dict:
+        # The current storage format of whichever tree is being measured
+        return {"sealed": seal(text), "content": ""} if seal else {"content": security.encrypt_message(text)}
+
+    started = datetime.utcnow() - timedelta(days=1)
+    with SessionLocal() as db:
+        users = [User(username=f"user{i}", name=f"User {i}", secret_phrase="phrase", secret_answer="x",
+                      language="EN") for i in range(VISITED_USERS + 1)]
+        db.add_all(users)
+        db.flush()
+        alice = users[0]
+        sections = list(MessageStatus)
+        db.add_all(
+            Message(receiver_id=alice.id, status=sections[i % len(sections)],
+                    created_at=started + timedelta(seconds=i), **body(f"message {i} " * 10))
+            for i in range(inbox_size)
+        )
+        for user in users[1:]:
+            db.add_all(
+                Message(receiver_id=user.id, status=MessageStatus.public,
+                        created_at=started + timedelta(seconds=i), **body(f"public {i} " * 10))
+                for i in range(PUBLIC_MESSAGES)
+            )
+        db.commit()
+        claims = security.user_claims(alice) if hasattr(security, "user_claims") else None
+        token = (security.create_access_token(str(alice.id), claims=claims) if claims
+                 else security.create_access_token(str(alice.id)))
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _run(args, headers: dict) -> None:
+    import httpx
+    from app.main import app
+
+    latencies = []
+    polls = 0
+    done = asyncio.Event()
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            async def poller() -> None:
+                nonlocal polls
+                while not done.is_set():
+                    response = await client.get("/api/messages/inbox", headers=headers)
+                    assert response.status_code == 200, response.text
+                    polls += 1
+
+            async def visitor(n: int) -> None:
+                for i in range(args.requests):
+                    started = time.perf_counter()
+                    response = await client.get(f"/api/users/username/user{(n + i) % VISITED_USERS + 1}")
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    assert response.status_code == 200, response.text
+
+            pollers = [asyncio.create_task(poller()) for _ in range(args.pollers)]
+            # Let the first polls start before measuring
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            await asyncio.gather(*(visitor(n) for n in range(args.visitors)))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await asyncio.gather(*pollers)
+
+    latencies.sort()
+    print(f"inbox={args.inbox} pollers={args.pollers} visitors={args.visitors} requests={len(latencies)}")
+    print(f"profile p50={statistics.median(latencies):.1f} ms  p99={latencies[int(len(latencies) * 0.99)]:.1f} ms  "
+          f"max={latencies[-1]:.1f} ms")
+    print(f"inbox polls completed: {polls} in {elapsed:.1f} s")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Profile latency under concurrent inbox polling")
+    parser.add_argument("--inbox", type=int, default=3000, help="messages in the polled inbox")
+    parser.add_argument("--pollers", type=int, default=2, help="clients polling the inbox")
+    parser.add_argument("--visitors", type=int, default=5, help="clients fetching profiles")
+    parser.add_argument("--requests", type=int, default=100, help="profile requests per visitor")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        _setup(directory)
+        headers = _seed(args.inbox)
+        asyncio.run(_run(args, headers))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
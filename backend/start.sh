@@ -6,8 +6,8 @@ echo "🔧 Initializing SayTruth database..."
 # Wait a moment for any file system operations to complete
 sleep 1
 
-# Run the database initialization
-python -m app.db.init_db
+# Create missing tables and apply pending schema migrations
+python -m app.db.migrate
 
 if [ $? -eq 0 ]; then
     echo "✅ Database initialized successfully!"
@@ -17,4 +17,4 @@ else
 fi
 
 echo "🚀 Starting FastAPI server..."
-exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
+exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload --timeout-graceful-shutdown 5
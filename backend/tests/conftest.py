@@ -0,0 +1,29 @@
+"""
+Test settings: every test session gets its own throwaway SQLite database.
+
+The app reads its settings and builds its engines at import time, so the
+environment is set here, before any test module imports app.*.
+"""
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+
+_directory = tempfile.mkdtemp(prefix="saytruth-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_directory}/test.db"
+os.environ["CACHE_PATH"] = f"{_directory}/test-cache.db"
+os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+os.environ.pop("ENCRYPTION_KEYS", None)
+os.environ["RESEAL_ON_STARTUP"] = "false"
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def database():
+    """The test database, created and migrated once per session"""
+    from app.db.database import engine
+    from app.db.init_db import init_db
+
+    init_db()
+    return engine
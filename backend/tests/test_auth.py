@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+from app.core.security import token_cache
+
+
+async def _settings_then_me(app) -> dict:
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            signup = await client.post("/api/auth/signup", json={
+                "username": "claims_user", "name": "Claims", "secret_phrase": "phrase", "secret_answer": "answer",
+            })
+            assert signup.status_code == 201, signup.text
+            headers = {"Authorization": f"Bearer {signup.json()['access_token']}"}
+            assert (await client.get("/api/auth/me", headers=headers)).json()["language"] == "EN"
+
+            response = await client.patch("/api/auth/settings", json={"language": "AR"}, headers=headers)
+            assert response.status_code == 200, response.text
+            # What a restarted worker (or one that missed the invalidation) starts from
+            token_cache.clear()
+            response = await client.get("/api/auth/me", headers=headers)
+            assert response.status_code == 200, response.text
+            return response.json()
+
+
+def test_token_claims_follow_settings_after_cache_loss(database):
+    from app.main import app
+
+    # The token still carries language EN; its user version no longer matches
+    assert asyncio.run(_settings_then_me(app))["language"] == "AR"
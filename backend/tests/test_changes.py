@@ -0,0 +1,54 @@
+import asyncio
+from datetime import timedelta
+
+import httpx
+
+
+def _add_message(receiver_id: int, text: str) -> int:
+    from app.core.security import seal_message
+    from app.db.database import SessionLocal
+    from app.models.models import Message
+
+    with SessionLocal() as db:
+        message = Message(receiver_id=receiver_id, sealed=seal_message(text))
+        db.add(message)
+        db.commit()
+        return message.id
+
+
+async def _sync_across_compaction(app, engine) -> None:
+    from app.db.retention import compact_change_log
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            signup = await client.post("/api/auth/signup", json={
+                "username": "sync_user", "secret_phrase": "phrase", "secret_answer": "answer",
+            })
+            headers = {"Authorization": f"Bearer {signup.json()['access_token']}"}
+            user_id = (await client.get("/api/auth/me", headers=headers)).json()["id"]
+
+            since = (await client.get("/api/messages/changes", headers=headers)).json()["next_since"]
+            for i in range(3):
+                await asyncio.to_thread(_add_message, user_id, f"before {i}")
+            behind = await client.get("/api/messages/changes", params={"since": since}, headers=headers)
+            assert behind.status_code == 200 and len(behind.json()["changes"]) == 3
+
+            assert await asyncio.to_thread(compact_change_log, engine, timedelta(0)) >= 3
+            gone = await client.get("/api/messages/changes", params={"since": since}, headers=headers)
+            assert gone.status_code == 410, gone.text
+
+            # What a client does after a 410: refetch, then sync on from the head
+            head = (await client.get("/api/messages/changes", headers=headers)).json()["next_since"]
+            message_id = await asyncio.to_thread(_add_message, user_id, "after")
+            synced = await client.get("/api/messages/changes", params={"since": head}, headers=headers)
+            assert synced.status_code == 200, synced.text
+            assert [(c["id"], c["op"]) for c in synced.json()["changes"]] == [(message_id, "upsert")]
+
+            metrics = (await client.get("/metrics")).json()
+            assert metrics["change_log"]["enabled"], "compaction must be scheduled by default"
+
+
+def test_compacted_since_is_gone_and_head_still_syncs(database):
+    from app.main import app
+
+    asyncio.run(_sync_across_compaction(app, database))
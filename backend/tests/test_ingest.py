@@ -0,0 +1,96 @@
+import asyncio
+import uuid
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+
+def _owner_with_links(count: int) -> tuple:
+    from app.db.database import SessionLocal
+    from app.models.models import Link, User
+
+    with SessionLocal() as db:
+        owner = User(username=f"ingest_{uuid.uuid4().hex[:8]}", secret_phrase="phrase", secret_answer="x",
+                     language="EN")
+        db.add(owner)
+        db.flush()
+        links = [Link(public_id=str(uuid.uuid4()), private_id=str(uuid.uuid4()), user_id=owner.id)
+                 for _ in range(count)]
+        db.add_all(links)
+        db.commit()
+        return owner.id, [link.id for link in links]
+
+
+def _delete_link(link_id: int) -> None:
+    from app.db.database import SessionLocal
+    from app.models.models import Link
+
+    with SessionLocal() as db:
+        db.delete(db.get(Link, link_id))
+        db.commit()
+
+
+def _write_elsewhere(owner_id: int, link_id: int) -> None:
+    """Another writer's rows, committed outside the ingestor"""
+    from app.core.security import seal_message
+    from app.db.database import SessionLocal
+    from app.models.models import LinkMessage, Message
+
+    with SessionLocal() as db:
+        db.add_all([Message(receiver_id=owner_id, sealed=seal_message("elsewhere")),
+                    LinkMessage(link_id=link_id, sealed=seal_message("elsewhere"))])
+        db.commit()
+
+
+def _stored(owner_id: int, link_id: int) -> int:
+    from app.db.database import SessionLocal
+    from app.models.models import LinkMessage, Message
+
+    with SessionLocal() as db:
+        return (db.scalar(select(func.count()).where(Message.receiver_id == owner_id))
+                + db.scalar(select(func.count()).where(LinkMessage.link_id == link_id)))
+
+
+async def _ingest_batch_with_one_bad_row() -> None:
+    from app.core.security import seal_message
+    from app.db.database import AsyncSessionLocal
+    from app.db.ingest import MessageIngestor
+    from app.models.models import LinkMessage, Message
+
+    owner_id, (live, deleted) = await asyncio.to_thread(_owner_with_links, 2)
+    await asyncio.to_thread(_delete_link, deleted)
+
+    # Another writer commits just before each transaction of the ingestor, so it
+    # takes the ids a failed batch had already handed out to its rows
+    def racing_sessions():
+        _write_elsewhere(owner_id, live)
+        return AsyncSessionLocal()
+
+    # One flush window holds every row, so they reach _commit as a single batch;
+    # mixed tables and columns make it several INSERTs, the bad row's last
+    ingestor = MessageIngestor(racing_sessions, batch_size=10, flush_interval=5.0, queue_depth=10)
+    await ingestor.start()
+    try:
+        rows = [
+            LinkMessage(link_id=live, sealed=seal_message("to the link")),
+            Message(receiver_id=owner_id, sealed=seal_message("to the user")),
+            LinkMessage(link_id=live, content="legacy"),
+            LinkMessage(link_id=deleted, sealed=seal_message("to a deleted link")),
+        ]
+        results = await asyncio.wait_for(
+            asyncio.gather(*(ingestor.submit(row) for row in rows), return_exceptions=True), 10
+        )
+    finally:
+        await ingestor.stop()
+
+    assert isinstance(results[3], IntegrityError), results[3]
+    stored = results[:3]
+    assert not [row for row in stored if isinstance(row, Exception)], stored
+    assert all(row.id is not None and row.created_at is not None for row in stored)
+    # The batch, then each of its four rows: five transactions, two rows from elsewhere before each
+    assert await asyncio.to_thread(_stored, owner_id, live) == len(stored) + 5 * 2
+    assert all(isinstance(row, Message) or row.link_id == live for row in stored)
+
+
+def test_bad_row_does_not_sink_its_batch(database):
+    asyncio.run(_ingest_batch_with_one_bad_row())
@@ -0,0 +1,16 @@
+from app.db.jobs import JobRunnerLock
+
+
+def test_one_runner_per_lock_file(tmp_path):
+    path = str(tmp_path / "db-jobs.lock")
+    first, second = JobRunnerLock(path, enabled=True), JobRunnerLock(path, enabled=True)
+    assert first.acquire()
+    assert not second.acquire()
+    # Whoever starts after the runner is gone takes over
+    first.release()
+    assert second.acquire()
+    second.release()
+
+
+def test_disabled_process_never_runs_jobs(tmp_path):
+    assert not JobRunnerLock(str(tmp_path / "db-jobs.lock"), enabled=False).acquire()
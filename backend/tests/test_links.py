@@ -0,0 +1,32 @@
+import asyncio
+
+import httpx
+
+
+async def _signup(client: httpx.AsyncClient, username: str) -> dict:
+    response = await client.post("/api/auth/signup", json={
+        "username": username, "secret_phrase": "phrase", "secret_answer": "answer",
+    })
+    assert response.status_code == 201, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def _revalidate_as_someone_else(app) -> int:
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            owner = await _signup(client, "link_owner")
+            other = await _signup(client, "link_other")
+            link = (await client.post("/api/links/create", headers=owner,
+                                      json={"display_name": "x", "expiration_option": "7d"})).json()
+            url = f"/api/links/{link['private_id']}/messages"
+            first = await client.get(url, headers=owner)
+            assert first.status_code == 200, first.text
+            etag = first.headers["ETag"]
+            assert (await client.get(url, headers={**owner, "If-None-Match": etag})).status_code == 304
+            return (await client.get(url, headers={**other, "If-None-Match": etag})).status_code
+
+
+def test_private_link_checks_access_before_not_modified(database):
+    from app.main import app
+
+    assert asyncio.run(_revalidate_as_someone_else(app)) == 403
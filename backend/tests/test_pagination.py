@@ -0,0 +1,121 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import httpx
+
+from app.core.pagination import NEXT_CURSOR_HEADER
+
+MESSAGES = 47
+FOLLOWERS = 23
+LINKS = 12
+PAGE = 5
+
+
+def _seed(owner_id: int) -> str:
+    """Messages, followers and links for `owner_id`, many sharing a created_at; returns a link's private_id"""
+    from app.core.security import seal_message
+    from app.db.database import SessionLocal
+    from app.models.models import Follow, Link, LinkMessage, Message, MessageStatus, User
+
+    started = datetime.utcnow() - timedelta(days=1)
+    sections = list(MessageStatus)
+    with SessionLocal() as db:
+        # Three rows per timestamp, so pages also split between rows that differ only by id
+        db.add_all(
+            Message(receiver_id=owner_id, status=sections[i % len(sections)], sealed=seal_message(f"message {i}"),
+                    created_at=started + timedelta(seconds=i // 3))
+            for i in range(MESSAGES)
+        )
+        links = [Link(public_id=str(uuid.uuid4()), private_id=str(uuid.uuid4()), user_id=owner_id,
+                      created_at=started + timedelta(seconds=i // 3)) for i in range(LINKS)]
+        followers = [User(username=f"page_follower{i}", secret_phrase="phrase", secret_answer="x", language="EN")
+                     for i in range(FOLLOWERS)]
+        db.add_all(links + followers)
+        db.flush()
+        db.add_all(
+            LinkMessage(link_id=links[0].id, sealed=seal_message(f"link message {i}"),
+                        created_at=started + timedelta(seconds=i // 3))
+            for i in range(MESSAGES)
+        )
+        db.add_all(
+            Follow(follower_id=user.id, following_id=owner_id, created_at=started + timedelta(seconds=i // 3))
+            for i, user in enumerate(followers)
+        )
+        db.commit()
+        return links[0].private_id
+
+
+async def _walk(client: httpx.AsyncClient, url: str, headers: dict, items=lambda body: body) -> list:
+    """Every item of a paged list, following X-Next-Cursor to the end"""
+    all_items, after, pages = [], None, 0
+    while True:
+        params = {"limit": PAGE, **({"after": after} if after else {})}
+        response = await client.get(url, params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = items(response.json())
+        assert len(page) <= PAGE
+        all_items.extend(page)
+        pages += 1
+        after = response.headers.get(NEXT_CURSOR_HEADER)
+        if after is None:
+            assert pages == max(1, -(-len(all_items) // PAGE))
+            return all_items
+
+
+async def _walk_inbox(client: httpx.AsyncClient, headers: dict) -> dict:
+    """The inbox's first pages, then each section continued from its cursor on /messages/?status="""
+    response = await client.get("/api/messages/inbox", params={"limit": PAGE}, headers=headers)
+    assert response.status_code == 200, response.text
+    sections = response.json()
+    for pair in filter(None, (response.headers.get(NEXT_CURSOR_HEADER) or "").split(",")):
+        section, cursor = pair.split("=", 1)
+        rest, after = [], cursor
+        while after:
+            page = await client.get("/api/messages/", params={"status": section, "limit": PAGE, "after": after},
+                                    headers=headers)
+            rest.extend(page.json())
+            after = page.headers.get(NEXT_CURSOR_HEADER)
+        sections[section] += rest
+    return sections
+
+
+def _newest_first(items: list) -> bool:
+    keys = [(item["created_at"], item["id"]) for item in items]
+    return keys == sorted(keys, reverse=True) and len(set(keys)) == len(keys)
+
+
+async def _walk_everything(app) -> None:
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            signup = await client.post("/api/auth/signup", json={
+                "username": "page_owner", "secret_phrase": "phrase", "secret_answer": "answer",
+            })
+            assert signup.status_code == 201, signup.text
+            headers = {"Authorization": f"Bearer {signup.json()['access_token']}"}
+            me = (await client.get("/api/auth/me", headers=headers)).json()
+            private_id = await asyncio.to_thread(_seed, me["id"])
+
+            messages = await _walk(client, "/api/messages/", headers)
+            assert len(messages) == MESSAGES and _newest_first(messages)
+
+            inbox = await _walk_inbox(client, headers)
+            assert sorted(m["id"] for section in inbox.values() for m in section) == sorted(m["id"] for m in messages)
+            for section, items in inbox.items():
+                assert _newest_first(items) and {m["status"] for m in items} <= {section}
+
+            link_messages = await _walk(client, f"/api/links/{private_id}/messages", headers,
+                                        items=lambda body: body["messages"])
+            assert len(link_messages) == MESSAGES and _newest_first(link_messages)
+
+            followers = await _walk(client, "/api/users/followers", headers)
+            assert len({user["id"] for user in followers}) == FOLLOWERS
+
+            links = await _walk(client, "/api/links/my-links", headers)
+            assert len({link["private_id"] for link in links}) == LINKS
+
+
+def test_every_list_pages_to_the_end(database):
+    from app.main import app
+
+    asyncio.run(_walk_everything(app))
@@ -0,0 +1,11 @@
+from app.db.migrate import check_query_plans, hot_queries
+
+
+def test_hot_queries_use_an_index(database):
+    problems = check_query_plans(database)
+    assert problems == [], "\n".join(problems)
+
+
+def test_plan_check_covers_hot_queries():
+    # An empty query list would make the check above pass vacuously
+    assert len(hot_queries()) >= 10
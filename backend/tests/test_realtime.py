@@ -0,0 +1,67 @@
+import asyncio
+
+import httpx
+
+from app.core.realtime import push_hub
+
+
+class _ClientGone(Exception):
+    pass
+
+
+def _stream_scope(token: str) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/messages/stream", "raw_path": b"/api/messages/stream", "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"test"), (b"authorization", f"Bearer {token}".encode())],
+        "client": ("127.0.0.1", 1234), "server": ("test", 80),
+    }
+
+
+async def _receive() -> dict:
+    await asyncio.sleep(3600)
+    return {"type": "http.disconnect"}
+
+
+async def _failing_send(message: dict) -> None:
+    raise _ClientGone()
+
+
+async def _open_streams_that_never_start(app) -> dict:
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            signup = await client.post("/api/auth/signup", json={
+                "username": "stream_user", "secret_phrase": "phrase", "secret_answer": "answer",
+            })
+            token = signup.json()["access_token"]
+
+        # More attempts than the per-channel cap: a leaked slot would turn the last ones into 503s
+        for _ in range(push_hub.max_per_channel + 2):
+            try:
+                await app(_stream_scope(token), _receive, _failing_send)
+            except _ClientGone:
+                pass
+            else:
+                raise AssertionError("the response start should have failed")
+
+        # Cancelled before its response starts
+        sent = asyncio.Event()
+
+        async def send(message: dict) -> None:
+            sent.set()
+            await asyncio.sleep(3600)
+
+        request = asyncio.create_task(app(_stream_scope(token), _receive, send))
+        await sent.wait()
+        request.cancel()
+        await asyncio.gather(request, return_exceptions=True)
+        return push_hub.metrics()
+
+
+def test_stream_slots_are_released_when_the_response_never_starts(database):
+    from app.main import app
+
+    metrics = asyncio.run(_open_streams_that_never_start(app))
+    assert metrics["connections"] == 0
+    assert metrics["channels"] == 0
+    assert metrics["rejected"] == 0
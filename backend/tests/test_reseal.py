@@ -0,0 +1,153 @@
+import os
+
+import pytest
+from cryptography.fernet import Fernet
+from sqlalchemy import create_engine, insert, select
+
+from app.core import security
+from app.core.keyring import Keyring, MessageKey
+from app.db import reseal
+from app.db.database import Base
+from app.db.migrate import run_migrations
+from app.models.models import LinkMessage, Message, ResealCheckpoint, User
+
+ROWS = 23
+CHUNK = 5
+
+
+def _key(key_id: int) -> MessageKey:
+    return MessageKey.from_fernet_key(key_id, Fernet.generate_key().decode())
+
+
+def _use(monkeypatch, *keys: MessageKey) -> None:
+    keyring = Keyring(keys)
+    monkeypatch.setattr(security, "keyring", keyring)
+    monkeypatch.setattr(reseal, "keyring", keyring)
+
+
+@pytest.fixture
+def bind(tmp_path):
+    """A migrated database of its own: a reseal pass walks whole tables"""
+    engine = create_engine(f"sqlite:///{tmp_path}/reseal.db")
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User).values(id=1, username="reseal", secret_phrase="p", secret_answer="a"))
+    yield engine
+    engine.dispose()
+
+
+def _bodies(bind) -> dict:
+    with bind.connect() as conn:
+        rows = conn.execute(select(Message.id, reseal.ciphertext(Message)).order_by(Message.id)).all()
+    return {row_id: body for row_id, body in rows}
+
+
+def _seed(bind, old: MessageKey) -> dict:
+    """ROWS messages under `old`: legacy tokens and sealed bodies; returns id -> text"""
+    with bind.begin() as conn:
+        for i in range(ROWS):
+            text = f"message {i}"
+            body = {"content": old.fernet.encrypt(text.encode()).decode()} if i % 2 else {
+                "content": "", "sealed": security.seal_message(text)
+            }
+            conn.execute(insert(Message).values(receiver_id=1, **body))
+    return {row_id: f"message {i}" for i, row_id in enumerate(_bodies(bind))}
+
+
+def _reseal(bind, **kwargs) -> tuple:
+    return reseal.reseal_table(Message, bind, chunk_size=CHUNK, pause=0, write_share=1.0, workers=2, **kwargs)
+
+
+def test_interrupted_reseal_resumes_from_its_checkpoint(bind, monkeypatch):
+    old, new = _key(1), _key(2)
+    _use(monkeypatch, old)
+    texts = _seed(bind, old)
+    ids = list(texts)
+    _use(monkeypatch, new, old)
+    assert reseal.pending_rows(bind)["messages"] == ROWS
+
+    # The pass dies while re-encrypting its second chunk
+    reencrypt, calls = reseal._reencrypt, []
+
+    def failing(ciphertexts):
+        calls.append(len(ciphertexts))
+        if sum(calls) > CHUNK:
+            raise RuntimeError("worker died")
+        return reencrypt(ciphertexts)
+
+    monkeypatch.setattr(reseal, "_reencrypt", failing)
+    with pytest.raises(RuntimeError):
+        _reseal(bind)
+    assert reseal._checkpoint(bind, Message) == ids[CHUNK - 1]
+    assert reseal.pending_rows(bind)["messages"] == ROWS - CHUNK
+
+    # The next pass starts after the checkpoint and finishes the table
+    monkeypatch.setattr(reseal, "_reencrypt", reencrypt)
+    checkpoint, resumed_from = reseal._checkpoint, []
+
+    def recorded(*args):
+        resumed_from.append(checkpoint(*args))
+        return resumed_from[-1]
+
+    monkeypatch.setattr(reseal, "_checkpoint", recorded)
+    assert _reseal(bind) == (ROWS - CHUNK, 0)
+    assert resumed_from == [ids[CHUNK - 1]]
+    assert reseal.pending_rows(bind)["messages"] == 0
+
+    # Everything reads back under the new key alone
+    _use(monkeypatch, new)
+    bodies = _bodies(bind)
+    assert all(body[:2] == security.sealed_header(new) for body in bodies.values())
+    assert security.decrypt_messages(list(bodies.values())) == list(texts.values())
+
+
+def test_unreadable_rows_are_left_and_counted(bind, monkeypatch):
+    old, foreign = _key(1), _key(9)
+    _use(monkeypatch, old)
+    _seed(bind, old)
+    with bind.begin() as conn:
+        conn.execute(insert(Message).values(receiver_id=1, content=foreign.fernet.encrypt(b"lost").decode()))
+    _use(monkeypatch, _key(2), old)
+
+    assert _reseal(bind) == (ROWS, 1)
+    assert reseal.pending_rows(bind)["messages"] == 1
+
+
+def test_finished_table_is_not_scanned_again(bind, monkeypatch):
+    old = _key(1)
+    _use(monkeypatch, old)
+    _seed(bind, old)
+    _use(monkeypatch, _key(2), old)
+    _reseal(bind)
+    with bind.connect() as conn:
+        newest = conn.execute(select(ResealCheckpoint.last_id).where(
+            ResealCheckpoint.table_name == Message.__tablename__
+        )).scalar()
+    assert newest == max(_bodies(bind))
+    assert _reseal(bind) == (0, 0)
+    assert reseal.run_reseal(bind).link_messages_resealed == 0
+    assert reseal.pending_rows(bind) == {"messages": 0, LinkMessage.__tablename__: 0}
+
+
+def test_checkpoint_from_an_older_format_is_walked_again(bind, monkeypatch):
+    key = _key(1)
+    _use(monkeypatch, key)
+    with bind.begin() as conn:
+        for i in range(ROWS):
+            header = b"\x02" + bytes([key.key_id])
+            nonce = os.urandom(12)
+            body = header + nonce + key.aead.encrypt(nonce, f"message {i}".encode(), header)
+            conn.execute(insert(Message).values(receiver_id=1, content="", sealed=body))
+    # A v2 pass under the same key finished the table before v3 existed
+    with bind.begin() as conn:
+        conn.execute(insert(ResealCheckpoint).values(
+            table_name=Message.__tablename__, key_id=key.key_id, sealed_version=2, last_id=max(_bodies(bind)),
+        ))
+
+    assert reseal._checkpoint(bind, Message) == 0
+    assert reseal.pending_rows(bind)["messages"] == ROWS
+    assert _reseal(bind) == (ROWS, 0)
+    bodies = list(_bodies(bind).values())
+    assert {security.storage_format(body) for body in bodies} == {"v3"}
+    assert security.decrypt_messages(bodies) == [f"message {i}" for i in range(ROWS)]
@@ -0,0 +1,166 @@
+import os
+import subprocess
+import sys
+import zlib
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.core import security
+from app.core.config import Settings
+from app.core.keyring import Keyring, MessageKey, MissingEncryptionKey, load_keyring, parse_keys
+from app.core.security import UNAVAILABLE_CONTENT, decrypt_messages, seal_message, storage_format
+
+TEXT = "Hello, مرحبا, ¡hola! 👋"
+
+
+def _key(key_id: int = 0) -> MessageKey:
+    return MessageKey.from_fernet_key(key_id, Fernet.generate_key().decode())
+
+
+@pytest.fixture
+def key(monkeypatch) -> MessageKey:
+    """A fresh one-key keyring for app.core.security"""
+    key = _key()
+    monkeypatch.setattr(security, "keyring", Keyring([key]))
+    return key
+
+
+def _sealed_v1(key: MessageKey, text: str) -> bytes:
+    nonce = os.urandom(12)
+    return b"\x01" + nonce + key.aead.encrypt(nonce, text.encode(), b"\x01")
+
+
+def _sealed_v2(key: MessageKey, text: str) -> bytes:
+    header = b"\x02" + bytes([key.key_id])
+    nonce = os.urandom(12)
+    return header + nonce + key.aead.encrypt(nonce, text.encode(), header)
+
+
+def _flip(body: bytes, index: int, value: int) -> bytes:
+    return body[:index] + bytes([value]) + body[index + 1:]
+
+
+def test_every_format_round_trips(key):
+    bodies = {
+        "fernet": key.fernet.encrypt(TEXT.encode()),
+        "v1": _sealed_v1(key, TEXT),
+        "v2": _sealed_v2(key, TEXT),
+        "v3": seal_message(TEXT),
+    }
+    assert {name: storage_format(body) for name, body in bodies.items()} == {name: name for name in bodies}
+    assert decrypt_messages(list(bodies.values())) == [TEXT] * len(bodies)
+    # Legacy tokens are stored as text as well as bytes
+    assert decrypt_messages([bodies["fernet"].decode()]) == [TEXT]
+
+
+def test_sealed_v3_layout(key):
+    body = seal_message(TEXT)
+    # version | key id | codec | nonce (12) | ciphertext | tag (16)
+    assert body[:3] == bytes([3, key.key_id, 0])
+    assert len(body) == 3 + 12 + len(TEXT.encode()) + 16
+
+
+@pytest.mark.parametrize("index, value", [
+    (0, 0x02),  # version: read as v2, under a different header
+    (1, 7),  # key id of a key the keyring does not have
+    (2, 1),  # codec: claims deflate
+    (20, None),  # ciphertext
+])
+def test_tampering_fails_authentication(key, index, value):
+    body = seal_message(TEXT)
+    tampered = _flip(body, index, body[index] ^ 0xFF if value is None else value)
+    assert decrypt_messages([tampered]) == [UNAVAILABLE_CONTENT]
+
+
+def test_tampered_key_id_fails_even_when_that_key_exists(monkeypatch):
+    first, second = _key(0), _key(1)
+    monkeypatch.setattr(security, "keyring", Keyring([first, second]))
+    body = seal_message(TEXT)
+    assert decrypt_messages([_flip(body, 1, second.key_id)]) == [UNAVAILABLE_CONTENT]
+
+
+def test_truncated_and_garbage_bodies_are_unavailable(key):
+    body = seal_message(TEXT)
+    broken = [body[:2], body[:20], body[:-1], b"\x03", b"gAAAA-not-a-token"]
+    assert decrypt_messages(broken) == [UNAVAILABLE_CONTENT] * len(broken)
+
+
+def test_retired_keys_still_decrypt(monkeypatch):
+    retired, active = _key(1), _key(2)
+    monkeypatch.setattr(security, "keyring", Keyring([retired]))
+    old = [retired.fernet.encrypt(TEXT.encode()), _sealed_v1(retired, TEXT), _sealed_v2(retired, TEXT),
+           seal_message(TEXT)]
+
+    monkeypatch.setattr(security, "keyring", Keyring([active, retired]))
+    assert seal_message(TEXT)[1] == active.key_id
+    assert decrypt_messages(old) == [TEXT] * len(old)
+
+    # Once the retired key is removed, its bodies are unavailable rather than an error
+    monkeypatch.setattr(security, "keyring", Keyring([active]))
+    assert decrypt_messages(old) == [UNAVAILABLE_CONTENT] * len(old)
+
+
+def test_keyring_configuration_errors():
+    key = Fernet.generate_key().decode()
+    assert [k.key_id for k in parse_keys(f"2:{key}, 1:{Fernet.generate_key().decode()}")] == [2, 1]
+    with pytest.raises(ValueError, match="listed twice"):
+        Keyring([_key(1), _key(1)])
+    with pytest.raises(ValueError, match="outside"):
+        MessageKey.from_fernet_key(256, key)
+    with pytest.raises(ValueError, match="<id>:<key>"):
+        parse_keys(key)
+
+
+def test_no_key_outside_debug_refuses_to_start():
+    with pytest.raises(MissingEncryptionKey):
+        load_keyring(Settings(encryption_key="", encryption_keys="", debug=False))
+    assert len(load_keyring(Settings(encryption_key="", encryption_keys="", debug=True)).keys) == 1
+
+    # The app itself, as uvicorn would import it
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "ENCRYPTION_KEY": "", "ENCRYPTION_KEYS": "", "DEBUG": "false"}
+    started = subprocess.run([sys.executable, "-c", "import app.main"], cwd=backend, env=env,
+                             capture_output=True, text=True)
+    assert started.returncode != 0
+    assert "MissingEncryptionKey" in started.stderr
+
+
+def _sealed_v3(key: MessageKey, codec: int, payload: bytes) -> bytes:
+    """A v3 body around any payload, authenticated like a real one"""
+    header = bytes([3, key.key_id, codec])
+    nonce = os.urandom(12)
+    return header + nonce + key.aead.encrypt(nonce, payload, header)
+
+
+def _deflate(data: bytes) -> bytes:
+    deflater = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return deflater.compress(data) + deflater.flush()
+
+
+def test_long_bodies_are_deflated_and_round_trip(key):
+    text = "رسالة طويلة جدا " * 200
+    body = seal_message(text)
+    assert storage_format(body) == "v3+deflate"
+    assert len(body) < len(text.encode()) // 4
+    assert decrypt_messages([body]) == [text]
+    # Short bodies stay plain UTF-8
+    assert storage_format(seal_message("short")) == "v3"
+
+
+@pytest.mark.parametrize("size, readable", [(20000, True), (20001, False), (10 * 1024 * 1024, False)])
+def test_inflated_size_is_bounded(key, size, readable):
+    body = _sealed_v3(key, 1, _deflate(b"a" * size))
+    assert decrypt_messages([body]) == ["a" * size if readable else UNAVAILABLE_CONTENT]
+
+
+def test_broken_deflate_streams_are_unavailable(key):
+    stream = _deflate(("message " * 500).encode())
+    broken = [
+        _sealed_v3(key, 1, stream[:len(stream) // 2]),  # truncated
+        _sealed_v3(key, 1, b"\xff" * 64),  # not deflate
+        _sealed_v3(key, 1, stream + b"trailing"),  # more input after the end of the stream
+        _sealed_v3(key, 7, b"hello"),  # unknown codec
+        _sealed_v3(key, 1, _deflate(b"\xff\xfe")),  # inflates to invalid UTF-8
+    ]
+    assert decrypt_messages(broken) == [UNAVAILABLE_CONTENT] * len(broken)
@@ -0,0 +1,26 @@
+from sqlalchemy import text
+
+
+def _versions_and_changes(conn, user_id: int) -> tuple:
+    return (
+        conn.execute(text("SELECT messages_version FROM users WHERE id = :id"), {"id": user_id}).scalar(),
+        conn.execute(text("SELECT count(*) FROM changes WHERE owner_id = :id"), {"id": user_id}).scalar(),
+    )
+
+
+def test_status_triggers_ignore_unchanged_status(database):
+    with database.begin() as conn:
+        user_id = conn.execute(text(
+            "INSERT INTO users (username, secret_phrase, secret_answer, language) "
+            "VALUES ('trigger_user', 'phrase', 'answer', 'EN') RETURNING id"
+        )).scalar()
+        message_id = conn.execute(text(
+            "INSERT INTO messages (receiver_id, content, status) VALUES (:id, 'x', 'inbox') RETURNING id"
+        ), {"id": user_id}).scalar()
+        before = _versions_and_changes(conn, user_id)
+
+        conn.execute(text("UPDATE messages SET status = 'inbox' WHERE id = :id"), {"id": message_id})
+        assert _versions_and_changes(conn, user_id) == before
+
+        conn.execute(text("UPDATE messages SET status = 'public' WHERE id = :id"), {"id": message_id})
+        assert _versions_and_changes(conn, user_id) == (before[0] + 1, before[1] + 1)
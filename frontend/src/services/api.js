@@ -34,8 +34,8 @@ export const clearAuthToken = () => {
   localStorage.removeItem('authToken');
 };
 
-// Helper function to make API requests
-const apiRequest = async (endpoint, options = {}) => {
+// Helper function to send an API request; returns the response, throws on errors
+const sendRequest = async (endpoint, options = {}) => {
   const token = getAuthToken();
   const headers = {
     'Content-Type': 'application/json',
@@ -65,6 +65,13 @@ const apiRequest = async (endpoint, options = {}) => {
     throw new Error(error.detail || `HTTP ${response.status}`);
   }
 
+  return response;
+};
+
+// Helper function to make API requests
+const apiRequest = async (endpoint, options = {}) => {
+  const response = await sendRequest(endpoint, options);
+
   // Handle 204 No Content
   if (response.status === 204) {
     return null;
@@ -73,6 +80,47 @@ const apiRequest = async (endpoint, options = {}) => {
   return response.json();
 };
 
+// ============ Pagination ============
+
+// List endpoints return one page at a time, newest first. The cursor of the
+// next page comes in this header, which is absent on the last page.
+const NEXT_CURSOR_HEADER = 'X-Next-Cursor';
+const PAGE_SIZE = 200; // the backend's largest page
+
+// Fetch one page: { body, nextCursor }
+const requestPage = async (endpoint, options = {}, after = null) => {
+  const params = new URLSearchParams({ limit: PAGE_SIZE });
+  if (after) {
+    params.set('after', after);
+  }
+  const separator = endpoint.includes('?') ? '&' : '?';
+  const response = await sendRequest(`${endpoint}${separator}${params}`, options);
+  return { body: await response.json(), nextCursor: response.headers.get(NEXT_CURSOR_HEADER) };
+};
+
+// Fetch every item of a list, following the cursor from `after` (or the first page) to the end
+const fetchAllPages = async (endpoint, options = {}, after = null, items = (body) => body) => {
+  const all = [];
+  let cursor = after;
+  do {
+    const { body, nextCursor } = await requestPage(endpoint, options, cursor);
+    all.push(...items(body));
+    cursor = nextCursor;
+  } while (cursor);
+  return all;
+};
+
+// Endpoints that page several lists at once send "name=cursor" pairs for the lists with more
+const parseSectionCursors = (header) => {
+  if (!header) {
+    return [];
+  }
+  return header.split(',').map((pair) => {
+    const separator = pair.indexOf('=');
+    return [pair.slice(0, separator).trim(), pair.slice(separator + 1).trim()];
+  });
+};
+
 // ============ Auth API ============
 
 export const authAPI = {
@@ -145,12 +193,18 @@ export const authAPI = {
 
 export const messagesAPI = {
   getMessages: async () => {
-    return apiRequest('/api/messages/');
+    return fetchAllPages('/api/messages/');
   },
 
   getInbox: async () => {
-    // Fetch all messages grouped by status: inbox, public, favorite
-    return apiRequest('/api/messages/inbox');
+    // Fetch all messages grouped by status: inbox, public, favorite.
+    // The first page of each section comes in one request; a section with
+    // more continues from its cursor on the section's own list.
+    const { body, nextCursor } = await requestPage('/api/messages/inbox');
+    for (const [section, cursor] of parseSectionCursors(nextCursor)) {
+      body[section].push(...await fetchAllPages(`/api/messages/?status=${section}`, {}, cursor));
+    }
+    return body;
   },
 
   sendMessage: async (receiverUsername, content) => {
@@ -219,7 +273,7 @@ export const linksAPI = {
 
   // Get user's created links (requires auth)
   getUserLinks: async () => {
-    return apiRequest('/api/links/my-links');
+    return fetchAllPages('/api/links/my-links');
   },
 
   // Get public info about a link
@@ -240,9 +294,13 @@ export const linksAPI = {
 
   // Get messages from a private link
   getLinkMessages: async (privateId) => {
-    return apiRequest(`/api/links/${privateId}/messages`, {
-      skipAuth: true, // Private ID acts as access token
-    });
+    const endpoint = `/api/links/${privateId}/messages`;
+    const options = { skipAuth: true }; // Private ID acts as access token
+    const { body, nextCursor } = await requestPage(endpoint, options);
+    if (nextCursor) {
+      body.messages.push(...await fetchAllPages(endpoint, options, nextCursor, (page) => page.messages));
+    }
+    return body;
   },
 
   // Make a link message public
@@ -316,15 +374,15 @@ export const userAPI = {
   },
 
   getMyFollowing: async () => {
-    return apiRequest('/api/users/me/following');
+    return fetchAllPages('/api/users/me/following');
   },
 
   getFollowing: async () => {
-    return apiRequest('/api/users/following');
+    return fetchAllPages('/api/users/following');
   },
 
   getFollowers: async () => {
-    return apiRequest('/api/users/followers');
+    return fetchAllPages('/api/users/followers');
   },
 
   sendAnonymousMessage: async (userId, content) => {